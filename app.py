@@ -1,22 +1,14 @@
 import tkinter as tk
 from tkinter import filedialog, ttk
 
-import time
 import os
-import urllib
 import threading
 import json
-from lib_cookies import PixivCookies
-from pixiv_scraper.pixiv_api_scraper import PixivScraper
-from zerochan_scraper.zerochan_api_scraper import ZeroChanScraper
+from lib_jobs import run_job
+from lib_metrics import METRICS
 
 HISTORY = 'user_histroy.json'
 
-def count_images_os(folder_path):
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
-    count = sum(1 for file in os.listdir(folder_path) if file.lower().endswith(image_extensions))
-    return count
-
 def run_scraper():
     print(f"[INFO] Starting scraper")
     print(f"Site: {site_var.get()}")
@@ -24,37 +16,25 @@ def run_scraper():
     print(f"Tag: {tag_entry.get()}")
     print(f"Images: {num_entry.get()}")
     print(f"Output directory: {output_dir.get()}")
-    
-    folder_name = f'{tag_entry.get()}_scraped'
-    output_folder = os.path.join(output_dir.get(),folder_name)
-    if site_var.get() == "Pixiv":
-        begin_time = time.time()
-        scraper = PixivScraper(
-            tag=tag_entry.get(),
-            max_images_posts=int(num_entry.get()),
-            page_idx=int(page_idx.get()),
-            output_folder=output_folder,
-            file_name = urllib.parse.unquote(tag_entry.get()),
-            browser = str.lower(browser_var.get()),
-            pixiv_cookies_manager = PixivCookies()
-        )
-        scraper.scrape()
-        end_time = time.time()
-        print(f"Scaper took {(end_time-begin_time):.2f} seconds with final result of {count_images_os(output_folder)} images.")
-    
-    if site_var.get() == "Zerochan":
-        begin_time = time.time()
-        scraper = ZeroChanScraper(
-            tag=tag_entry.get(),
-            max_images_posts=int(num_entry.get()),
-            page_idx=int(page_idx.get()),
-            output_folder=output_folder,
-            file_name = urllib.parse.unquote(tag_entry.get())
-        )
-        scraper.scrape()
-        end_time = time.time()
-        print(f"Scaper took {(end_time-begin_time):.2f} seconds with final result of {count_images_os(output_folder)} images.")
-    
+
+    # The GUI only collects the job, lib_jobs runs it the same way the CLI does
+    result = run_job({
+        'site': site_var.get(),
+        'tag': tag_entry.get(),
+        'count': int(num_entry.get()),
+        'page_idx': int(page_idx.get()),
+        'browser': browser_var.get() or 'chrome',
+        'output_dir': output_dir.get(),
+    })
+    print(f"Scaper took {result['seconds']:.2f} seconds with final result of {result['images_on_disk']} images.")
+    print(f"Job : {json.dumps(result, indent=2)}")
+    # Loaded with the job, requests and the site modules are not part of the window's startup
+    from lib_sessions import SESSIONS
+    from lib_http_cache import current_cache
+    print(f"Connection pools : {SESSIONS.stats()}")
+    cache = current_cache()
+    print(f"HTTP cache : {cache.stats if cache else 'off'}")
+    print(f"Metrics : {json.dumps(METRICS.summary(), indent=2)}")
     
 def start_thread():
     threading.Thread(target=run_scraper, daemon=True).start()
@@ -64,7 +44,8 @@ def browse_dir():
     output_dir.set(folder_selected)
 
 def update_browser_visibility(*args):
-    if site_var.get() == "Zerochan":
+    # Only the Pixiv login opens a browser of the user's choice
+    if site_var.get() != "Pixiv":
         browser_label.pack_forget()
         browser_combobox.pack_forget()
     else:
@@ -0,0 +1,53 @@
+import os
+import time
+import argparse
+import tempfile
+import concurrent.futures as THREAD
+from tqdm import tqdm
+
+from benchmarks.fake_cdn import FakeCDN
+from lib_async_download import AsyncDownloader
+from zerochan_scraper.zerochan_api_scraper import ZeroChanScraper, MAX_WORKERS_DOWNLOAD_IMAGES
+
+# Run from the repo root : python -m benchmarks.bench_download_backends --images 500
+
+def make_scraper(output_folder: str, images: int):
+    scraper = ZeroChanScraper(tag="bench", max_images_posts=images, page_idx=1, output_folder=output_folder, file_name="bench")
+    scraper.session = scraper._make_session()
+    scraper.progress_bar = tqdm(total=images, disable=True)
+    return scraper
+
+def bench_threads(urls: list[str], output_folder: str):
+    scraper = make_scraper(output_folder, len(urls))
+    begin_time = time.time()
+    # Same shape as the old per-page multi_threading_download_images
+    with THREAD.ThreadPoolExecutor(max_workers=MAX_WORKERS_DOWNLOAD_IMAGES) as executor:
+        list(executor.map(lambda args: scraper.download_image(scraper.session, *args), zip(range(len(urls)), urls, range(len(urls)))))
+    return time.time() - begin_time
+
+def bench_async(urls: list[str], output_folder: str):
+    scraper = make_scraper(output_folder, len(urls))
+    begin_time = time.time()
+    downloader = AsyncDownloader(scraper.session, scraper._image_path, scraper._image_headers, scraper._image_saved)
+    for idx, url in enumerate(urls):
+        downloader.download_image(idx, url, idx)
+    downloader.close()
+    return time.time() - begin_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the thread pool and asyncio download backends against a local fake CDN")
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--size", type=int, default=256 * 1024, help="bytes per image")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    args = parser.parse_args()
+
+    cdn = FakeCDN(image_size=args.size, latency=args.latency).start()
+    urls = cdn.image_urls(args.images)
+    try:
+        for name, bench in [("threads", bench_threads), ("async", bench_async)]:
+            with tempfile.TemporaryDirectory() as output_folder:
+                elapsed = bench(urls, output_folder)
+                saved = len(os.listdir(output_folder))
+            print(f"{name:8s}: {saved} images in {elapsed:.2f}s -> {saved / elapsed:.1f} images/sec")
+    finally:
+        cdn.stop()
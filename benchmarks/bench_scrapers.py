@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import concurrent.futures as THREAD
+from datetime import datetime
+
+from benchmarks.fake_site import FakeSite, POSTS
+
+# Run from the repo root : python -m benchmarks.bench_scrapers --images 300
+# Every run is saved to benchmarks/results/<commit>_<time>.json and compared with the latest run of another commit.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SITES = ('zerochan', 'pixiv', 'danbooru')
+COMPARED = (('images_per_second', True), ('download_p50', False), ('download_p99', False), ('peak_rss_mb', False), ('http_requests', False))
+
+def _make_scraper(site: str,base_url: str,images: int,output_folder: str,backend: str):
+    common = dict(tag="bench", max_images_posts=images, page_idx=1, output_folder=output_folder, file_name="bench", download_backend=backend)
+    if site == 'zerochan':
+        from zerochan_scraper.zerochan_api_scraper import ZeroChanScraper
+        scraper = ZeroChanScraper(**common)
+        scraper.base_url = base_url
+    elif site == 'pixiv':
+        from lib_cookies import PixivCookies
+        from pixiv_scraper.pixiv_api_scraper import PixivScraper
+        # A cookies file in the run's folder skips the browser login
+        with open("pixiv_cookies.json", "w") as file:
+            json.dump([{'name': "PHPSESSID", 'value': "bench", 'domain': ".pixiv.net"}], file)
+        scraper = PixivScraper(browser='chrome', pixiv_cookies_manager=PixivCookies(), **common)
+        scraper.base_url = f"{base_url}/en"
+        scraper.ajax_url = f"{base_url}/ajax"
+    else:
+        from danbooru_scraper.danbooru_api_scraper import DanbooruScraper
+        scraper = DanbooruScraper(stopped_at_download_idx=0, **common)
+        scraper.base_url = base_url
+    return scraper
+
+def run_site(site: str,base_url: str,images: int,backend: str,workdir: str,rate: float = None):
+    """Scrapes one site end to end in a fresh process, so sessions, limiters and peak RSS are its own."""
+    import resource
+    sys.path.insert(0, REPO_ROOT)
+    # The http cache, pages cache, tag state and cookies of the run all land in its temp folder
+    os.chdir(workdir)
+    from urllib.parse import urlsplit
+    from lib_rate_limit import LIMITERS
+    from lib_http_cache import use_cache, DEFAULT_CACHE_NAME
+    use_cache(os.path.join(workdir, DEFAULT_CACHE_NAME))
+    from lib_metrics import STAGE_SECONDS, HTTP_REQUESTS
+    if rate:
+        limiter = LIMITERS.get(urlsplit(base_url).hostname)
+        limiter.rate = rate
+        limiter.concurrency = max(limiter.concurrency, rate)
+    scraper = _make_scraper(site, base_url, images, os.path.join(workdir, "images"), backend)
+    begin_time = time.perf_counter()
+    scraper.scrape()
+    elapsed = time.perf_counter() - begin_time
+    download = STAGE_SECONDS.summary().get('{stage="download_image"}', {})
+    downloaded = (scraper.stats or {}).get('downloaded', 0)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'site': site,
+        'images': downloaded,
+        'seconds': round(elapsed, 3),
+        'images_per_second': round(downloaded / elapsed, 2) if elapsed else None,
+        'download_p50': download.get('p50'),
+        'download_p99': download.get('p99'),
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        'peak_rss_mb': round(peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'http_requests': int(sum(HTTP_REQUESTS.samples().values())),
+        'http_statuses': {label: int(count) for label, count in HTTP_REQUESTS.summary().items()},
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(results: list[dict],params: dict):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = git_commit()
+    path = os.path.join(RESULTS_DIR, f"{commit}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as file:
+        json.dump({'commit': commit, 'date': datetime.now().isoformat(timespec='seconds'), 'params': params, 'results': results}, file, indent=2)
+    return path
+
+def load_results(path: str):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def previous_results(current_path: str):
+    """The latest saved run of another commit, the baseline a new run is compared with."""
+    current = load_results(current_path)
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), key=os.path.getmtime, reverse=True):
+        if path != current_path and load_results(path)['commit'] != current['commit']:
+            return path
+    return None
+
+def compare(baseline_path: str,current_path: str):
+    baseline, current = load_results(baseline_path), load_results(current_path)
+    print(f"\n{baseline['commit']} ({baseline['date']}) -> {current['commit']} ({current['date']})")
+    baseline_sites = {result['site']: result for result in baseline['results']}
+    for result in current['results']:
+        before = baseline_sites.get(result['site'])
+        if not before:
+            continue
+        cells = []
+        for metric, higher_is_better in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                cells.append(f"{metric} n/a")
+                continue
+            change = (new - old) / old * 100
+            worse = change < 0 if higher_is_better else change > 0
+            cells.append(f"{metric} {old} -> {new} ({change:+.1f}%{' !' if worse and abs(change) > 10 else ''})")
+        print(f"{result['site']:<10}" + " | ".join(cells))
+
+def print_results(results: list[dict]):
+    print(f"\n{'site':<10}{'images':>8}{'img/s':>10}{'p50 s':>9}{'p99 s':>9}{'RSS MB':>9}{'requests':>10}")
+    for result in results:
+        print(f"{result['site']:<10}{result['images']:>8}{result['images_per_second'] or 0:>10.1f}{result['download_p50'] or 0:>9.3f}{result['download_p99'] or 0:>9.3f}{result['peak_rss_mb']:>9.1f}{result['http_requests']:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the scrapers end to end against a local fake site")
+    parser.add_argument("--sites", nargs="+", choices=SITES, default=list(SITES))
+    parser.add_argument("--images", type=int, default=300, help="images to scrape per site")
+    parser.add_argument("--posts", type=int, default=POSTS, help="posts the fake tag holds")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="bytes per image")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses turned into 500s")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of responses turned into 429s with Retry-After")
+    parser.add_argument("--backend", choices=['threads', 'async'], default='threads')
+    parser.add_argument("--rate", type=float, help="start the host limiter at this rate instead of ramping up from the default")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="only compare two saved result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    site = FakeSite(posts=args.posts, image_size=args.size, latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate).start()
+    results = []
+    try:
+        for name in args.sites:
+            with tempfile.TemporaryDirectory() as workdir:
+                with THREAD.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    result = executor.submit(run_site, name, site.base_url, args.images, args.backend, workdir, args.rate).result()
+            result['requests_by_route'] = site.reset_counts()
+            results.append(result)
+    finally:
+        site.stop()
+
+    print_results(results)
+    params = {key: value for key, value in vars(args).items() if key != 'compare'}
+    path = save_results(results, params)
+    print(f"\nSaved to {path}")
+    baseline = previous_results(path)
+    if baseline:
+        compare(baseline, path)
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# Run from the repo root : python -m benchmarks.bench_startup --runs 10
+# Every entry point is imported in a fresh interpreter, like a cron job starting cold.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = (
+    'lib_jobs',
+    'lib_batch',
+    'zerochan_scraper.zerochan_api_scraper',
+    'danbooru_scraper.danbooru_api_scraper',
+    'pixiv_scraper.pixiv_api_scraper',
+    'pinterest_scraper.pinterest_scraper',
+    'app',
+)
+HEAVY_MODULES = ('selenium', 'webdriver_manager', 'bs4', 'lxml', 'selectolax', 'tqdm', 'tkinter', 'PIL', 'pyarrow', 'aiohttp', 'requests')
+
+def _import_once(module: str):
+    """Wall time of one cold import, its slowest imports from -X importtime and the heavy modules it loaded."""
+    code = f"import sys, {module}; print(','.join(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)))"
+    begin_time = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - begin_time
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"
+        return None, [], [], error
+    imports = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|", 2)
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if depth == 1:  # what the entry module imports directly, deeper ones are in their parent's cumulative
+                imports.append((int(cumulative.strip()), name.strip()))
+    heavy = [name for name in completed.stdout.strip().split(",") if name]
+    return elapsed, sorted(imports, reverse=True), heavy, None
+
+def measure(module: str,runs: int):
+    timings = []
+    imports, heavy, error = [], [], None
+    for _ in range(runs):
+        elapsed, imports, heavy, error = _import_once(module)
+        if error:
+            break
+        timings.append(elapsed)
+    return {
+        'module': module,
+        'median_ms': round(statistics.median(timings) * 1000, 1) if timings else None,
+        'min_ms': round(min(timings) * 1000, 1) if timings else None,
+        'heavy_modules': heavy,
+        'slowest_imports': [{'module': name, 'ms': round(us / 1000, 1)} for us, name in imports[:5]],
+        'error': error,
+    }
+
+def baseline(runs: int):
+    """The bare interpreter start, subtracted to see what the imports themselves cost."""
+    timings = []
+    for _ in range(runs):
+        begin_time = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], cwd=REPO_ROOT, capture_output=True)
+        timings.append(time.perf_counter() - begin_time)
+    return round(statistics.median(timings) * 1000, 1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import time of the scraper entry points")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=list(ENTRY_POINTS))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    interpreter_ms = baseline(args.runs)
+    print(f"Bare interpreter start : {interpreter_ms} ms (median of {args.runs})\n")
+    results = []
+    for module in args.modules:
+        result = measure(module, args.runs)
+        results.append(result)
+        if result['error']:
+            print(f"{module:<42} not importable here : {result['error']}")
+            continue
+        slowest = ", ".join(f"{entry['module']} {entry['ms']}" for entry in result['slowest_imports'][:3])
+        print(f"{module:<42}{result['median_ms']:>9.1f} ms  (+{result['median_ms'] - interpreter_ms:.1f})  heavy: {','.join(result['heavy_modules']) or '-'}  slowest: {slowest}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'interpreter_ms': interpreter_ms, 'results': results}, file, indent=2)
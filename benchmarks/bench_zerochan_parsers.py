@@ -0,0 +1,45 @@
+import os
+import time
+import argparse
+import tracemalloc
+
+from zerochan_scraper.zerochan_parsers import available_backends, parse_posts_ids, parse_image_src
+
+# Run from the repo root : python -m benchmarks.bench_zerochan_parsers --rounds 200
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def bench_parser(parse, html: str, backend: str, rounds: int):
+    begin_time = time.perf_counter()
+    for _ in range(rounds):
+        result = parse(html, backend)
+    elapsed = (time.perf_counter() - begin_time) / rounds
+    # Measured apart from the timing loop, tracemalloc slows allocations down a lot
+    tracemalloc.start()
+    parse(html, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+def print_results(page: str, parse, html: str, backends: list[str], rounds: int):
+    print(f"\n{page} ({len(html) / 1024:.1f} KB)")
+    print(f"{'backend':<12}{'ms/page':>10}{'peak KB/page':>15}  result")
+    for backend in backends:
+        elapsed, peak, result = bench_parser(parse, html, backend, rounds)
+        summary = f"{len(result)} ids" if isinstance(result, list) else result
+        print(f"{backend:<12}{elapsed * 1000:>10.3f}{peak / 1024:>15.1f}  {summary}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse time and memory per page of every installed Zerochan parser backend")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--search-page", default=os.path.join(FIXTURES, "zerochan_search.html"), help="saved search page")
+    parser.add_argument("--post-page", default=os.path.join(FIXTURES, "zerochan_post.html"), help="saved post page")
+    args = parser.parse_args()
+
+    backends = available_backends()
+    with open(args.search_page, encoding='utf-8') as file:
+        search_html = file.read()
+    with open(args.post_page, encoding='utf-8') as file:
+        post_html = file.read()
+    print_results("Search page", parse_posts_ids, search_html, backends, args.rounds)
+    print_results("Post page", parse_image_src, post_html, backends, args.rounds)
@@ -0,0 +1,70 @@
+import os
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_IMAGE_SIZE = 512 * 1024
+DEFAULT_LATENCY = 0.05
+
+class FakeCDNHandler(BaseHTTPRequestHandler):
+    """Serves synthetic images at /img/<name>.jpg?size=<bytes>&latency=<seconds>."""
+    protocol_version = "HTTP/1.1"  # keep-alive so connection reuse shows up in the numbers
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if not parts.path.startswith("/img/"):
+            self.send_error(404)
+            return
+        query = parse_qs(parts.query)
+        size = int(query.get("size", [self.server.image_size])[0])
+        latency = float(query.get("latency", [self.server.latency])[0])
+        time.sleep(latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        self.wfile.write(self.server.payload[:size] if size <= len(self.server.payload) else os.urandom(size))
+        with self.server.lock:
+            self.server.requests_count += 1
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeCDN():
+
+    def __init__(self,image_size: int = DEFAULT_IMAGE_SIZE,latency: float = DEFAULT_LATENCY,host: str = "127.0.0.1",port: int = 0):
+        self.server = ThreadingHTTPServer((host, port), FakeCDNHandler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.server.image_size = image_size
+        self.server.latency = latency
+        self.server.payload = b"\xff\xd8\xff" + os.urandom(image_size)
+        self.server.requests_count = 0
+        self.server.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def image_urls(self,count: int):
+        return [f"{self.base_url}/img/{idx}.jpg" for idx in range(count)]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    cdn = FakeCDN(port=8765).start()
+    print(f"Fake CDN serving on {cdn.base_url}/img/<name>.jpg, CTRL+C to stop")
+    try:
+        cdn.thread.join()
+    except KeyboardInterrupt:
+        cdn.stop()
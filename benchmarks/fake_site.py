@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from benchmarks.fake_cdn import DEFAULT_IMAGE_SIZE, DEFAULT_LATENCY
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+FIRST_POST_ID = 3000000
+POSTS = 600
+ZEROCHAN_PAGE_SIZE = 24
+PIXIV_PAGE_SIZE = 60
+PIXIV_ALBUM_EVERY = 5       # every fifth Pixiv post has ALBUM_PAGES pages and needs a /pages call
+ALBUM_PAGES = 3
+THUMBNAIL_DATE = "2024/01/31/12/00/00"
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    """Serves Zerochan pages, Pixiv ajax JSON, Danbooru JSON and synthetic images from one port.
+
+    Zerochan pages are the recorded fixtures with their ids and hosts rewritten. Every
+    response waits `latency` seconds and may be turned into a 500 or a 429 with the
+    configured rates, so retries and the rate limiter get exercised too.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        route, handler = self.server.site.route(parts.path)
+        self.server.site.count(route)
+        time.sleep(self.server.site.latency)
+        fault = self.server.site.fault()
+        if fault == 429:
+            self._send(429, b"Too Many Requests", "text/plain", {"Retry-After": "1"})
+        elif fault == 500:
+            self._send(500, b"Internal Server Error", "text/plain")
+        elif handler is None:
+            self._send(404, b"Not Found", "text/plain")
+        else:
+            status, body, content_type = handler(parts.path, query)
+            self._send(status, body, content_type)
+
+    def _send(self,status: int,body: bytes,content_type: str,headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeSite():
+
+    def __init__(self,posts: int = POSTS,image_size: int = DEFAULT_IMAGE_SIZE,latency: float = DEFAULT_LATENCY,error_rate: float = 0.0,throttle_rate: float = 0.0,seed: int = 0,host: str = "127.0.0.1",port: int = 0):
+        self.posts = posts
+        self.image_size = image_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.payload = b"\xff\xd8\xff" + os.urandom(image_size)
+        with open(os.path.join(FIXTURES, "zerochan_search.html"), encoding='utf-8') as file:
+            self.search_template = file.read()
+        with open(os.path.join(FIXTURES, "zerochan_post.html"), encoding='utf-8') as file:
+            self.post_template = file.read()
+        self.recorded_post_id = re.search(r'"contentUrl": "[^"]*?(\d+)\.\w+"', self.post_template).group(1)
+        self.server = ThreadingHTTPServer((host, port), FakeSiteHandler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.server.site = self
+        self.thread = None
+        self.routes = [
+            (re.compile(r"\.(jpg|png|gif)$"), 'image', self._image),
+            (re.compile(r"^/ajax/search/illustrations/"), 'pixiv_search', self._pixiv_search),
+            (re.compile(r"^/ajax/illust/\d+/pages$"), 'pixiv_pages', self._pixiv_pages),
+            (re.compile(r"^/posts\.json$"), 'danbooru_search', self._danbooru_search),
+            (re.compile(r"^/posts/\d+\.json$"), 'danbooru_post', self._danbooru_post),
+            (re.compile(r"^/\d+$"), 'zerochan_post', self._zerochan_post),
+            (re.compile(r"^/[^/]+$"), 'zerochan_search', self._zerochan_search),
+        ]
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self,path: str):
+        for pattern, name, handler in self.routes:
+            if pattern.search(path):
+                return name, handler
+        return 'unknown', None
+
+    def count(self,route: str):
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def fault(self):
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def reset_counts(self):
+        with self.lock:
+            counts, self.requests = self.requests, {}
+        return counts
+
+    def _page_ids(self,page_idx: int,page_size: int):
+        first = (page_idx - 1) * page_size
+        return [FIRST_POST_ID + self.posts - 1 - idx for idx in range(first, min(first + page_size, self.posts))]   # newest first
+
+    def _image(self,path: str,query: dict):
+        size = int(query.get("size", [self.image_size])[0])
+        return 200, self.payload[:size] if size <= len(self.payload) else os.urandom(size), "image/jpeg"
+
+    def _zerochan_search(self,path: str,query: dict):
+        page_ids = self._page_ids(int(query.get("p", ["1"])[0]), ZEROCHAN_PAGE_SIZE)
+        if not page_ids:
+            return 200, b"<html><body><p>No entries found.</p></body></html>", "text/html"
+        ids = iter(page_ids)
+        # Recorded page, its thumbnails ids swapped for this page's ids and extra thumbnails dropped
+        html = re.sub(r'<li data-id="\d+"[^>]*>.*?</li>\n', lambda match: self._zerochan_thumb(match.group(0), next(ids, None)), self.search_template, flags=re.S)
+        return 200, html.replace("https://s1.zerochan.net", self.base_url).replace("https://static.zerochan.net", self.base_url).encode(), "text/html; charset=utf-8"
+
+    def _zerochan_thumb(self,thumb: str,post_id):
+        if post_id is None:
+            return ""
+        recorded_id = re.search(r'data-id="(\d+)"', thumb).group(1)
+        return thumb.replace(recorded_id, str(post_id))
+
+    def _zerochan_post(self,path: str,query: dict):
+        post_id = path.strip("/")
+        html = self.post_template.replace(self.recorded_post_id, post_id)
+        return 200, html.replace("https://s1.zerochan.net", self.base_url).replace("https://static.zerochan.net", self.base_url).encode(), "text/html; charset=utf-8"
+
+    def _pixiv_search(self,path: str,query: dict):
+        data = [{
+            'id': str(post_id),
+            'illustType': 0,
+            'pageCount': ALBUM_PAGES if post_id % PIXIV_ALBUM_EVERY == 0 else 1,
+            'url': f"{self.base_url}/c/250x250_80_a2/img-master/img/{THUMBNAIL_DATE}/{post_id}_p0_square1200.jpg",
+            'width': 1200,
+            'height': 1700,
+        } for post_id in self._page_ids(int(query.get("p", ["1"])[0]), PIXIV_PAGE_SIZE)]
+        return 200, json.dumps({'error': False, 'body': {'illust': {'data': data, 'total': self.posts}}}).encode(), "application/json"
+
+    def _pixiv_pages(self,path: str,query: dict):
+        post_id = path.split("/")[3]
+        body = [{'urls': {'original': f"{self.base_url}/img-original/img/{THUMBNAIL_DATE}/{post_id}_p{page}.png"}} for page in range(ALBUM_PAGES)]
+        return 200, json.dumps({'error': False, 'body': body}).encode(), "application/json"
+
+    def _danbooru_record(self,post_id: int):
+        return {
+            'id': post_id,
+            'file_url': f"{self.base_url}/img/{post_id}.jpg",
+            'md5': f"{post_id:032x}",
+            'file_ext': 'jpg',
+            'file_size': self.image_size,
+            'image_width': 1200,
+            'image_height': 1700,
+            'rating': 'g',
+            'tag_string': 'bench',
+        }
+
+    def _danbooru_search(self,path: str,query: dict):
+        limit = int(query.get("limit", ["20"])[0])
+        posts = [self._danbooru_record(post_id) for post_id in self._page_ids(int(query.get("page", ["1"])[0]), limit)]
+        return 200, json.dumps(posts).encode(), "application/json"
+
+    def _danbooru_post(self,path: str,query: dict):
+        return 200, json.dumps(self._danbooru_record(int(path.split("/")[2].split(".")[0]))).encode(), "application/json"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    site = FakeSite(port=8766).start()
+    print(f"Fake site serving on {site.base_url} (Zerochan /<tag>, Pixiv /ajax/..., Danbooru /posts.json), CTRL+C to stop")
+    try:
+        site.thread.join()
+    except KeyboardInterrupt:
+        site.stop()
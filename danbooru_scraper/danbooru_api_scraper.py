@@ -3,58 +3,34 @@ import re
 import time
 import requests
 from datetime import datetime
-from bs4 import BeautifulSoup
-from urllib.parse import quote
 from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
-
-from selenium.webdriver import firefox,chrome,Firefox,Chrome
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.firefox import GeckoDriverManager
-import concurrent.futures as THREAD
+from threading import Lock
+from lib_api_scraper import ApiScraper
+from lib_http_cache import CachingAdapter
+from lib_download_scheduler import estimate_bytes, SAMPLE_BYTES_PER_PIXEL
 
 SAFE_WORK_RATING = "rating:general"
-MAX_WORKERS_EXTRACT_SRCS = 15
+POSTS_PER_PAGE = 200    # the most /posts.json returns in one request
+MAX_WORKERS_EXTRACT_SRCS = 4
 MAX_WORKERS_DOWNLOAD_IMAGES = 20
+SITE = "danbooru"
+RATINGS = {'g': 'general', 's': 'sensitive', 'q': 'questionable', 'e': 'explicit'}
+SAMPLE_WIDTH = 850     # large_file_url is a jpg sample this wide when the original is bigger
 
-class DanbooruScraper:
-    def __init__(self,tag,max_images_posts,page_idx,output_folder,file_name,stopped_at_download_idx):
+class DanbooruScraper(ApiScraper):
+    site = SITE
+    progress = False
+
+    def __init__(self,tag,max_images_posts,page_idx,output_folder,file_name,stopped_at_download_idx,download_backend='threads',dedup_store=None,checkpoint=True,incremental=False,postprocessor=None,output_mode='files',metadata_store=None):
+        super().__init__(tag, max_images_posts, page_idx, output_folder, file_name, MAX_WORKERS_EXTRACT_SRCS, MAX_WORKERS_DOWNLOAD_IMAGES, download_backend, dedup_store, checkpoint, incremental, postprocessor, output_mode, metadata_store)
         self.base_url = "https://danbooru.donmai.us"
-        self.tag = tag
-        self.max_images_posts = max_images_posts
-        self.page_idx = page_idx
-        self.output_folder = output_folder
-        self.file_name = file_name
         self.stopped_at_download_idx = stopped_at_download_idx
-        self.driver = None
-        self.session = None
+        self.posts_data = {}    # post_id -> file url, md5, dimensions... from the listing request
+        self.posts_lock = Lock()
         
-    def init_driver_service_options(self):
-        options = firefox.options.Options()
-        # Performance optimizations
-        options.add_argument('--headless')
-        #options.add_argument('--no-sandbox')  # Bypass OS security model, required in some environments
-        options.add_argument('--disable-dev-shm-usage')  # Overcome limited resource problems
-        #options.add_argument('--disable-gpu')  # Disable GPU hardware acceleration
-        options.add_argument('--disable-infobars')  # Disable infobars
-        options.add_argument('--disable-notifications')  # Disable notifications
-        # Memory optimizations
-        options.add_argument('--disable-extensions')  # Disable extensions
-        options.add_argument('--disable-popup-blocking')  # Disable popup blocking
-        options.add_argument('--dns-prefetch-disable')
-        options.add_argument("--window-size=1280,720")
-
-        service = firefox.service.Service(GeckoDriverManager().install())
-        driver = Firefox(service=service,options=options)
-        return driver
-    
     def _make_session(self):
         session = requests.Session()
-        adapter = HTTPAdapter(
+        adapter = CachingAdapter(
             pool_connections=30,
             pool_maxsize=60,
             max_retries=Retry(
@@ -66,7 +42,7 @@ class DanbooruScraper:
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Referer': 'https://danbooru.donmai.us',
+            'Referer': self.base_url,
             'Connection': 'keep-alive',
         })
         
@@ -74,189 +50,127 @@ class DanbooruScraper:
         session.mount('https://', adapter)
         return session
     
-    def get_posts_ids(self):
-        """Extract post IDs from the search page."""
-        post_urls = []
-        tag = str(' '.join([self.tag,SAFE_WORK_RATING]))
-        #search_url = f"{self.base_url}/posts?tags={self.tags}&page={self.page_idx}"
-        search_url = f"{self.base_url}/posts?" + (f"page={self.page_idx}&tags={quote(tag)}" if self.page_idx > 1 else f"tags={quote(tag)}&z=5")
+    def _post_record(self,post: dict):
+        return {
+            'file_url': post.get('file_url'),
+            'large_file_url': post.get('large_file_url'),
+            'md5': post.get('md5'),
+            'file_ext': post.get('file_ext'),
+            'file_size': post.get('file_size'),
+            'width': post.get('image_width'),
+            'height': post.get('image_height'),
+            'rating': post.get('rating'),
+            'tag_string': post.get('tag_string'),
+            'tag_string_artist': post.get('tag_string_artist'),
+            'tag_string_character': post.get('tag_string_character'),
+            'tag_string_copyright': post.get('tag_string_copyright'),
+            'score': post.get('score'),
+            'created_at': post.get('created_at'),
+            'source': post.get('source'),
+        }
 
-        self.driver.get(search_url)
-        print(f"\nLoading search page {self.page_idx}: {search_url}")
-        WebDriverWait(self.driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".posts-container"))
-        )
+    def extract_posts(self):
+        """List up to POSTS_PER_PAGE post ids per request from the JSON api, keeping their file data."""
+        post_ids = []
+        tags = ' '.join([self.tag,SAFE_WORK_RATING])
+        search_url = f"{self.base_url}/posts.json"
         try:
-            print("posts container located")
-            posts = self.driver.find_elements(By.TAG_NAME, "article")
-            for post in posts:
-                if len(post_urls) >= self.max_images_posts:  # Check if we've reached the limit
-                    break  # Exit the loop if we have enough posts
-                post_id = post.get_attribute('data-id')
-                if post_id:
-                    post_urls.append(post_id)
+            # Deleted, banned or gold only posts come without a file_url, move on until a page has usable ones
+            while not post_ids:
+                response = self.session.get(search_url, params={'tags': tags, 'limit': POSTS_PER_PAGE, 'page': self.page_idx})
+                print(f"\nLoading search page {self.page_idx}: {response.url}")
+                if response.status_code != 200:
+                    print(f"{response.status_code} is the status code : not 200")
+                    return None
+                posts = response.json()
+                if not posts:
+                    return []
+                self.page_idx += 1
+                with self.posts_lock:
+                    for post in posts:
+                        if len(post_ids) >= self.max_images_posts:
+                            break
+                        if post.get('id') and post.get('file_url'):
+                            self.posts_data[post['id']] = self._post_record(post)
+                            post_ids.append(post['id'])
         except Exception as e:
-                print(f"Error processing get_posts_ids {posts}: {e}")
-            
-        finally:
-            print(f"Found {len(post_urls)} posts on page (limited by max_images, left {self.max_images_posts})")
-            return post_urls
+            print(f"Error occurred in extract_posts: {e}")
+            return None
+        print(f"Found {len(post_ids)} posts on page (limited by max_images, left {self.max_images_posts})")
+        return post_ids
 
-    # def get_image_src(self, post_id):
-    #     image_src = []  # Ensure it's initialized
-    #     search_url = f"{self.base_url}/posts/{post_id}"
-    #     try:
-    #         response = self.session.get(search_url)
-    #         if response.status_code != 200:
-    #             print(f"{response.status_code} is the status code : not 200")
-    #             return []
-            
-    #         soup = BeautifulSoup(response.text, 'html.parser')
-    #         image = soup.find("img", class_="fit-width")
-    #         if image:
-    #             image_src.append(image.get("src"))
-    #     except Exception as e:
-    #         print(f"Error processing get_images_srcs {post_id}: {str(e)}")
-    #     return image_src
-    def get_image_src(self, post_id):
-        images_srcs = []  # Ensure it's initialized
-        url = f"{self.base_url}/posts/{post_id}"
-        try:
-            self.driver.get(url)
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "picture"))
-            )
-            # if response.status_code != 200:
-            #     print(f"{response.status_code} is the status code : not 200")
-            #     return []
-            image_src = self.driver.find_elements(By.ID, "image")
-            print(image_src)
-            # soup = BeautifulSoup(response.text, 'html.parser')
-            # image = soup.find("img", class_="fit-width")
-            
-            # if image:
-            #     image_src = image.get("src")
-            #     images_srcs.append((image_src,post_id))
-            #     print(f"for post {post_id} :src {image_src}")
-        except Exception as e:
-            print(f"Error processing post {post_id}: {str(e)}")
-        # Return a list of tuples with image URLs and the post_id
-        return images_srcs
+    def extract_srcs(self, post_id):
+        """Return the file url the listing already brought, one /posts/{id}.json call for posts it did not (resumed jobs)."""
+        with self.posts_lock:
+            record = self.posts_data.get(post_id)
+        if record is None:
+            try:
+                response = self.session.get(f"{self.base_url}/posts/{post_id}.json")
+                if response.status_code != 200:
+                    print(f"{response.status_code} is the status code : not 200")
+                    return None
+                record = self._post_record(response.json())
+                with self.posts_lock:
+                    self.posts_data[post_id] = record
+            except Exception as e:
+                print(f"Error processing post {post_id}: {str(e)}")
+                return None
+        if not record['file_url']:
+            return []
+        return [(record['file_url'], post_id)]
     
-    def download_image(self,session,idx,image_src):
+    def _image_path(self,idx):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         image_name = f"{self.file_name}_idx_{idx + 1:04d}_{timestamp}.jpg"
-        image_path = os.path.join(self.output_folder, image_name)
-        #print(f"Attempting to download image {image_src} as {image_name}")
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Referer': 'https://danbooru.donmai.us',
-                'Connection': 'keep-alive',
-                # "Referer": f"https://www.pixiv.net/en/artworks/{post_id}",
-                # "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            }
-            response = session.get(image_src,headers=headers)
-            if response.status_code != 200:
-                print(f"Failed to fetch image {image_src}")
-                return
-            response.raise_for_status() 
-            try:
-                with open(image_path, 'wb') as image:
-                    image.write(response.content)
-            except Exception as e:
-                print(f"Image {image_src} Is Not Downloaded")
-        except Exception as e:
-            print(f"Error downloading image {image_name}:{e}")
-    # def download_image(self, args):
-    #     idx, image_url = args
-    #     img_name = str(self.tag)+"_idx_"+str(idx+1)+".jpg"
-    #     file_path = os.path.join(self.output_folder, img_name)
-        
-    #     try:
-    #         img_data = requests.get(image_url).content
-    #         with open(file_path, 'wb') as file:
-    #             file.write(img_data)
-    #             print(f'image {img_name} downloaded')
-    #         return
-    #     except Exception as e:
-    #         print(f"Error: {e}")
+        return os.path.join(self.output_folder, image_name)
 
-    # def multi_threading_extract_srcs(self, posts_ids):
-    #     with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-    #         print("starting the executor for processing images scr from urls")
-    #         results = executor.map(self.get_image_src, posts_ids)
-    #     return results
-    
-    def multi_threading_extract_srcs(self, posts_ids):
-        print("Multi Threading Of SRCs Extraction BEGIN....")
-        combined_images_srcs = set()
-        combined_posts_ids = []
-        
-        with THREAD.ThreadPoolExecutor(max_workers=MAX_WORKERS_EXTRACT_SRCS) as EXE:
-            try:
-                # Execute extract_srcs for each post_id and collect results
-                all_results = []
-                results = EXE.map(self.get_image_src, posts_ids)
-                
-                for result in results:
-                    all_results.extend(result)
-                
-                # Process results while maintaining the relationship
-                for img_src, post_id in all_results:
-                    combined_images_srcs.add(img_src)
-                    combined_posts_ids.append(post_id)
-                        
-            except Exception as e:
-                print(f"Exception Occurred During Multi Threading Extract Srcs: {e}")
-                return set(), []
-        
-        print(f"All Srcs Located With Total {len(combined_images_srcs)} : Combined Posts Urls : {len(combined_posts_ids)}")
-        return combined_images_srcs, combined_posts_ids
+    def _image_headers(self,post_id=None):
+        return {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Referer': self.base_url,
+            'Connection': 'keep-alive',
+        }
 
-    def multi_threading_download_images(self,images_srcs,posts_ids):
-        print("Multi Threading Of Downloading Images BEGIN....")
-        self.session = self._make_session()
-        with THREAD.ThreadPoolExecutor(max_workers=MAX_WORKERS_DOWNLOAD_IMAGES) as executor:
-            executor.map(
-                lambda args: self.download_image(self.session, *args),
-                zip(
-                    range(self.stopped_at_download_idx, self.stopped_at_download_idx + len(images_srcs)),
-                    images_srcs,
-                    posts_ids
-                )
-            )
+    def _post_metadata(self,post_id):
+        with self.posts_lock:
+            record = self.posts_data.get(post_id, {})
+        artists = (record.get('tag_string_artist') or '').split()
+        return {
+            'tags': (record.get('tag_string') or '').split(),
+            'author': artists[0] if artists else None,
+            'rating': RATINGS.get(record.get('rating'), record.get('rating')),
+            'md5': record.get('md5'),
+            'width': record.get('width'),
+            'height': record.get('height'),
+            'score': record.get('score'),
+            'created': record.get('created_at'),
+            'page_url': f"{self.base_url}/posts/{post_id}",
+            'artists': artists,
+            'characters': (record.get('tag_string_character') or '').split(),
+            'series': (record.get('tag_string_copyright') or '').split(),
+            'source': record.get('source'),
+            'file_size': record.get('file_size'),
+        }
 
-    def scrape(self):
-        """Main scraping method."""
-        os.makedirs(self.output_folder, exist_ok=True)
-        try:
-            self.driver = self.init_driver_service_options()
+    def _image_size(self,image_src,post_id):
+        with self.posts_lock:
+            record = self.posts_data.get(post_id, {})
+        return record.get('file_size')
 
-            while self.max_images_posts > 0:
-                if self.max_images_posts <= 0:
-                    break
-                retrieved_posts_ids = self.get_posts_ids()
-                if len(retrieved_posts_ids) == 0:
-                    print("extract_posts returned nothing...")
-                    break
-                try:
-                    images_srcs,posts_ids = self.multi_threading_extract_srcs(retrieved_posts_ids)
-                    if not images_srcs:
-                        print("multithreading extract srcs returned nothing...")
-                        break
-                    self.multi_threading_download_images(images_srcs,posts_ids)
-                    self.max_images_posts -= len(retrieved_posts_ids)
-                    self.stopped_at_download_idx += len(images_srcs)
-                except Exception as e:
-                    print(f"Failed to process post after we retrieved the posts in scrap method: {e}")
-                    continue
-            self.driver.quit()
-        except Exception as e:
-            print(f"Error Occured in Scrape Method : {e}")
-        finally:
-            print(f"Finished.. Quiting Process START")
+    def _smaller_rendition(self,image_src,post_id):
+        with self.posts_lock:
+            record = self.posts_data.get(post_id, {})
+        sample_src = record.get('large_file_url')
+        if not sample_src or sample_src == image_src:
+            return None
+        return sample_src, estimate_bytes(record.get('width'), record.get('height'), SAMPLE_BYTES_PER_PIXEL, max_width=SAMPLE_WIDTH)
+
+    def _start_idx(self):
+        return self.stopped_at_download_idx
+
+    def _finished(self,stats):
+        self.stopped_at_download_idx += stats['srcs']
         
 if __name__ == "__main__":
     tag = "firefly_(honkai:_star_rail)" 
@@ -3,86 +3,108 @@ import re
 import time
 import requests
 import concurrent.futures
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
-from urllib.parse import quote
-from webdriver_manager.chrome import ChromeDriverManager
-from queue import Queue
-from threading import Lock
+from urllib.parse import quote, urlsplit
+from urllib3.util.retry import Retry
+from lib_download import fetch_image
+from lib_rate_limit import RateLimitedAdapter
+from lib_sessions import SESSIONS
+from lib_webdriver_pool import shared_pool, driver_binary
+
+SITE = "danbooru"
+DRIVER_POOL_SIZE = 6
 
 class DanbooruScraper:
-    def __init__(self, tags, output_folder, max_images ,page_number, download_idx):
+    def __init__(self, tags, output_folder, max_images ,page_number, download_idx, dedup_store=None):
         self.base_url = "https://danbooru.donmai.us"
         self.tags = quote(tags.replace(' ', '_'))
         self.output_folder = output_folder
         self.max_images = max_images
         self.page_number = page_number
         self.download_idx = download_idx
-        self.drivers = Queue()
+        # Warm browsers shared by the listing and the posts workers instead of one Chrome per post
+        self.drivers = shared_pool("danbooru_chrome", self.create_driver, DRIVER_POOL_SIZE)
+        self.dedup_store = dedup_store
         
     def create_driver(self):
         """Create a new browser instance."""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
         options = Options()
         #options.add_argument('--headless=new')
         options.add_argument("--window-size=1280,720")
         options.add_argument('--log-level=3')  # This suppresses the DevTools message
         options.add_experimental_option('excludeSwitches', ['enable-logging'])  # This suppresses console logging
-        service = Service(ChromeDriverManager().install())
+        service = Service(driver_binary('chrome'))
         return webdriver.Chrome(service=service, options=options)
         
     def get_post_ids(self, page):
         """Extract post IDs from the search page."""
-        driver = self.create_driver()
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
         post_urls = []
         search_url = f"{self.base_url}/posts?tags={self.tags}&page={page}"
         print(f"\nLoading search page {page}: {search_url}")
-        driver.get(search_url)
-        
-        WebDriverWait(driver, 6).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".post-preview"))
-        )
-        try:
-            posts = driver.find_elements(By.CSS_SELECTOR, ".post-preview")
-            for post in posts:
-                if len(post_urls) >= self.max_images:  # Check if we've reached the limit
-                    break  # Exit the loop if we have enough posts
-                post_id = post.get_attribute('data-id')
-                if post_id:
-                    post_urls.append(post_id)
-        except Exception as e:
-                print(f"Error processing post {posts}: {e}")
+        with self.drivers.driver() as driver:
+            driver.get(search_url)
             
-        finally:
-            driver.quit()
-            print(f"Found {len(post_urls)} posts on page (limited by max_images, left {self.max_images})")
-            return post_urls
+            WebDriverWait(driver, 6).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, ".post-preview"))
+            )
+            try:
+                posts = driver.find_elements(By.CSS_SELECTOR, ".post-preview")
+                for post in posts:
+                    if len(post_urls) >= self.max_images:  # Check if we've reached the limit
+                        break  # Exit the loop if we have enough posts
+                    post_id = post.get_attribute('data-id')
+                    if post_id:
+                        post_urls.append(post_id)
+            except Exception as e:
+                    print(f"Error processing post {posts}: {e}")
+        print(f"Found {len(post_urls)} posts on page (limited by max_images, left {self.max_images})")
+        return post_urls
 
     def get_image_url(self, post_url):
         """Get image URL from a single post using a driver from the pool."""
-        driver = self.create_driver()
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
         image_urls = set()
         try:
-            driver.get(f"{self.base_url}/posts/{post_url}")
-            
-            WebDriverWait(driver, 3).until(
-                EC.presence_of_element_located((By.TAG_NAME, "img"))
-            )
-            img_element = driver.find_element(By.CSS_SELECTOR, "img.fit-width")
-            img_url = img_element.get_attribute('src')
-            if img_url:
-                image_urls.add(img_url)
+            with self.drivers.driver() as driver:
+                driver.get(f"{self.base_url}/posts/{post_url}")
+                
+                WebDriverWait(driver, 3).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "img"))
+                )
+                img_element = driver.find_element(By.CSS_SELECTOR, "img.fit-width")
+                img_url = img_element.get_attribute('src')
+                if img_url:
+                    image_urls.add(img_url)
             
         except Exception as e:
             print(f"Error processing post {post_url}: {e}")
-            
-        finally:
-            driver.quit()
-            return image_urls
+        return image_urls
+
+    def _make_session(self):
+        # Image GETs go through the shared per-host limiter like the API scrapers' requests
+        session = requests.Session()
+        adapter = RateLimitedAdapter(
+            pool_connections=10,
+            pool_maxsize=25,
+            max_retries=Retry(
+                total=4,
+                backoff_factor=1,
+                status_forcelist=[429, 503]
+            )
+        )
+        session.headers.update({
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+        })
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     def download_image(self, args):
         idx, image_url = args
@@ -90,9 +112,7 @@ class DanbooruScraper:
         file_path = os.path.join(self.output_folder, img_name)
         
         try:
-            img_data = requests.get(image_url).content
-            with open(file_path, 'wb') as file:
-                file.write(img_data)
+            if fetch_image(SESSIONS.get(urlsplit(image_url).hostname, self._make_session), image_url, file_path, dedup_store=self.dedup_store, site=SITE):
                 print(f'image {img_name} downloaded')
             return
         except Exception as e:
@@ -100,7 +120,7 @@ class DanbooruScraper:
             
     def process_page_posts(self, post_urls):
         """Process all posts from a page concurrently."""
-        with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=DRIVER_POOL_SIZE) as executor:
             print("starting the executor for processing images scr from urls")
             results = executor.map(self.get_image_url, post_urls)
             combined_image_urls = set().union(*results)
@@ -0,0 +1,198 @@
+import os
+import time
+from threading import Lock
+from urllib.parse import urlsplit
+from functools import partial
+from lib_pipeline import ScrapePipeline
+from lib_sessions import SESSIONS
+from lib_async_download import AsyncDownloader, DISPATCH_WORKERS
+from lib_download import fetch_image
+from lib_download_scheduler import DownloadScheduler, probe_size
+from lib_checkpoint import CheckpointJournal, journal_path
+from lib_shards import ShardWriter
+from lib_tag_state import TAG_STATE
+
+class ApiScraper():
+    """Pipeline wiring shared by the site scrapers.
+
+    A site sets `site` and `base_url` and supplies its stages (extract_posts, extract_srcs,
+    _make_session) and hooks (_image_path, _image_headers, _post_metadata, _image_size and
+    optionally _smaller_rendition, _candidates, _prepare, _start_idx and _finished).
+    """
+
+    site = None
+    progress = True     # show a tqdm bar of the saved images
+
+    def __init__(self,tag: str,max_images_posts: int,page_idx: int,output_folder: str,file_name: str,src_workers: int,download_workers: int,download_backend: str = 'threads',dedup_store=None,checkpoint: bool = True,incremental: bool = False,postprocessor=None,output_mode: str = 'files',metadata_store=None):
+        self.tag = tag
+        self.max_images_posts = max_images_posts
+        self.page_idx = page_idx
+        self.output_folder = output_folder
+        self.file_name = file_name
+        self.session = None
+        self.progress_bar = None
+        self.lock = Lock()
+        self.src_workers = src_workers
+        self.download_workers = download_workers
+        self.download_backend = download_backend  # 'threads' or 'async'
+        self.async_downloader = None
+        self.dedup_store = dedup_store if output_mode == 'files' else None  # shard samples leave no file for the index to point at
+        self.checkpoint = checkpoint
+        self.journal = None
+        self.incremental = incremental  # only scrape posts newer than the last run of this tag
+        self.postprocessor = postprocessor  # shared Postprocessor checking images off the download threads
+        self.output_mode = output_mode  # 'files' or 'shards' (tar shards with a manifest, see lib_shards)
+        self.shard_writer = None
+        self.metadata_store = metadata_store  # shared MetadataStore getting one record per saved image
+        self.probe_sizes = False    # HEAD the srcs the listing gave no size for, so the scheduler can rank them
+        self.byte_budget = None     # bytes this job may download before large images fall back to smaller renditions
+        self.budget = None    # FairBudget share set by the batch runner
+        self.shard = None     # set with last_page and on_saved when a shard worker runs a slice of the pages
+        self.last_page = None
+        self.on_saved = None
+        self.stats = None
+
+    def _prepare(self):
+        """Runs before anything is opened, False aborts the scrape."""
+        return True
+
+    def _session_credentials(self):
+        return None
+
+    def _start_idx(self):
+        return 0
+
+    def _finished(self,stats: dict):
+        pass
+
+    def _candidates(self,image_src: str):
+        return [image_src]
+
+    def _image_size(self,image_src: str,post_id):
+        return None
+
+    def _smaller_rendition(self,image_src: str,post_id):
+        return None
+
+    def _image_saved(self):
+        if self.progress_bar is not None:
+            with self.lock:
+                self.progress_bar.update(1)
+                time.sleep(0.0005)
+        if self.on_saved:
+            self.on_saved()
+
+    def download_image(self,session,idx: int,image_src: str,post_id):
+        image_path = self._image_path(idx)
+        try:
+            for candidate in self._candidates(image_src):
+                saved_path = fetch_image(session, candidate, image_path, self._image_headers(post_id), self.dedup_store, self.site, post_id)
+                if saved_path:
+                    self._image_saved()
+                    return saved_path
+        except Exception as e:
+            print(f"Error downloading image {image_path}:{e}")
+
+    def _make_scheduler(self):
+        probe = (lambda image_src, post_id: probe_size(self.session, image_src, self._image_headers(post_id))) if self.probe_sizes else None
+        return DownloadScheduler(size_of=self._image_size, probe=probe, smaller=self._smaller_rendition, byte_budget=self.byte_budget)
+
+    def _store_sample(self,idx: int,image_src: str,post_id,image_path: str):
+        metadata = self._post_metadata(post_id)
+        location = image_path
+        # Near duplicates and dedup hits can point outside this folder, those stay where they are
+        if self.shard_writer and os.path.dirname(os.path.abspath(image_path)) == os.path.abspath(self.output_folder):
+            location = self.shard_writer.add(image_path, self.site, post_id, image_src, idx, metadata)
+        if self.metadata_store:
+            self.metadata_store.add(self.site, post_id, image_src, location, self.tag, metadata)
+        return location
+
+    def _consume_posts(self,posts_ids: list):
+        self.max_images_posts -= len(posts_ids)
+        if self.journal:
+            self.journal.record_page(self.page_idx, posts_ids)
+        if self.incremental:
+            TAG_STATE.note(self.site, self.tag, posts_ids)
+
+    def _open_progress_bar(self):
+        from tqdm import tqdm
+        self.progress_bar = tqdm(
+            total=self.max_images_posts,
+            initial=len(self.journal.downloaded) if self.journal else 0,
+            desc="Scraping Images",
+            unit="Image",
+            bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]",
+            colour='red',
+            leave=True,
+            disable=self.shard is not None   # shards report to the parent's bar instead
+        )
+
+    def _close(self,stats: dict = None):
+        # Also runs when the scrape raised, so no tar shard or event loop is left open
+        if self.shard_writer:
+            self.shard_writer.close()
+            self.shard_writer = None
+        if self.async_downloader:
+            self.async_downloader.close()
+            self.async_downloader = None
+        if self.journal:
+            # Keep the journal while some images failed so the next run retries only those
+            self.journal.close(finished=stats is not None and stats['failed'] == 0)
+            self.journal = None
+        if self.progress_bar is not None:
+            self.progress_bar.close()
+
+    def scrape(self):
+        stats = None
+        try:
+            os.makedirs(self.output_folder,exist_ok=True)
+            if not self._prepare():
+                return
+            if self.checkpoint:
+                self.journal = CheckpointJournal(journal_path(self.output_folder, self.site, self.tag, self.shard))
+            if self.progress:
+                self._open_progress_bar()
+            is_known = None
+            if self.incremental:
+                # Newest posts are listed first, walk from the first page down to the last run's mark
+                self.page_idx = 1
+                is_known = TAG_STATE.known_predicate(self.site, self.tag)
+            if self.journal and self.journal.resumed:
+                self.page_idx = self.journal.page_idx
+                self.max_images_posts -= len(self.journal.listed_posts)
+            max_pages = self.last_page - self.page_idx + 1 if self.last_page else None
+            if self.output_mode == 'shards':
+                self.shard_writer = ShardWriter(self.output_folder, f"{self.site}-{self.shard}" if self.shard is not None else self.site, query=self.tag)
+            self.session = SESSIONS.get(urlsplit(self.base_url).hostname, self._make_session, self._session_credentials())
+            download_image = partial(self.download_image, self.session)
+            download_workers = self.download_workers
+            if self.download_backend == 'async':
+                self.async_downloader = AsyncDownloader(self.session, self._image_path, self._image_headers, self._image_saved, self.dedup_store, self.site, candidates=self._candidates)
+                download_image = self.async_downloader.download_image
+                download_workers = DISPATCH_WORKERS
+            pipeline = ScrapePipeline(
+                extract_posts=self.extract_posts,
+                extract_srcs=self.extract_srcs,
+                download_image=download_image,
+                max_images_posts=self.max_images_posts,
+                src_workers=self.src_workers,
+                download_workers=download_workers,
+                on_page=self._consume_posts,
+                start_idx=self._start_idx(),
+                journal=self.journal,
+                is_known=is_known,
+                budget=self.budget,
+                max_pages=max_pages,
+                postprocess=self.postprocessor.submit if self.postprocessor else None,
+                store=self._store_sample if self.shard_writer or self.metadata_store else None,
+                scheduler=self._make_scheduler()
+            )
+            stats = self.stats = pipeline.run()
+            if self.incremental:
+                TAG_STATE.finish(self.site, self.tag, stats['caught_up'])
+            self._finished(stats)
+        except Exception as e:
+            print(f"Error Occured in Scrape Method : {e}")
+        finally:
+            self._close(stats)
+            print(f"Finished.. Quiting Process START")
@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+import concurrent.futures as THREAD
+from threading import Lock
+from lib_download import CHUNK_SIZE, BYTE_BUDGET, temp_path_for, transfer_bytes
+from lib_rate_limit import LIMITERS
+from lib_metrics import DOWNLOADED_BYTES, HTTP_REQUESTS, HTTP_SECONDS
+
+MAX_IN_FLIGHT = 256
+LIMIT_PER_HOST = 32
+DISPATCH_WORKERS = 2
+TIMEOUT_SECONDS = 120
+
+class AsyncDownloader():
+    """Downloads images on a single asyncio event loop instead of a pool of blocking threads.
+
+    One aiohttp client (and so one connection pool) lives for the whole scrape, with
+    per-host connection limits. `download_image(idx, image_src, post_id)` only schedules
+    the transfer and returns its Future, blocking once `max_in_flight` transfers are pending.
+    """
+
+    def __init__(self,session,image_path,image_headers,on_saved=None,dedup_store=None,site: str = None,max_in_flight: int = MAX_IN_FLIGHT,limit_per_host: int = LIMIT_PER_HOST,candidates=None):
+        # aiohttp costs more to import than requests, only the async backend pays for it
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("The async download backend requires aiohttp, install it with 'pip install aiohttp'")
+        self.image_path = image_path          # (idx) -> path
+        self.image_headers = image_headers    # (post_id) -> headers dict
+        self.on_saved = on_saved
+        self.candidates = candidates or (lambda image_src: [image_src])   # (image_src) -> urls tried in order on 404
+        self.dedup_store = dedup_store
+        self.site = site
+        self.max_in_flight = max_in_flight
+        self.limit_per_host = limit_per_host
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.pending = set()
+        self.lock = Lock()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        # Reuse the headers and cookies of the requests session the sync stages use
+        self.client = asyncio.run_coroutine_threadsafe(
+            self._make_client(dict(session.headers), session.cookies.get_dict()), self.loop
+        ).result()
+
+    async def _make_client(self,headers,cookies):
+        import aiohttp
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=300
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=headers,
+            cookies=cookies,
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT_SECONDS)
+        )
+
+    async def _download(self,idx: int,image_src: str,post_id):
+        image_path = self.image_path(idx)
+        try:
+            reused_path = self.dedup_store.reuse(image_src, image_path, self.site, post_id) if self.dedup_store else None
+            if not reused_path:
+                limiter = LIMITERS.for_url(image_src)
+                for candidate in self.candidates(image_src):
+                    await self.loop.run_in_executor(None, limiter.acquire)
+                    begin_time, status, retry_after = time.monotonic(), None, None
+                    try:
+                        async with self.client.get(candidate,headers=self.image_headers(post_id)) as response:
+                            status, retry_after = response.status, response.headers.get('Retry-After')
+                            if response.status == 404:
+                                continue
+                            if response.status != 200:
+                                print(f"Failed to fetch image {candidate}")
+                                return
+                            size, sha256 = await self._stream_to_file(response, image_path)
+                            break
+                    finally:
+                        latency = time.monotonic() - begin_time
+                        limiter.release(status, latency, retry_after)
+                        HTTP_REQUESTS.inc(host=limiter.host, status=status or 'error')
+                        HTTP_SECONDS.observe(latency, host=limiter.host)
+                else:
+                    print(f"Failed to fetch image {image_src}")
+                    return
+                if self.dedup_store:
+                    image_path = self.dedup_store.record(self.site, post_id, image_src, image_path, sha256, size)
+            else:
+                image_path = reused_path
+            if self.on_saved:
+                self.on_saved()
+            return image_path
+        except Exception as e:
+            print(f"Error downloading image {image_path}:{e}")
+
+    async def _stream_to_file(self,response,image_path: str):
+        # Same budget as the threads backend, waited for off the loop
+        reserved = await self.loop.run_in_executor(None, BYTE_BUDGET.acquire, transfer_bytes(response.headers))
+        temp_path = temp_path_for(image_path)
+        size = 0
+        digest = hashlib.sha256()
+        try:
+            with open(temp_path, 'wb') as image:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    image.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            os.replace(temp_path, image_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            BYTE_BUDGET.release(reserved)
+        DOWNLOADED_BYTES.inc(size)
+        return size, digest.hexdigest()
+
+    def _done(self,future):
+        with self.lock:
+            self.pending.discard(future)
+        self.slots.release()
+
+    def download_image(self,idx: int,image_src: str,post_id):
+        """Schedules the transfer and returns a Future of the image path (None on failure)."""
+        self.slots.acquire()
+        future = asyncio.run_coroutine_threadsafe(self._download(idx, image_src, post_id), self.loop)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def close(self):
+        """Wait for the scheduled transfers then shut the client and the loop down."""
+        with self.lock:
+            pending = list(self.pending)
+        THREAD.wait(pending)
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
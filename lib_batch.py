@@ -0,0 +1,309 @@
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+import threading
+from collections import deque
+
+from lib_dedup_store import DedupStore, DEFAULT_INDEX_NAME
+from lib_postprocess import Postprocessor
+from lib_phash import PerceptualIndex, DEFAULT_PHASH_INDEX_NAME
+from lib_metadata_store import MetadataStore, DEFAULT_METADATA_NAME
+from lib_sessions import SESSIONS
+from lib_download import BYTE_BUDGET
+
+GLOBAL_WORKERS = 32         # srcs extractions and downloads in flight across every job
+MAX_JOBS = 4                # jobs listing at the same time
+MAX_JOBS_PER_SITE = 2       # keeps one host from getting every running job
+JOB_SRC_WORKERS = 4
+JOB_DOWNLOAD_WORKERS = 8
+SITES = ('pixiv', 'zerochan', 'danbooru')
+
+class BudgetShare():
+    """The acquire()/release() handle a pipeline gets on the FairBudget for its site and tag."""
+
+    def __init__(self,budget,site: str,tag: str):
+        self.budget = budget
+        self.site = site
+        self.tag = tag
+
+    def acquire(self):
+        self.budget.acquire(self.site, self.tag)
+
+    def release(self):
+        self.budget.release()
+
+class FairBudget():
+    """Global pool of work slots handed out round robin across sites, then across tags of a site.
+
+    A tag with a thousand queued downloads waits its turn behind a tag with ten, and a site
+    with fifty tags gets the same share as a site with one, whatever the number of threads.
+    """
+
+    def __init__(self,total: int = GLOBAL_WORKERS):
+        self.total = total
+        self.in_use = 0
+        self.condition = threading.Condition()
+        self.tickets = itertools.count()
+        self.granted = set()
+        self.waiters = {}       # site -> tag -> deque of tickets
+        self.site_order = deque()
+        self.tag_order = {}     # site -> deque of tags with waiters
+
+    def share(self,site: str,tag: str):
+        return BudgetShare(self, site, tag)
+
+    def acquire(self,site: str,tag: str):
+        with self.condition:
+            ticket = next(self.tickets)
+            self.waiters.setdefault(site, {}).setdefault(tag, deque()).append(ticket)
+            if site not in self.tag_order:
+                self.tag_order[site] = deque()
+                self.site_order.append(site)
+            if tag not in self.tag_order[site]:
+                self.tag_order[site].append(tag)
+            self._grant()
+            while ticket not in self.granted:
+                self.condition.wait()
+            self.granted.discard(ticket)
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self._grant()
+
+    def _grant(self):
+        granted = False
+        while self.in_use < self.total and self.site_order:
+            site = self.site_order.popleft()
+            tag_order = self.tag_order[site]
+            tag = tag_order.popleft()
+            tickets = self.waiters[site][tag]
+            self.granted.add(tickets.popleft())
+            self.in_use += 1
+            granted = True
+            # Served tags and sites go to the back of their line
+            if tickets:
+                tag_order.append(tag)
+            else:
+                del self.waiters[site][tag]
+            if tag_order:
+                self.site_order.append(site)
+            else:
+                del self.tag_order[site]
+                del self.waiters[site]
+        if granted:
+            self.condition.notify_all()
+
+def load_jobs(jobs_path: str):
+    """Jobs from a .csv (site,tag,count[,src_workers,download_workers]) or a JSON lines file."""
+    jobs = []
+    with open(jobs_path, 'r', encoding='utf-8') as file:
+        if jobs_path.endswith('.csv'):
+            for row in csv.reader(line for line in file if line.strip() and not line.startswith('#')):
+                if row[0].strip().lower() == 'site':
+                    continue    # header
+                job = {'site': row[0].strip(), 'tag': row[1].strip(), 'count': int(row[2])}
+                if len(row) > 3 and row[3].strip():
+                    job['src_workers'] = int(row[3])
+                if len(row) > 4 and row[4].strip():
+                    job['download_workers'] = int(row[4])
+                jobs.append(job)
+        else:
+            jobs = [json.loads(line) for line in file if line.strip() and not line.startswith('#')]
+    for job in jobs:
+        job['site'] = job['site'].lower()
+        if job['site'] not in SITES:
+            raise ValueError(f"Unsupported site {job['site']} for tag {job.get('tag')}, expected one of {SITES}")
+    return jobs
+
+class BatchRunner():
+    """Runs (site, tag, count) jobs under one FairBudget.
+
+    At most max_jobs scrapers run at once and at most max_jobs_per_site of them on the
+    same site, started round robin across sites. Every job gets a small worker pool of
+    its own (overridable per job), while the budget bounds the work they do together.
+    """
+
+    def __init__(self,jobs: list[dict],output_dir: str,workers: int = GLOBAL_WORKERS,max_jobs: int = MAX_JOBS,max_jobs_per_site: int = MAX_JOBS_PER_SITE,download_backend: str = 'threads',incremental: bool = False,browser: str = 'chrome',postprocess: dict = None,near_duplicates: str = None,output_mode: str = 'files',probe_sizes: bool = False,byte_budget_mb: float = None,http_cache=None):
+        self.jobs = jobs
+        self.output_dir = output_dir
+        self.budget = FairBudget(workers)
+        self.max_jobs = max_jobs
+        self.max_jobs_per_site = max_jobs_per_site
+        self.download_backend = download_backend
+        self.incremental = incremental
+        self.browser = browser
+        self.dedup_store = None
+        self.postprocess = postprocess      # Postprocessor options shared by every job, None skips the image checks
+        self.near_duplicates = near_duplicates      # 'report' or 'remove' near duplicates as they land, None skips the perceptual hashes
+        self.postprocessor = None
+        self.perceptual_index = None
+        self.metadata_store = None
+        self.output_mode = output_mode      # 'files' or 'shards', overridable per job
+        self.probe_sizes = probe_sizes      # HEAD the srcs without a size from the listing, overridable per job
+        self.byte_budget_mb = byte_budget_mb    # per job, large images fall back to smaller renditions past it
+        self.http_cache = http_cache    # cache database path, None puts it in output_dir, False turns it off
+        self.pending = {}       # site -> deque of jobs
+        self.site_order = deque()
+        self.running = {}       # site -> running jobs count
+        self.condition = threading.Condition()
+        self.results = []
+
+    def _make_scraper(self,job: dict):
+        output_folder = os.path.join(self.output_dir, job['site'], f"{job['tag']}_scraped")
+        common = dict(
+            tag=job['tag'],
+            max_images_posts=int(job['count']),
+            page_idx=int(job.get('page_idx', 1)),
+            output_folder=output_folder,
+            file_name=job['tag'],
+            download_backend=job.get('download_backend', self.download_backend),
+            dedup_store=self.dedup_store,
+            incremental=job.get('incremental', self.incremental),
+            postprocessor=self.postprocessor,
+            output_mode=job.get('output_mode', self.output_mode),
+            metadata_store=self.metadata_store
+        )
+        if job['site'] == 'pixiv':
+            from lib_cookies import PixivCookies
+            from pixiv_scraper.pixiv_api_scraper import PixivScraper
+            scraper = PixivScraper(browser=job.get('browser', self.browser), pixiv_cookies_manager=PixivCookies(), **common)
+        elif job['site'] == 'zerochan':
+            from zerochan_scraper.zerochan_api_scraper import ZeroChanScraper
+            scraper = ZeroChanScraper(**common)
+        else:
+            from danbooru_scraper.danbooru_api_scraper import DanbooruScraper
+            scraper = DanbooruScraper(stopped_at_download_idx=0, **common)
+        scraper.src_workers = int(job.get('src_workers', JOB_SRC_WORKERS))
+        scraper.download_workers = int(job.get('download_workers', JOB_DOWNLOAD_WORKERS))
+        scraper.budget = self.budget.share(job['site'], job['tag'])
+        scraper.probe_sizes = bool(job.get('probe_sizes', self.probe_sizes))
+        byte_budget_mb = job.get('byte_budget_mb', self.byte_budget_mb)
+        if byte_budget_mb is not None:
+            scraper.byte_budget = int(float(byte_budget_mb) * 1024 * 1024)
+        return scraper
+
+    def _run_job(self,job: dict):
+        begin_time = time.time()
+        stats = None
+        try:
+            scraper = self._make_scraper(job)
+            scraper.scrape()
+            stats = scraper.stats
+        except Exception as e:
+            print(f"Error Occured in Job {job['site']} {job['tag']} : {e}")
+        finally:
+            with self.condition:
+                self.running[job['site']] -= 1
+                self.results.append({**job, 'stats': stats, 'seconds': round(time.time() - begin_time, 2)})
+                self.condition.notify_all()
+
+    def _next_job(self):
+        # Round robin across sites, skipping the ones already at their running jobs cap
+        for _ in range(len(self.site_order)):
+            site = self.site_order[0]
+            self.site_order.rotate(-1)
+            if self.pending[site] and self.running.get(site, 0) < self.max_jobs_per_site:
+                return self.pending[site].popleft()
+        return None
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        from lib_http_cache import use_cache, cache_path_for
+        use_cache(cache_path_for(self.http_cache, self.output_dir))
+        self.dedup_store = DedupStore(os.path.join(self.output_dir, DEFAULT_INDEX_NAME))
+        self.metadata_store = MetadataStore(os.path.join(self.output_dir, DEFAULT_METADATA_NAME))
+        if self.postprocess is not None:
+            if self.near_duplicates:
+                self.perceptual_index = PerceptualIndex(os.path.join(self.output_dir, DEFAULT_PHASH_INDEX_NAME))
+            self.postprocessor = Postprocessor(
+                dedup_store=self.dedup_store,
+                near_duplicates=self.perceptual_index,
+                near_duplicate_action=self.near_duplicates or 'report',
+                **self.postprocess
+            )
+        for job in self.jobs:
+            if job['site'] not in self.pending:
+                self.pending[job['site']] = deque()
+                self.site_order.append(job['site'])
+            self.pending[job['site']].append(job)
+        begin_time = time.time()
+        threads = []
+        with self.condition:
+            while any(self.pending.values()):
+                job = self._next_job() if sum(self.running.values()) < self.max_jobs else None
+                if job is None:
+                    self.condition.wait()
+                    continue
+                self.running[job['site']] = self.running.get(job['site'], 0) + 1
+                thread = threading.Thread(target=self._run_job, args=(job,), daemon=True)
+                thread.start()
+                threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if self.postprocessor:
+            self.postprocessor.close()
+        if self.perceptual_index:
+            self.perceptual_index.close()
+        self.metadata_store.close()
+        self.dedup_store.close()
+
+        downloaded = sum(result['stats']['downloaded'] for result in self.results if result['stats'])
+        failed_jobs = sum(1 for result in self.results if result['stats'] is None)
+        print(f"Batch Finished {len(self.results)} Jobs In {time.time() - begin_time:.2f} seconds With {downloaded} Images Downloaded ({failed_jobs} Jobs Failed)")
+        print(f"Connection pools : {SESSIONS.stats()}")
+        return self.results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many (site, tag, count) scrape jobs under one global worker budget")
+    parser.add_argument("jobs", help="jobs file, .csv rows 'site,tag,count[,src_workers,download_workers]' or JSON lines")
+    parser.add_argument("--output-dir", default="../scraped_datasets")
+    parser.add_argument("--workers", type=int, default=GLOBAL_WORKERS, help="srcs and downloads in flight across all jobs")
+    parser.add_argument("--max-jobs", type=int, default=MAX_JOBS)
+    parser.add_argument("--max-jobs-per-site", type=int, default=MAX_JOBS_PER_SITE)
+    parser.add_argument("--backend", choices=['threads', 'async'], default='threads')
+    parser.add_argument("--browser", choices=['chrome', 'firefox'], default='chrome', help="browser of the Pixiv login")
+    parser.add_argument("--incremental", action="store_true", help="only scrape posts newer than the last run of each tag")
+    parser.add_argument("--report", help="write the per job results to this JSON file")
+    parser.add_argument("--no-check", action="store_true", help="skip the integrity and extension checks of the downloaded images")
+    parser.add_argument("--thumbnail-size", type=int, help="also write thumbnails of this size (needs Pillow)")
+    parser.add_argument("--reencode-format", choices=['jpeg', 'png', 'webp'], help="also write a copy re-encoded to this format (needs Pillow)")
+    parser.add_argument("--reencode-max-side", type=int, help="downscale the re-encoded copies to this longest side")
+    parser.add_argument("--near-duplicates", choices=['report', 'remove'], help="check every image against a perceptual hash index of the output dir (needs Pillow)")
+    parser.add_argument("--output-mode", choices=['files', 'shards'], default='files', help="one file per image, or size capped tar shards with a manifest")
+    parser.add_argument("--probe-sizes", action="store_true", help="HEAD the images the listing gave no size for, so large ones are scheduled apart")
+    parser.add_argument("--byte-budget-mb", type=float, help="per job, download smaller renditions of large images once it would go over this many MB")
+    parser.add_argument("--http-cache", help="database of the search and post pages cache, <output-dir>/http_cache.sqlite by default")
+    parser.add_argument("--no-http-cache", action="store_true", help="send every request to the network")
+    parser.add_argument("--max-in-flight-mb", type=float, help="MB of image transfers in progress at once across all jobs and backends")
+    args = parser.parse_args()
+
+    if args.max_in_flight_mb:
+        BYTE_BUDGET.set_limit(int(args.max_in_flight_mb * 1024 * 1024))
+    runner = BatchRunner(
+        load_jobs(args.jobs),
+        args.output_dir,
+        workers=args.workers,
+        max_jobs=args.max_jobs,
+        max_jobs_per_site=args.max_jobs_per_site,
+        download_backend=args.backend,
+        incremental=args.incremental,
+        browser=args.browser,
+        postprocess=None if args.no_check else {
+            'thumbnail_size': args.thumbnail_size,
+            'reencode_format': args.reencode_format,
+            'reencode_max_side': args.reencode_max_side,
+        },
+        near_duplicates=args.near_duplicates,
+        output_mode=args.output_mode,
+        probe_sizes=args.probe_sizes,
+        byte_budget_mb=args.byte_budget_mb,
+        http_cache=False if args.no_http_cache else args.http_cache
+    )
+    results = runner.run()
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(results, file, indent=2)
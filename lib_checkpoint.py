@@ -0,0 +1,110 @@
+import os
+import json
+import time
+from threading import Lock
+
+FSYNC_INTERVAL_SECONDS = 2.0
+
+def journal_path(output_folder: str,site: str,tag: str,shard: int = None):
+    safe_tag = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(tag))
+    shard_suffix = f"_shard{shard}" if shard is not None else ""
+    return os.path.join(output_folder, f".{site}_{safe_tag}{shard_suffix}_checkpoint.jsonl")
+
+class CheckpointJournal():
+    """Append-only JSON lines journal of a scrape job so a crashed job resumes where it died.
+
+    Records are one of:
+        {"event": "page", "page_idx": next page to list, "posts": [posts ids listed]}
+        {"event": "srcs", "post_id": id, "srcs": [[idx, image_src], ...]}
+        {"event": "done", "idx": idx, "src": image_src, "path": image_path}
+    Every record is flushed as soon as it is written, a torn last line from a crash
+    is ignored on replay, and the journal is renamed to '.done' once the job finishes.
+    """
+
+    def __init__(self,path: str):
+        self.path = path
+        self.lock = Lock()
+        self.page_idx = None
+        self.listed_posts = []
+        self.resolved = {}      # post_id -> [(idx, image_src)]
+        self.downloaded = {}    # image_src -> image_path
+        self.next_idx = 0
+        torn = self._replay()
+        self.file = open(self.path, 'a')
+        if torn:
+            # End the torn line, or the first record of this run would be glued to it
+            self.file.write("\n")
+        self.last_fsync = time.time()
+
+    def _replay(self):
+        """Applies the records already in the journal, True when its last line is torn."""
+        if not os.path.exists(self.path):
+            return False
+        line = "\n"
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # torn write from the crash
+                self._apply(record)
+        print(f"Checkpoint found : page {self.page_idx}, {len(self.listed_posts)} posts listed, {len(self.downloaded)} images downloaded")
+        return not line.endswith("\n")
+
+    def _apply(self,record: dict):
+        event = record.get('event')
+        if event == 'page':
+            self.page_idx = record['page_idx']
+            self.listed_posts.extend(record['posts'])
+        elif event == 'srcs':
+            self.resolved[record['post_id']] = [tuple(src) for src in record['srcs']]
+            for idx, _ in record['srcs']:
+                self.next_idx = max(self.next_idx, idx + 1)
+        elif event == 'done':
+            self.downloaded[record['src']] = record['path']
+
+    def _append(self,record: dict,sync: bool = False):
+        with self.lock:
+            self._apply(record)
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+            if sync or time.time() - self.last_fsync > FSYNC_INTERVAL_SECONDS:
+                os.fsync(self.file.fileno())
+                self.last_fsync = time.time()
+
+    @property
+    def resumed(self):
+        return self.page_idx is not None
+
+    def record_page(self,page_idx: int,posts_ids: list):
+        self._append({'event': 'page', 'page_idx': page_idx, 'posts': list(posts_ids)}, sync=True)
+
+    def record_srcs(self,post_id,images_srcs: list):
+        self._append({'event': 'srcs', 'post_id': post_id, 'srcs': [[idx, image_src] for idx, image_src, _ in images_srcs]})
+
+    def record_done(self,idx: int,image_src: str,post_id,image_path: str):
+        self._append({'event': 'done', 'idx': idx, 'src': image_src, 'path': image_path})
+
+    def pending_posts(self):
+        """Posts that were listed but whose srcs were never resolved."""
+        return [post_id for post_id in self.listed_posts if post_id not in self.resolved]
+
+    def pending_srcs(self):
+        """Resolved srcs that were never written to disk, as (idx, image_src, post_id)."""
+        return [
+            (idx, image_src, post_id)
+            for post_id, images_srcs in self.resolved.items()
+            for idx, image_src in images_srcs
+            if image_src not in self.downloaded
+        ]
+
+    def known_srcs(self):
+        return {image_src for images_srcs in self.resolved.values() for _, image_src in images_srcs}
+
+    def close(self,finished: bool = False):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+        if finished:
+            os.replace(self.path, self.path + ".done")
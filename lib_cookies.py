@@ -1,8 +1,6 @@
 import os
 import json
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
+from lib_metrics import STAGE_SECONDS
 
 PIXIV_EMAIL = os.getenv("PIXIV_EMAIL")
 PIXIV_PASSWORD = os.getenv("PIXIV_PASSWORD")
@@ -12,6 +10,10 @@ class PixivCookies:
         pass
         
     def _wait_load_cookies(self):
+        with STAGE_SECONDS.time(stage='cookie_load'):
+            return self._load_cookies()
+
+    def _load_cookies(self):
         try:
             cookies_path = os.path.join(os.getcwd(),"pixiv_cookies.json")
             if os.path.exists(cookies_path):
@@ -58,7 +60,10 @@ class PixivCookies:
             print("Cookies file deleted successfully Thus Logged Out")
 
     def _wait_for_auth(self,driver,login_path):
-        
+        # Selenium is only needed once a login really runs, loading cookies never pays for it
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
         driver.get(login_path)
         try:
             wait = WebDriverWait(driver,10)
@@ -0,0 +1,121 @@
+import os
+import time
+import sqlite3
+from threading import Lock
+
+DEFAULT_INDEX_NAME = "scraped_index.sqlite"
+SINGLE_IMAGE_SITES = ('zerochan', 'danbooru')  # one image per post, a known post id is a known image whatever its url
+
+class DedupStore():
+    """Persistent index of every downloaded image keyed by its source url, post id and sha256.
+
+    Scrapers ask it before issuing the GET of an image, so re-scraping a tag or scraping
+    overlapping tags reuses the earlier file instead of downloading it again. Hits are
+    hardlinked to the new path with on_hit='link' or just reported with on_hit='skip'.
+    """
+
+    def __init__(self,db_path: str = DEFAULT_INDEX_NAME,on_hit: str = 'link'):
+        self.db_path = db_path
+        self.on_hit = on_hit
+        self.lock = Lock()
+        self.hits = 0
+        self.hash_hits = 0
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    source_url TEXT PRIMARY KEY,
+                    site TEXT,
+                    post_id TEXT,
+                    sha256 TEXT,
+                    path TEXT,
+                    size INTEGER,
+                    created_at REAL
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS images_post ON images (site, post_id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256)")
+
+    def lookup(self,image_src: str):
+        """Returns the path of an earlier download of image_src if it is still on disk."""
+        with self.lock:
+            row = self.connection.execute("SELECT path FROM images WHERE source_url = ?", (image_src,)).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def post_paths(self,site: str,post_id):
+        """Paths of the earlier downloads of a post that are still on disk."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path FROM images WHERE site = ? AND post_id = ?", (site, str(post_id))
+            ).fetchall()
+        return [row[0] for row in rows if os.path.exists(row[0])]
+
+    def _link(self,existing_path: str,image_path: str):
+        if os.path.dirname(os.path.abspath(existing_path)) == os.path.dirname(os.path.abspath(image_path)):
+            return existing_path    # already in this output folder
+        try:
+            os.link(existing_path, image_path)
+            return image_path
+        except OSError:
+            return existing_path    # other device or no hardlink support, point at the original
+
+    def reuse(self,image_src: str,image_path: str,site: str = None,post_id=None):
+        """Returns a path holding image_src without downloading it, or None on a miss.
+
+        Posts of single image sites also match by (site, post_id), so the same post served
+        from another CDN host or url is not downloaded again.
+        """
+        existing_path = self.lookup(image_src)
+        if not existing_path and site in SINGLE_IMAGE_SITES and post_id is not None:
+            post_paths = self.post_paths(site, post_id)
+            existing_path = post_paths[0] if post_paths else None
+        if not existing_path:
+            return None
+        with self.lock:
+            self.hits += 1
+        if self.on_hit == 'skip':
+            return existing_path
+        return self._link(existing_path, image_path)
+
+    def record(self,site: str,post_id,image_src: str,image_path: str,sha256: str,size: int):
+        """Indexes a fresh download and returns its final path.
+
+        When the same bytes already exist under another url the new file is swapped for
+        a hardlink to the earlier one so the disk keeps a single copy.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT path FROM images WHERE sha256 = ? AND source_url != ?", (sha256, image_src)
+            ).fetchone()
+            if row and os.path.exists(row[0]) and os.path.abspath(row[0]) != os.path.abspath(image_path):
+                self.hash_hits += 1
+                try:
+                    os.remove(image_path)
+                    os.link(row[0], image_path)
+                except OSError:
+                    if not os.path.exists(image_path):
+                        image_path = row[0]
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (image_src, site, str(post_id), sha256, image_path, size, time.time())
+                )
+        return image_path
+
+    def move_path(self,old_path: str,new_path: str):
+        """Follows a file renamed after its download, e.g. its extension fixed by post processing."""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE images SET path = ? WHERE path = ?", (new_path, old_path))
+
+    def forget_path(self,image_path: str):
+        """Drops the entries of a file found invalid so its urls get downloaded again."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM images WHERE path = ?", (image_path,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        print(f"Dedup store reused {self.hits} images by url and {self.hash_hits} by content hash")
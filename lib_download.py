@@ -0,0 +1,98 @@
+import os
+import hashlib
+import threading
+from lib_metrics import DOWNLOADED_BYTES
+
+CHUNK_SIZE = 64 * 1024
+MAX_IN_FLIGHT_BYTES = 32 * 1024 * 1024
+UNKNOWN_TRANSFER_BYTES = 1024 * 1024    # what a body without Content-Length reserves
+
+class ByteBudget():
+    """Caps the bytes of the transfers in progress across every download worker and backend.
+
+    Each transfer reserves its Content-Length, clamped to the cap, until its body is on
+    disk, so many large originals wait for each other instead of all streaming at once.
+    Memory itself stays around workers * CHUNK_SIZE, a transfer only holds one chunk.
+    """
+
+    def __init__(self,max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def set_limit(self,max_bytes: int):
+        with self.condition:
+            self.max_bytes = max_bytes
+            self.condition.notify_all()
+
+    def acquire(self,n: int):
+        n = min(n, self.max_bytes)
+        with self.condition:
+            while self.in_flight + n > self.max_bytes:
+                self.condition.wait()
+            self.in_flight += n
+        return n
+
+    def release(self,n: int):
+        with self.condition:
+            self.in_flight -= n
+            self.condition.notify_all()
+
+# Shared by every scraper of the process so the cap holds across all of them
+BYTE_BUDGET = ByteBudget(MAX_IN_FLIGHT_BYTES)
+
+def temp_path_for(image_path: str):
+    return image_path + ".part"
+
+def transfer_bytes(headers):
+    """What a transfer reserves in the ByteBudget, from the Content-Length of its response."""
+    length = headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else UNKNOWN_TRANSFER_BYTES
+
+def stream_to_file(response,image_path: str,chunk_size: int = CHUNK_SIZE,budget: ByteBudget = BYTE_BUDGET):
+    """Writes the body of a `stream=True` response to image_path and returns its size and sha256.
+
+    Chunks go to a temp file which is renamed over image_path only once the whole
+    body arrived, so a crash or a truncated body never leaves a half written image.
+    """
+    temp_path = temp_path_for(image_path)
+    size = 0
+    digest = hashlib.sha256()
+    reserved = budget.acquire(transfer_bytes(response.headers))
+    try:
+        with open(temp_path, 'wb') as image:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                image.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        expected_size = response.headers.get('Content-Length')
+        if expected_size and not response.headers.get('Content-Encoding') and int(expected_size) != size:
+            raise IOError(f"Truncated body, got {size} of {expected_size} bytes")
+        os.replace(temp_path, image_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        budget.release(reserved)
+    DOWNLOADED_BYTES.inc(size)
+    return size, digest.hexdigest()
+
+def fetch_image(session,image_src: str,image_path: str,headers: dict = None,dedup_store=None,site: str = None,post_id=None):
+    """Downloads image_src to image_path unless the dedup store already has it.
+
+    Returns the path the image ends up at (an earlier copy on a dedup hit) or None
+    when the server did not answer with a 200.
+    """
+    if dedup_store:
+        reused_path = dedup_store.reuse(image_src, image_path, site, post_id)
+        if reused_path:
+            return reused_path
+    with session.get(image_src,headers=headers,stream=True) as response:
+        if response.status_code != 200:
+            print(f"Failed to fetch image {image_src} : status {response.status_code}")
+            return None
+        size, sha256 = stream_to_file(response, image_path)
+    if dedup_store:
+        image_path = dedup_store.record(site, post_id, image_src, image_path, sha256, size)
+    return image_path
@@ -0,0 +1,207 @@
+import heapq
+import itertools
+import threading
+import concurrent.futures as THREAD
+from lib_metrics import STAGE_ITEMS
+
+QUEUE_SIZE = 200
+LARGE_IMAGE_BYTES = 8 * 1024 * 1024     # a transfer this big or bigger takes one of the large slots
+MAX_LARGE_TRANSFERS = 4                 # large transfers running at once across every scheduler of the process
+UNKNOWN_IMAGE_BYTES = 1024 * 1024       # what an image of unknown size is ranked as until a probe answers
+PROBE_WORKERS = 4
+PROBE_TIMEOUT = 10
+ORIGINAL_BYTES_PER_PIXEL = 0.5          # rough size of originals from their dimensions, jpg and png mixed
+SAMPLE_BYTES_PER_PIXEL = 0.25           # the downscaled jpg renditions compress better
+
+def estimate_bytes(width,height,bytes_per_pixel: float = ORIGINAL_BYTES_PER_PIXEL,max_width: int = None,max_height: int = None):
+    """Expected file size of a width x height image, downscaled to fit max_width x max_height when given."""
+    if not width or not height:
+        return None
+    width, height = int(width), int(height)
+    scale = min(1.0, (max_width or width) / width, (max_height or height) / height)
+    return int(width * height * scale * scale * bytes_per_pixel)
+
+def probe_size(session,image_src: str,headers: dict = None):
+    """Size in bytes of image_src from a HEAD request, or from a one byte range request when HEAD has no length."""
+    try:
+        response = session.head(image_src, headers=headers, allow_redirects=True, timeout=PROBE_TIMEOUT)
+        length = response.headers.get('Content-Length')
+        if response.status_code == 200 and length and not response.headers.get('Content-Encoding'):
+            return int(length)
+        range_headers = {**(headers or {}), 'Range': 'bytes=0-0'}
+        with session.get(image_src, headers=range_headers, stream=True, timeout=PROBE_TIMEOUT) as response:
+            # Content-Range: bytes 0-0/123456
+            total = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+            if response.status_code == 206 and total.isdigit():
+                return int(total)
+    except Exception as e:
+        print(f"Error probing the size of {image_src} : {e}")
+    return None
+
+class LargeTransfers():
+    """Slots of the large transfers, one condition shared by every scheduler waiting on them."""
+
+    def __init__(self,max_running: int):
+        self.max_running = max_running
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def set_limit(self,max_running: int):
+        with self.condition:
+            self.max_running = max_running
+            self.condition.notify_all()
+
+# Shared like BYTE_BUDGET, so the cap holds across the jobs of a batch
+LARGE_TRANSFERS = LargeTransfers(MAX_LARGE_TRANSFERS)
+
+class DownloadScheduler():
+    """Stands in for the FIFO srcs queue of ScrapePipeline and hands the downloads out by size.
+
+    Sizes come from the site's metadata through size_of, or from a HEAD probe when there
+    is none (the item is queued right away as UNKNOWN_IMAGE_BYTES and moves once the
+    probe answers). Small images go out smallest first, large ones whenever one of the
+    LARGE_TRANSFERS slots is free, so a few 30 MB originals never hold every worker while
+    hundreds of small images wait. With a byte_budget, large images that would overrun it
+    are swapped for the smaller rendition smaller() gives, 0 always takes that rendition.
+    Without any size the order is the plain idx order of the old queue.
+    """
+
+    def __init__(self,size_of=None,probe=None,smaller=None,large_bytes: int = LARGE_IMAGE_BYTES,byte_budget: int = None,maxsize: int = QUEUE_SIZE,large_transfers: LargeTransfers = LARGE_TRANSFERS,probe_workers: int = PROBE_WORKERS):
+        self.size_of = size_of      # (image_src, post_id) -> bytes from the listing metadata, None when unknown
+        self.probe = probe          # (image_src, post_id) -> bytes from the server, only asked when size_of has nothing
+        self.smaller = smaller      # (image_src, post_id) -> (src of a smaller rendition, its bytes or None), None when there is none
+        self.large_bytes = large_bytes
+        self.byte_budget = byte_budget
+        self.maxsize = maxsize
+        self.large_transfers = large_transfers
+        self.condition = large_transfers.condition
+        self.small = []             # heaps of [bytes, idx, seq, item, size], a moved entry leaves its old copy with item None
+        self.large = []
+        self.entries = {}           # idx -> live heap entry
+        self.sequence = itertools.count()
+        self.stops = []
+        self.running_large = set()  # idx of the large transfers holding a slot
+        self.renditions = {}        # idx -> src actually downloaded when it is not the item's own
+        self.scheduled_bytes = 0
+        self.prober = THREAD.ThreadPoolExecutor(max_workers=probe_workers) if probe else None
+        self.stats = {'scheduled': 0, 'large': 0, 'probed': 0, 'unknown': 0, 'smaller': 0}
+
+    def _known_size(self,image_src: str,post_id):
+        if not self.size_of:
+            return None
+        try:
+            size = self.size_of(image_src, post_id)
+            return int(size) if size else None
+        except Exception as e:
+            print(f"Error reading the size of {image_src} : {e}")
+            return None
+
+    def _push(self,item: tuple,size: int):
+        idx, image_src, post_id = item
+        if size and size >= self.large_bytes and self.smaller and self.byte_budget is not None and self.scheduled_bytes + size > self.byte_budget:
+            rendition = self.smaller(image_src, post_id)
+            if rendition:
+                self.renditions[idx], size = rendition
+                self.stats['smaller'] += 1
+                STAGE_ITEMS.inc(stage='schedule', outcome='smaller')
+        self.scheduled_bytes += size or UNKNOWN_IMAGE_BYTES
+        entry = [size or UNKNOWN_IMAGE_BYTES, idx, next(self.sequence), item, size]
+        heapq.heappush(self.large if size and size >= self.large_bytes else self.small, entry)
+        self.entries[idx] = entry
+
+    def put(self,item):
+        """Queues an (idx, image_src, post_id) item, blocking while maxsize items wait; anything else is a stop marker."""
+        if not isinstance(item, tuple):
+            with self.condition:
+                self.stops.append(item)
+                self.condition.notify_all()
+            return
+        size = self._known_size(item[1], item[2])
+        with self.condition:
+            while len(self.entries) >= self.maxsize:
+                self.condition.wait()
+            self._push(item, size)
+            self.stats['scheduled'] += 1
+            if size is None and not self.prober:
+                self.stats['unknown'] += 1
+            self.condition.notify_all()
+        if size is None and self.prober:
+            self.prober.submit(self._probe, item)
+
+    def _probe(self,item: tuple):
+        idx, image_src, post_id = item
+        try:
+            size = self.probe(image_src, post_id)
+        except Exception as e:
+            print(f"Error probing the size of {image_src} : {e}")
+            size = None
+        with self.condition:
+            entry = self.entries.get(idx)
+            if not size or entry is None:
+                # Taken by a worker before the probe answered, or the server gave no length
+                self.stats['unknown'] += 1
+                return
+            self.stats['probed'] += 1
+            entry[3] = None
+            self.scheduled_bytes -= UNKNOWN_IMAGE_BYTES
+            del self.entries[idx]
+            self._push(item, size)
+            self.condition.notify_all()
+
+    def _pop(self,heap: list):
+        while heap:
+            entry = heapq.heappop(heap)
+            if entry[3] is not None:
+                return entry
+        return None
+
+    def _peek(self,heap: list):
+        while heap and heap[0][3] is None:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def get(self):
+        """The next item to download, blocks while only capped large transfers are left."""
+        with self.condition:
+            while True:
+                large_waiting = self._peek(self.large)
+                if large_waiting and self.large_transfers.running < self.large_transfers.max_running:
+                    entry = self._pop(self.large)
+                    self.large_transfers.running += 1
+                    self.running_large.add(entry[1])
+                    self.stats['large'] += 1
+                    STAGE_ITEMS.inc(stage='schedule', outcome='large')
+                    break
+                if self._peek(self.small):
+                    entry = self._pop(self.small)
+                    STAGE_ITEMS.inc(stage='schedule', outcome='small')
+                    break
+                if self.stops and not large_waiting:
+                    return self.stops.pop()
+                self.condition.wait()
+            del self.entries[entry[1]]
+            self.condition.notify_all()
+            return entry[3]
+
+    def source_of(self,item: tuple):
+        """The src to download for an item, its smaller rendition when the budget swapped it."""
+        with self.condition:
+            return self.renditions.get(item[0], item[1])
+
+    def done(self,item: tuple):
+        """Frees the large slot of a finished transfer, called whether it succeeded or not."""
+        with self.condition:
+            if item[0] in self.running_large:
+                self.running_large.discard(item[0])
+                self.large_transfers.running -= 1
+                self.condition.notify_all()
+            self.renditions.pop(item[0], None)
+
+    def qsize(self):
+        with self.condition:
+            return len(self.entries)
+
+    def close(self):
+        if self.prober:
+            self.prober.shutdown(wait=False, cancel_futures=True)
+        print(f"Download scheduler ordered {self.stats['scheduled']} srcs : {self.stats['large']} large, {self.stats['probed']} probed, {self.stats['unknown']} of unknown size, {self.stats['smaller']} swapped for a smaller rendition")
@@ -0,0 +1,216 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+from threading import Lock
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from lib_rate_limit import RateLimitedAdapter
+
+DEFAULT_CACHE_NAME = "http_cache.sqlite"
+MAX_CACHE_BYTES = 256 * 1024 * 1024     # compressed bodies, least recently used ones go first
+EVICT_TO = 0.9                          # evict down to this fraction of max_bytes so puts do not evict one by one
+COMPRESS_LEVEL = 6
+# Only urls matching a rule are cached, everything else (images above all) goes straight to the network.
+# The ttl is how long an entry is served without asking, after that it is revalidated with its ETag/Last-Modified.
+DEFAULT_TTL_RULES = [
+    (r"^https://www\.zerochan\.net/\d+$", 30 * 24 * 3600),                  # post pages
+    (r"^https://www\.zerochan\.net/[^/?\d][^/?]*(\?p=\d+)?$", 300),         # search pages
+    (r"^https://www\.pixiv\.net/ajax/illust/\d+/pages", 7 * 24 * 3600),
+    (r"^https://www\.pixiv\.net/ajax/search/", 300),
+    (r"^https://danbooru\.donmai\.us/posts/\d+\.json", 7 * 24 * 3600),
+    (r"^https://danbooru\.donmai\.us/posts\.json", 60),
+]
+# The body is stored decoded, these would describe the wire format instead
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie')
+
+class HttpCache():
+    """On-disk HTTP cache of compressed response bodies with their validators.
+
+    Entries are keyed by url and cookies, served locally while fresh, revalidated with
+    conditional requests once their ttl is over and evicted least recently used first
+    when the compressed bodies grow over max_bytes.
+    """
+
+    def __init__(self,db_path: str,max_bytes: int = MAX_CACHE_BYTES,ttl_rules: list = None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in (ttl_rules or DEFAULT_TTL_RULES)]
+        self.lock = Lock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evicted': 0}
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT,
+                    status INTEGER,
+                    headers TEXT,
+                    body BLOB,
+                    etag TEXT,
+                    last_modified TEXT,
+                    expires_at REAL,
+                    accessed_at REAL,
+                    size INTEGER
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def ttl_for(self,url: str):
+        """The ttl of the first matching rule, None when the url is not cached at all."""
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def key_for(self,request):
+        # Logged in and anonymous sessions see different pages, keep them apart
+        cookie = request.headers.get('Cookie', '')
+        return hashlib.sha1(f"{request.url}\n{cookie}".encode()).hexdigest()
+
+    def get(self,key: str):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT url, status, headers, body, etag, last_modified, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        url, status, headers, body, etag, last_modified, expires_at = row
+        return {
+            'url': url,
+            'status': status,
+            'headers': json.loads(headers),
+            'body': zlib.decompress(body),
+            'etag': etag,
+            'last_modified': last_modified,
+            'expires_at': expires_at,
+        }
+
+    def put(self,key: str,url: str,response,ttl: float):
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+        body = zlib.compress(response.content, COMPRESS_LEVEL)
+        now = time.time()
+        with self.lock, self.connection:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, response.status_code, json.dumps(headers), body, response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'), now + ttl, now, len(body))
+            )
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def refresh(self,key: str,ttl: float):
+        """A 304 confirmed the entry, serve it locally for another ttl."""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?", (now + ttl, now, key))
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats['evicted'] += len(evicted)
+
+    def count(self,stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_CACHES = {}
+_CACHES_LOCK = Lock()
+_CACHE_PATH = None      # chosen by the entry point with use_cache(), nothing is cached until then
+
+def shared_cache(db_path: str):
+    """Process-wide cache per database file so every scraper session writes to one connection."""
+    with _CACHES_LOCK:
+        if db_path not in _CACHES:
+            _CACHES[db_path] = HttpCache(db_path)
+        return _CACHES[db_path]
+
+def cache_path_for(setting,output_dir: str):
+    """Database of a job's cache: under output_dir for True or None, the path itself for a str, none for False or ''."""
+    if setting is None or setting is True:
+        return os.path.join(output_dir, DEFAULT_CACHE_NAME)
+    return setting or None
+
+def use_cache(db_path: str):
+    """Points the CachingAdapters without a cache of their own at db_path, None turns caching off.
+
+    Sessions outlive a job in the SESSIONS registry, so the cache is looked up per request
+    and a later job with another output dir gets its own.
+    """
+    global _CACHE_PATH
+    with _CACHES_LOCK:
+        _CACHE_PATH = db_path
+
+def current_cache():
+    """The HttpCache chosen with use_cache(), None while caching is off."""
+    db_path = _CACHE_PATH
+    return shared_cache(db_path) if db_path else None
+
+class CachingAdapter(RateLimitedAdapter):
+    """RateLimitedAdapter that answers GETs of cached endpoints from an HttpCache.
+
+    Fresh entries never reach the network nor the rate limiter, stale ones are revalidated
+    with If-None-Match/If-Modified-Since and a 304 is answered with the stored body.
+    """
+
+    def __init__(self,cache: HttpCache = None,**kwargs):
+        self.cache = cache      # None follows use_cache()
+        super().__init__(**kwargs)
+
+    def _cached_response(self,request,entry: dict):
+        response = Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry['body']
+        response.url = request.url
+        response.request = request
+        response.reason = "OK (cached)"
+        response.connection = self
+        return response
+
+    def send(self,request,**kwargs):
+        cache = self.cache or current_cache()
+        ttl = cache.ttl_for(request.url) if cache and request.method == 'GET' else None
+        if ttl is None or 'Range' in request.headers:
+            return super().send(request, **kwargs)
+        key = cache.key_for(request)
+        entry = cache.get(key)
+        if entry and entry['expires_at'] > time.time():
+            cache.count('hits')
+            return self._cached_response(request, entry)
+        if entry and entry['etag']:
+            request.headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry:
+            response.close()
+            cache.refresh(key, ttl)
+            cache.count('revalidated')
+            return self._cached_response(request, entry)
+        cache.count('misses')
+        if response.status_code == 200 and 'no-store' not in response.headers.get('Cache-Control', ''):
+            cache.put(key, request.url, response, ttl)
+        return response
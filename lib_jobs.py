@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.parse
+
+from lib_dedup_store import DedupStore, DEFAULT_INDEX_NAME
+from lib_postprocess import Postprocessor
+from lib_shards import count_samples
+from lib_metadata_store import MetadataStore, DEFAULT_METADATA_NAME
+from lib_metrics import DOWNLOADED_BYTES
+from lib_download import BYTE_BUDGET
+
+# Run from the repo root : python -m lib_jobs zerochan "Hatsune Miku" 200 --output-dir ../scraped_datasets
+
+SITES = ('pixiv', 'zerochan', 'danbooru', 'pinterest')
+DEFAULT_OUTPUT_DIR = "../scraped_datasets"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+def count_images_os(folder_path):
+    # Folders scraped in shards mode are counted from their manifests instead of a directory scan
+    samples = count_samples(folder_path)
+    if samples is not None:
+        return samples
+    if not os.path.isdir(folder_path):
+        return 0
+    return sum(1 for file in os.listdir(folder_path) if file.lower().endswith(IMAGE_EXTENSIONS))
+
+def _downloaded_bytes():
+    return sum(DOWNLOADED_BYTES.samples().values())
+
+def make_scraper(config: dict,output_folder: str,dedup_store=None,postprocessor=None,metadata_store=None):
+    """Builds the scraper of config['site'], importing only that site's module."""
+    tag = config['tag']
+    common = dict(
+        tag=tag,
+        max_images_posts=int(config['count']),
+        page_idx=int(config.get('page_idx', 1)),
+        output_folder=output_folder,
+        file_name=urllib.parse.unquote(tag),
+        download_backend=config.get('download_backend', 'threads'),
+        dedup_store=dedup_store,
+        incremental=bool(config.get('incremental', False)),
+        postprocessor=postprocessor,
+        output_mode=config.get('output_mode', 'files'),
+        metadata_store=metadata_store
+    )
+    if config['site'] == 'pixiv':
+        from lib_cookies import PixivCookies
+        from pixiv_scraper.pixiv_api_scraper import PixivScraper
+        scraper = PixivScraper(browser=config.get('browser', 'chrome').lower(), pixiv_cookies_manager=PixivCookies(), **common)
+    elif config['site'] == 'zerochan':
+        from zerochan_scraper.zerochan_api_scraper import ZeroChanScraper
+        scraper = ZeroChanScraper(**common)
+    elif config['site'] == 'danbooru':
+        from danbooru_scraper.danbooru_api_scraper import DanbooruScraper
+        scraper = DanbooruScraper(stopped_at_download_idx=0, **common)
+    else:
+        # The Pinterest scraper scrolls a browser feed, it has no pipeline, pages or checkpoints
+        from pinterest_scraper.pinterest_scraper import PinterestScraper
+        return PinterestScraper(tag, output_folder, urllib.parse.unquote(tag), int(config['count']), dedup_store)
+    if config.get('src_workers'):
+        scraper.src_workers = int(config['src_workers'])
+    if config.get('download_workers'):
+        scraper.download_workers = int(config['download_workers'])
+    scraper.probe_sizes = bool(config.get('probe_sizes', False))
+    if config.get('byte_budget_mb') is not None:
+        scraper.byte_budget = int(float(config['byte_budget_mb']) * 1024 * 1024)
+    return scraper
+
+def run_job(config: dict):
+    """Runs one scrape job from a plain dict and returns what happened as a dict.
+
+    Required keys:
+        site, tag, count
+
+    Optional keys, most mirror a flag of the CLI below:
+        output_dir          --output-dir
+        output_folder       overrides output_dir/<tag>_scraped
+        page_idx            --page-idx
+        browser             --browser
+        download_backend    --backend
+        incremental         --incremental
+        output_mode         --output-mode
+        check_images        the opposite of --no-check
+        src_workers         workers of the srcs stage
+        download_workers    workers of the download stage
+        probe_sizes         --probe-sizes
+        byte_budget_mb      --byte-budget-mb
+        max_in_flight_mb    --max-in-flight-mb, process wide
+        http_cache          --http-cache, or False for --no-http-cache
+
+    Nothing here imports a GUI, so it runs the same from a script, a cron job or app.py.
+    The bytes are counted process wide, jobs running side by side in one process share them.
+    """
+    site = str(config.get('site', '')).lower()
+    if site not in SITES:
+        raise ValueError(f"Unknown site {config.get('site')}, expected one of {SITES}")
+    if not config.get('tag') or int(config.get('count', 0)) <= 0:
+        raise ValueError("A job needs a tag and a positive count")
+    config = {**config, 'site': site}
+    # The GUI passes its entry even when it is empty
+    output_dir = config.get('output_dir') or DEFAULT_OUTPUT_DIR
+    output_folder = config.get('output_folder') or os.path.join(output_dir, f"{config['tag']}_scraped")
+    result = {
+        'site': site,
+        'tag': config['tag'],
+        'output_folder': output_folder,
+        'status': 'failed',
+        'pages': 0,
+        'posts': 0,
+        'srcs': 0,
+        'downloaded': 0,
+        'failed': 0,
+        'images_on_disk': 0,
+        'bytes': 0,
+        'seconds': 0.0,
+        'error': None,
+    }
+    if config.get('max_in_flight_mb'):
+        BYTE_BUDGET.set_limit(int(float(config['max_in_flight_mb']) * 1024 * 1024))
+    dedup_store, postprocessor, metadata_store = None, None, None
+    begin_time = time.time()
+    begin_bytes = _downloaded_bytes()
+    try:
+        # One index per output directory so overlapping tags reuse each other's images
+        os.makedirs(output_dir, exist_ok=True)
+        from lib_http_cache import use_cache, cache_path_for
+        use_cache(cache_path_for(config.get('http_cache'), output_dir))
+        dedup_store = DedupStore(os.path.join(output_dir, DEFAULT_INDEX_NAME))
+        postprocessor = Postprocessor(dedup_store=dedup_store) if config.get('check_images', True) else None
+        metadata_store = MetadataStore(os.path.join(output_dir, DEFAULT_METADATA_NAME))
+        scraper = make_scraper(config, output_folder, dedup_store, postprocessor, metadata_store)
+        scraper.scrape()
+        stats = scraper.stats
+        if stats is None:
+            # The scrapers print and swallow their own errors, no stats means the run never finished
+            result['error'] = "scrape did not finish, see the log"
+        else:
+            for key in ('pages', 'posts', 'srcs', 'downloaded', 'failed'):
+                result[key] = stats.get(key, 0)
+            result['status'] = 'ok' if stats.get('failed', 0) == 0 else 'partial'
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        print(f"Error Occured in Job {site} {config['tag']} : {e}")
+    finally:
+        if postprocessor:
+            postprocessor.close()
+        if metadata_store:
+            metadata_store.close()
+        if dedup_store:
+            dedup_store.close()
+    result['seconds'] = round(time.time() - begin_time, 2)
+    result['bytes'] = int(_downloaded_bytes() - begin_bytes)
+    result['images_on_disk'] = count_images_os(output_folder)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scrape jobs without the GUI, the results are printed as JSON")
+    parser.add_argument("site", nargs="?", choices=SITES)
+    parser.add_argument("tag", nargs="?")
+    parser.add_argument("count", nargs="?", type=int, help="posts to scrape")
+    parser.add_argument("--config", help="JSON file with one job config or a list of them, instead of site tag count")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--page-idx", type=int, default=1)
+    parser.add_argument("--browser", choices=['chrome', 'firefox'], default='chrome', help="browser of the Pixiv login")
+    parser.add_argument("--backend", choices=['threads', 'async'], default='threads')
+    parser.add_argument("--incremental", action="store_true", help="only scrape posts newer than the last run of the tag")
+    parser.add_argument("--output-mode", choices=['files', 'shards'], default='files')
+    parser.add_argument("--no-check", action="store_true", help="skip the integrity and extension checks of the downloaded images")
+    parser.add_argument("--probe-sizes", action="store_true", help="HEAD the images the listing gave no size for, so large ones are scheduled apart")
+    parser.add_argument("--byte-budget-mb", type=float, help="download smaller renditions of large images once a job would go over this many MB")
+    parser.add_argument("--max-in-flight-mb", type=float, help="MB of image transfers in progress at once across all jobs and backends")
+    parser.add_argument("--http-cache", help="database of the search and post pages cache, <output-dir>/http_cache.sqlite by default")
+    parser.add_argument("--no-http-cache", action="store_true", help="send every request to the network")
+    parser.add_argument("--report", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.config:
+        with open(args.config, 'r') as file:
+            configs = json.load(file)
+        configs = configs if isinstance(configs, list) else [configs]
+    elif args.site and args.tag and args.count:
+        configs = [{'site': args.site, 'tag': args.tag, 'count': args.count}]
+    else:
+        parser.error("give site tag count, or --config")
+    defaults = {
+        'output_dir': args.output_dir,
+        'page_idx': args.page_idx,
+        'browser': args.browser,
+        'download_backend': args.backend,
+        'incremental': args.incremental,
+        'output_mode': args.output_mode,
+        'check_images': not args.no_check,
+        'probe_sizes': args.probe_sizes,
+        'byte_budget_mb': args.byte_budget_mb,
+        'max_in_flight_mb': args.max_in_flight_mb,
+        'http_cache': False if args.no_http_cache else args.http_cache,
+    }
+    results = [run_job({**defaults, **config}) for config in configs]
+    print(json.dumps(results, indent=2))
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(results, file, indent=2)
+    # Cron and CI see a failed job in the exit code
+    sys.exit(0 if all(result['status'] != 'failed' for result in results) else 1)
@@ -0,0 +1,196 @@
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+import importlib.util
+from threading import Lock
+
+DEFAULT_METADATA_NAME = "scraped_metadata.sqlite"
+BATCH_SIZE = 500            # records written per transaction
+FLUSH_INTERVAL = 1.0        # seconds a partial batch waits before it is written anyway
+# Columns every site fills the same way, anything else a scraper reports goes to 'extra' as JSON
+COLUMNS = ('site', 'post_id', 'query', 'source_url', 'location', 'title', 'author', 'author_id', 'tags', 'rating', 'width', 'height', 'md5', 'score', 'created', 'page_url', 'extra', 'scraped_at')
+RECORD_FIELDS = ('title', 'author', 'author_id', 'rating', 'width', 'height', 'md5', 'score', 'created', 'page_url')
+_STOP = object()
+
+class MetadataStore():
+    """Append-only store of one metadata record per downloaded image.
+
+    Scrapers hand records to add(), which only queues them; a background thread writes
+    them to SQLite in batches, so a slow disk never holds a download thread. Tags get a
+    table of their own so query() can select a subset by tags, site, rating or size
+    without touching an image file, and export_parquet() writes the table as Parquet
+    when pyarrow is installed.
+    """
+
+    def __init__(self,db_path: str = DEFAULT_METADATA_NAME,batch_size: int = BATCH_SIZE,flush_interval: float = FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = Lock()
+        self.records = 0
+        self.pending = queue.Queue()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    id INTEGER PRIMARY KEY,
+                    site TEXT,
+                    post_id TEXT,
+                    query TEXT,
+                    source_url TEXT,
+                    location TEXT,
+                    title TEXT,
+                    author TEXT,
+                    author_id TEXT,
+                    tags TEXT,
+                    rating TEXT,
+                    width INTEGER,
+                    height INTEGER,
+                    md5 TEXT,
+                    score INTEGER,
+                    created TEXT,
+                    page_url TEXT,
+                    extra TEXT,
+                    scraped_at REAL
+                )
+            """)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS image_tags (image_id INTEGER, tag TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS images_post ON images (site, post_id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS images_query ON images (query)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS image_tags_tag ON image_tags (tag, image_id)")
+        self.writer = threading.Thread(target=self._write_batches, daemon=True)
+        self.writer.start()
+
+    def add(self,site: str,post_id,source_url: str,location: str,query: str = None,metadata: dict = None):
+        """Queues the record of one image, never blocks on the database."""
+        self.pending.put((site, post_id, source_url, location, query, dict(metadata or {}), time.time()))
+
+    def _row(self,record: tuple):
+        site, post_id, source_url, location, query, metadata, scraped_at = record
+        tags = metadata.pop('tags', None) or []
+        if isinstance(tags, str):
+            tags = tags.split()
+        row = {field: metadata.pop(field, None) for field in RECORD_FIELDS}
+        row.update({
+            'site': site,
+            'post_id': str(post_id),
+            'query': query,
+            'source_url': source_url,
+            'location': location,
+            'tags': " ".join(tags),
+            'extra': json.dumps(metadata, default=str) if metadata else None,
+            'scraped_at': scraped_at,
+        })
+        return tuple(row[column] for column in COLUMNS), tags
+
+    def _write(self,batch: list):
+        with self.lock, self.connection:
+            for record in batch:
+                row, tags = self._row(record)
+                cursor = self.connection.execute(f"INSERT INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", row)
+                self.connection.executemany("INSERT INTO image_tags VALUES (?, ?)", [(cursor.lastrowid, tag) for tag in tags])
+            self.records += len(batch)
+
+    def _write_batches(self):
+        while True:
+            batch = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                    self.pending.task_done()
+                    break
+                batch.append(record)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"Error writing {len(batch)} metadata records : {e}")
+                for _ in batch:
+                    self.pending.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Waits until every queued record is in the database."""
+        self.pending.join()
+
+    def query(self,site: str = None,tags: list = None,query: str = None,rating: str = None,min_width: int = None,min_height: int = None,limit: int = None):
+        """Records matching every given filter, `tags` must all be on an image."""
+        self.flush()
+        conditions, params = [], []
+        for column, value in (('site', site), ('query', query), ('rating', rating)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if min_width:
+            conditions.append("width >= ?")
+            params.append(min_width)
+        if min_height:
+            conditions.append("height >= ?")
+            params.append(min_height)
+        if tags:
+            conditions.append(f"id IN (SELECT image_id FROM image_tags WHERE tag IN ({', '.join('?' * len(tags))}) GROUP BY image_id HAVING COUNT(DISTINCT tag) = ?)")
+            params += [*tags, len(set(tags))]
+        sql = f"SELECT {', '.join(COLUMNS)} FROM images" + (f" WHERE {' AND '.join(conditions)}" if conditions else "") + " ORDER BY id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            record['extra'] = json.loads(record['extra']) if record['extra'] else {}
+            records.append(record)
+        return records
+
+    def export_parquet(self,path: str,**filters):
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("Parquet export requires pyarrow, install it with 'pip install pyarrow'")
+        import pyarrow
+        import pyarrow.parquet as pyarrow_parquet
+        records = self.query(**filters)
+        for record in records:
+            record['extra'] = json.dumps(record['extra']) if record['extra'] else None
+        pyarrow_parquet.write_table(pyarrow.Table.from_pylist(records), path)
+        return len(records)
+
+    def close(self):
+        self.pending.put(_STOP)
+        self.writer.join()
+        with self.lock:
+            self.connection.close()
+        print(f"Metadata store wrote {self.records} records")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select scraped images by their metadata")
+    parser.add_argument("command", choices=['query', 'export'])
+    parser.add_argument("output", nargs="?", help="Parquet file written by export")
+    parser.add_argument("--db", default=DEFAULT_METADATA_NAME)
+    parser.add_argument("--site", choices=['pixiv', 'zerochan', 'danbooru', 'pinterest'])
+    parser.add_argument("--tags", nargs="+", help="tags every selected image must have")
+    parser.add_argument("--query", help="the tag the images were scraped for")
+    parser.add_argument("--rating", choices=['general', 'sensitive', 'questionable', 'explicit', 'r18', 'r18g'])
+    parser.add_argument("--min-width", type=int)
+    parser.add_argument("--min-height", type=int)
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    store = MetadataStore(args.db)
+    filters = dict(site=args.site, tags=args.tags, query=args.query, rating=args.rating, min_width=args.min_width, min_height=args.min_height, limit=args.limit)
+    if args.command == 'export':
+        print(f"Exported {store.export_parquet(args.output, **filters)} records to {args.output}")
+    else:
+        for record in store.query(**filters):
+            print(f"{record['location']}\t{record['site']}\t{record['post_id']}\t{record['width']}x{record['height']}\t{record['tags']}")
+    store.close()
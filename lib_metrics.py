@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import bisect
+import threading
+from threading import Lock
+
+METRICS_PORT_ENV = "SCRAPER_METRICS_PORT"       # serve /metrics (Prometheus text) and /summary (JSON) on this port
+METRICS_JSON_ENV = "SCRAPER_METRICS_JSON"       # write the JSON summary to this path when a pipeline finishes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.9, 0.99)
+
+def _label_key(labels: dict):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _render_labels(key: tuple,extra: tuple = ()):
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Counter():
+
+    def __init__(self,name: str,help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self,amount: float = 1.0,**labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self.lock:
+            return dict(self.values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.samples().items():
+            lines.append(f"{self.name}{_render_labels(key)} {value}")
+        return lines
+
+    def summary(self):
+        return {_render_labels(key) or "total": value for key, value in self.samples().items()}
+
+class Gauge():
+    """A value set by the code, or read from a callback returning {labels tuple: value} at scrape time."""
+
+    def __init__(self,name: str,help_text: str,callback=None):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.values = {}
+        self.lock = Lock()
+
+    def set(self,value: float,**labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.callback:
+            try:
+                return {_label_key(labels): value for labels, value in self.callback()}
+            except Exception:
+                return {}
+        with self.lock:
+            return dict(self.values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in self.samples().items():
+            lines.append(f"{self.name}{_render_labels(key)} {value}")
+        return lines
+
+    def summary(self):
+        return {_render_labels(key) or "value": value for key, value in self.samples().items()}
+
+class Histogram():
+
+    def __init__(self,name: str,help_text: str,buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.series = {}    # labels -> [bucket counts..., +Inf count], sum, count
+        self.lock = Lock()
+
+    def observe(self,value: float,**labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['buckets'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def time(self,**labels):
+        return _Timer(self, labels)
+
+    def _series(self):
+        with self.lock:
+            return {key: {'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']} for key, series in self.series.items()}
+
+    def _quantile(self,series: dict,quantile: float):
+        # Linear interpolation inside the bucket holding the quantile, like histogram_quantile()
+        rank = quantile * series['count']
+        cumulative = 0
+        for idx, count in enumerate(series['buckets']):
+            if cumulative + count >= rank and count:
+                if idx == len(self.buckets):
+                    # Nothing bounds the +Inf bucket, its lower bound is all we know (Prometheus does the same)
+                    return self.buckets[-1]
+                lower = self.buckets[idx - 1] if idx > 0 else 0.0
+                return lower + (self.buckets[idx] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self._series().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series['buckets']):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else bound
+                lines.append(f"{self.name}_bucket{_render_labels(key, (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_render_labels(key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_render_labels(key)} {series['count']}")
+        return lines
+
+    def summary(self):
+        result = {}
+        for key, series in self._series().items():
+            entry = {'count': series['count'], 'mean': round(series['sum'] / series['count'], 4) if series['count'] else None}
+            for quantile in QUANTILES:
+                value = self._quantile(series, quantile)
+                entry[f"p{int(quantile * 100)}"] = round(value, 4) if value is not None else None
+            result[_render_labels(key) or "all"] = entry
+        return result
+
+class _Timer():
+
+    def __init__(self,histogram: Histogram,labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.begin_time = time.perf_counter()
+        return self
+
+    def __exit__(self,*exc_info):
+        self.histogram.observe(time.perf_counter() - self.begin_time, **self.labels)
+        return False
+
+class MetricsRegistry():
+    """Process-wide registry of counters, gauges and histograms.
+
+    Metrics are exposed in the Prometheus text format over a local HTTP endpoint and
+    as a JSON summary (counts, means and p50/p90/p99 estimated from the buckets).
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = Lock()
+        self.started_at = time.time()
+        self.server = None
+
+    def _register(self,metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self,name: str,help_text: str):
+        return self._register(Counter(name, help_text))
+
+    def gauge(self,name: str,help_text: str,callback=None):
+        return self._register(Gauge(name, help_text, callback))
+
+    def histogram(self,name: str,help_text: str,buckets: tuple = LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def summary(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        uptime = time.time() - self.started_at
+        summary = {'uptime_seconds': round(uptime, 2)}
+        summary.update({metric.name: metric.summary() for metric in metrics})
+        downloaded_bytes = sum(DOWNLOADED_BYTES.samples().values())
+        summary['bytes_per_second'] = round(downloaded_bytes / uptime, 1) if uptime else None
+        return summary
+
+    def write_summary(self,path: str):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def serve(self,port: int,host: str = "127.0.0.1"):
+        if self.server:
+            return self.server
+        # http.server costs more to import than the rest of the scraper, only the endpoint needs it
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/summary"):
+                    body, content_type = json.dumps(registry.summary()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, content_type = registry.render().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self,*args):
+                pass
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Metrics served on http://{host}:{port}/metrics")
+        return self.server
+
+    def serve_from_env(self):
+        """Starts the endpoint once when SCRAPER_METRICS_PORT is set, a no-op otherwise."""
+        port = os.getenv(METRICS_PORT_ENV)
+        if port and not self.server:
+            try:
+                self.serve(int(port))
+            except (OSError, ValueError) as e:
+                print(f"Metrics endpoint not started : {e}")
+
+    def dump_from_env(self):
+        path = os.getenv(METRICS_JSON_ENV)
+        if path:
+            self.write_summary(path)
+
+METRICS = MetricsRegistry()
+
+# The metrics of the hot paths, shared by every module
+STAGE_SECONDS = METRICS.histogram("scraper_stage_seconds", "Latency of the scraping stages, cookie load and driver startup")
+STAGE_ITEMS = METRICS.counter("scraper_stage_items_total", "Items processed per stage and outcome")
+HTTP_REQUESTS = METRICS.counter("scraper_http_requests_total", "HTTP responses per host and status code")
+HTTP_RETRIES = METRICS.counter("scraper_http_retries_total", "Retries urllib3 made inside a request, per host and status")
+HTTP_SECONDS = METRICS.histogram("scraper_http_request_seconds", "Latency of HTTP requests per host")
+DOWNLOADED_BYTES = METRICS.counter("scraper_downloaded_bytes_total", "Image bytes written to disk")
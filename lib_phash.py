@@ -0,0 +1,341 @@
+import os
+import math
+import time
+import sqlite3
+import argparse
+import itertools
+import importlib.util
+import concurrent.futures as THREAD
+from array import array
+from threading import Lock
+
+# Pillow is only imported by the functions decoding images, finding it does not load it
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+
+DEFAULT_PHASH_INDEX_NAME = "phash_index.sqlite"
+DEFAULT_THRESHOLD = 6       # differing bits out of 64 still counted as the same picture
+HASH_BITS = 64
+CHUNKS = 4                  # multi-index hashing splits every hash in 4 chunks of 16 bits
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+PHASH_SIZE = 32
+PHASH_LOW = 8
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+SKIPPED_FOLDERS = ('thumbnails', 'processed')     # derivatives written by lib_postprocess
+BATCH_COMMIT = 1000
+
+# Cosines of the 8 lowest DCT-II frequencies over 32 samples, shared by every pHash
+_DCT = [[math.cos(math.pi * (2 * x + 1) * u / (2 * PHASH_SIZE)) for x in range(PHASH_SIZE)] for u in range(PHASH_LOW)]
+
+def hamming(a: int,b: int):
+    return (a ^ b).bit_count()
+
+def _to_signed(image_hash: int):
+    # SQLite integers are signed 64 bits
+    return image_hash - (1 << 64) if image_hash >= 1 << 63 else image_hash
+
+def _to_unsigned(image_hash: int):
+    return image_hash + (1 << 64) if image_hash < 0 else image_hash
+
+def dhash_from_pixels(pixels: list):
+    """Difference hash of a 9x8 grayscale grid: one bit per horizontal gradient sign."""
+    image_hash = 0
+    for row in range(8):
+        for col in range(8):
+            image_hash = (image_hash << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return image_hash
+
+def phash_from_pixels(pixels: list):
+    """DCT hash of a 32x32 grayscale grid: the 8x8 lowest frequencies against their median."""
+    # Separable DCT, only the 8 lowest frequencies of each axis are ever needed
+    rows = [[sum(pixels[y * PHASH_SIZE + x] * _DCT[v][x] for x in range(PHASH_SIZE)) for v in range(PHASH_LOW)] for y in range(PHASH_SIZE)]
+    coefficients = [sum(_DCT[u][y] * rows[y][v] for y in range(PHASH_SIZE)) for u in range(PHASH_LOW) for v in range(PHASH_LOW)]
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]     # the DC term only measures brightness
+    image_hash = 0
+    for coefficient in coefficients:
+        image_hash = (image_hash << 1) | (coefficient > median)
+    return image_hash
+
+def _grayscale(image,width: int,height: int):
+    from PIL import Image
+    # Lets the JPEG decoder downscale by itself instead of decoding every full resolution pixel
+    image.draft('L', (width * 4, height * 4))
+    return list(image.convert('L').resize((width, height), Image.LANCZOS).getdata())
+
+def hash_image(image_path: str,algorithm: str = 'phash'):
+    """Returns (hash, pixels count) of an image file, or None when it can not be decoded.
+
+    Top level so a process pool can run it.
+    """
+    try:
+        from PIL import Image
+        with Image.open(image_path) as image:
+            pixels_count = image.width * image.height
+            if algorithm == 'dhash':
+                return dhash_from_pixels(_grayscale(image, 9, 8)), pixels_count
+            return phash_from_pixels(_grayscale(image, PHASH_SIZE, PHASH_SIZE)), pixels_count
+    except Exception as e:
+        print(f"Error hashing {image_path}: {e}")
+        return None
+
+def _hash_file(job: tuple):
+    image_path, algorithm = job
+    return image_path, hash_image(image_path, algorithm)
+
+def _chunk_probes(radius: int):
+    """Every 16 bit xor mask with at most radius bits set."""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in itertools.combinations(range(CHUNK_BITS), bits):
+            masks.append(sum(1 << position for position in positions))
+    return masks
+
+class MultiIndexHash():
+    """In memory near neighbour search over 64 bit hashes.
+
+    Hashes live in one array('Q') and every 16 bit chunk of them in its own table of
+    chunk value -> array('I') of positions. Two hashes within `threshold` bits share at
+    least one chunk within threshold // 4 bits, so only those buckets get compared.
+    """
+
+    def __init__(self,threshold: int = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.hashes = array('Q')
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.probes = _chunk_probes(threshold // CHUNKS)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self,image_hash: int):
+        position = len(self.hashes)
+        self.hashes.append(image_hash)
+        for chunk, table in enumerate(self.tables):
+            value = (image_hash >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            bucket = table.get(value)
+            if bucket is None:
+                bucket = table[value] = array('I')
+            bucket.append(position)
+        return position
+
+    def search(self,image_hash: int,threshold: int = None):
+        """Returns [(position, distance)] of the stored hashes within threshold bits, closest first."""
+        threshold = self.threshold if threshold is None else threshold
+        probes = self.probes if threshold // CHUNKS == self.threshold // CHUNKS else _chunk_probes(threshold // CHUNKS)
+        candidates = set()
+        for chunk, table in enumerate(self.tables):
+            value = (image_hash >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            for mask in probes:
+                bucket = table.get(value ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        matches = []
+        for position in candidates:
+            distance = hamming(self.hashes[position], image_hash)
+            if distance <= threshold:
+                matches.append((position, distance))
+        return sorted(matches, key=lambda match: match[1])
+
+class PerceptualIndex():
+    """Persistent near-duplicate index of the images of the output folders.
+
+    Hashes are kept in SQLite next to their path, site and resolution, and loaded into
+    a MultiIndexHash on open so a lookup only compares a few buckets even over millions
+    of images. New downloads are checked as they land through the Postprocessor, whole
+    folders with dedupe_folders() or `py -m lib_phash dedupe`.
+    """
+
+    def __init__(self,db_path: str = DEFAULT_PHASH_INDEX_NAME,algorithm: str = 'phash',threshold: int = DEFAULT_THRESHOLD):
+        if algorithm not in ('phash', 'dhash'):
+            raise ValueError(f"Unknown perceptual hash {algorithm}, expected 'phash' or 'dhash'")
+        self.db_path = db_path
+        self.algorithm = algorithm
+        self.threshold = threshold
+        self.lock = Lock()
+        self.near_duplicates = 0
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS hashes (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE,
+                    site TEXT,
+                    post_id TEXT,
+                    hash INTEGER,
+                    pixels INTEGER,
+                    size INTEGER,
+                    created_at REAL
+                )
+            """)
+            stored = self.connection.execute("SELECT value FROM meta WHERE key = 'algorithm'").fetchone()
+            if stored and stored[0] != algorithm:
+                raise ValueError(f"{db_path} holds {stored[0]} hashes, not {algorithm}")
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('algorithm', ?)", (algorithm,))
+        self.index = MultiIndexHash(threshold)
+        self.ids = array('q')       # position in the index -> row id, -1 once forgotten
+        self.positions = {}         # path -> position
+        self.paths = []
+        for row_id, path, image_hash in self.connection.execute("SELECT id, path, hash FROM hashes ORDER BY id"):
+            self._remember(row_id, path, _to_unsigned(image_hash))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _remember(self,row_id: int,path: str,image_hash: int):
+        self.positions[path] = self.index.add(image_hash)
+        self.ids.append(row_id)
+        self.paths.append(path)
+
+    def _matches(self,image_hash: int,threshold: int = None,exclude: str = None):
+        return [(self.paths[position], distance) for position, distance in self.index.search(image_hash, threshold)
+                if self.ids[position] >= 0 and self.paths[position] != exclude]
+
+    def lookup(self,image_hash: int,threshold: int = None):
+        """Returns [(path, distance)] of the indexed images close to image_hash, closest first."""
+        with self.lock:
+            return self._matches(image_hash, threshold)
+
+    def add(self,image_path: str,image_hash: int,pixels: int = 0,site: str = None,post_id=None,only_if_new: bool = False,commit: bool = True):
+        """Indexes an image and returns the near duplicates it already had.
+
+        With only_if_new the image is left out of the index when it has any, so the
+        caller can drop the file and point at the earlier copy instead.
+        """
+        with self.lock:
+            matches = self._matches(image_hash, exclude=image_path)
+            if matches:
+                self.near_duplicates += 1
+                if only_if_new:
+                    return matches
+            size = os.path.getsize(image_path) if os.path.exists(image_path) else 0
+            cursor = self.connection.execute(
+                "INSERT OR REPLACE INTO hashes (path, site, post_id, hash, pixels, size, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (image_path, site, None if post_id is None else str(post_id), _to_signed(image_hash), pixels, size, time.time())
+            )
+            if commit:
+                self.connection.commit()
+            if image_path in self.positions:
+                self.ids[self.positions.pop(image_path)] = -1
+            self._remember(cursor.lastrowid, image_path, image_hash)
+        return matches
+
+    def check(self,image_path: str,site: str = None,post_id=None,only_if_new: bool = False):
+        """Hashes an image file and indexes it, see add()."""
+        if not HAS_PILLOW:
+            raise ImportError("Perceptual hashing requires Pillow, install it with 'pip install pillow'")
+        hashed = hash_image(image_path, self.algorithm)
+        if hashed is None:
+            return []
+        return self.add(image_path, hashed[0], hashed[1], site, post_id, only_if_new)
+
+    def forget(self,image_path: str):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM hashes WHERE path = ?", (image_path,))
+            position = self.positions.pop(image_path, None)
+            if position is not None:
+                self.ids[position] = -1
+
+    def details(self,paths: list):
+        """Returns {path: (pixels, bytes)} of indexed images."""
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT path, pixels, size FROM hashes WHERE path IN ({','.join('?' * len(paths))})", paths
+            ).fetchall()
+        return {path: (pixels or 0, size or 0) for path, pixels, size in rows}
+
+    def dedupe_folders(self,folders: list,action: str = 'report',workers: int = None):
+        """Hashes every image of the folders not indexed yet and groups the near duplicates.
+
+        Each group keeps its largest image (pixels then bytes); with action='remove' the
+        others are deleted. Returns [{'keep': path, 'duplicates': [paths]}].
+        """
+        if not HAS_PILLOW:
+            raise ImportError("Perceptual hashing requires Pillow, install it with 'pip install pillow'")
+        image_paths = []
+        for folder in folders:
+            for root, dirs, files in os.walk(folder):
+                dirs[:] = [name for name in dirs if name not in SKIPPED_FOLDERS]
+                image_paths += [os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS)]
+        fresh = [path for path in image_paths if path not in self.positions]
+        print(f"Hashing {len(fresh)} new images out of {len(image_paths)}")
+
+        # Union find over every match, so chains of close images end up in one group
+        parents = {}
+        def find(path):
+            while parents.get(path, path) != path:
+                parents[path] = parents.get(parents[path], parents[path])
+                path = parents[path]
+            return path
+        def union(a, b):
+            parents.setdefault(a, a)
+            parents.setdefault(b, b)
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parents[root_b] = root_a
+
+        import multiprocessing
+        with THREAD.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            jobs = ((path, self.algorithm) for path in fresh)
+            for count, (image_path, hashed) in enumerate(executor.map(_hash_file, jobs, chunksize=64), start=1):
+                if hashed is not None:
+                    for match_path, _ in self.add(image_path, hashed[0], hashed[1], commit=False):
+                        union(match_path, image_path)
+                if count % BATCH_COMMIT == 0:
+                    with self.lock:
+                        self.connection.commit()
+        with self.lock:
+            self.connection.commit()
+        # Images indexed by earlier runs can still pair with each other
+        for image_path in image_paths:
+            position = self.positions.get(image_path)
+            if position is not None and image_path not in parents:
+                for match_path, _ in self._matches(self.index.hashes[position], exclude=image_path):
+                    union(match_path, image_path)
+
+        groups = {}
+        for path in parents:
+            groups.setdefault(find(path), []).append(path)
+        report = []
+        for paths in groups.values():
+            details = self.details(paths)
+            paths.sort(key=lambda path: details.get(path, (0, 0)), reverse=True)
+            report.append({'keep': paths[0], 'duplicates': paths[1:]})
+            if action == 'remove':
+                for path in paths[1:]:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        print(f"Error removing {path}: {e}")
+                    self.forget(path)
+        print(f"Found {len(report)} groups holding {sum(len(group['duplicates']) for group in report)} near duplicates")
+        return report
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        print(f"Perceptual index holds {len(self.positions)} images, {self.near_duplicates} near duplicates seen")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate detection over scraped images with perceptual hashes")
+    parser.add_argument("command", choices=['dedupe', 'query'])
+    parser.add_argument("paths", nargs="+", help="folders to dedupe, or images to look up")
+    parser.add_argument("--index", default=DEFAULT_PHASH_INDEX_NAME)
+    parser.add_argument("--algorithm", choices=['phash', 'dhash'], default='phash')
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD, help="differing bits out of 64 still counted as near duplicates")
+    parser.add_argument("--action", choices=['report', 'remove'], default='report', help="what dedupe does with all but the largest image of a group")
+    parser.add_argument("--workers", type=int, help="hashing processes, all cores by default")
+    args = parser.parse_args()
+
+    index = PerceptualIndex(args.index, args.algorithm, args.threshold)
+    if args.command == 'dedupe':
+        for group in index.dedupe_folders(args.paths, args.action, args.workers):
+            print(f"{group['keep']} <- {', '.join(group['duplicates'])}")
+    else:
+        for image_path in args.paths:
+            hashed = hash_image(image_path, args.algorithm)
+            matches = index.lookup(hashed[0]) if hashed else []
+            print(f"{image_path} : {', '.join(f'{path} ({distance} bits)' for path, distance in matches) or 'no near duplicates'}")
+    index.close()
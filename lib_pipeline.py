@@ -0,0 +1,248 @@
+import time
+import queue
+import weakref
+import threading
+from threading import Lock
+from concurrent.futures import Future
+from lib_metrics import METRICS, STAGE_SECONDS, STAGE_ITEMS
+
+POSTS_QUEUE_SIZE = 200
+SRCS_QUEUE_SIZE = 200
+_STOP = object()
+_RUNNING = weakref.WeakSet()
+
+def _queue_depths():
+    depths = {'posts': 0, 'srcs': 0}
+    for pipeline in list(_RUNNING):
+        depths['posts'] += pipeline.posts_queue.qsize()
+        depths['srcs'] += pipeline.srcs_queue.qsize()
+    return [({'queue': name}, depth) for name, depth in depths.items()]
+
+METRICS.gauge("scraper_queue_depth", "Items waiting between the pipeline stages", callback=_queue_depths)
+
+class ScrapePipeline():
+    """Runs the posts listing, srcs extraction and images download stages concurrently.
+
+    The stages are connected with bounded queues so the next search page is listed
+    while the images of the previous ones are still downloading, and a slow stage
+    applies backpressure instead of letting the queues grow without limit.
+    """
+
+    def __init__(self,extract_posts,extract_srcs,download_image,max_images_posts: int,src_workers: int,download_workers: int,on_page=None,start_idx: int = 0,journal=None,is_known=None,budget=None,max_pages: int = None,postprocess=None,store=None,scheduler=None):
+        self.extract_posts = extract_posts          # () -> list of posts ids, empty list when done, None when the page failed
+        self.extract_srcs = extract_srcs            # (post_id) -> list of (image_src, post_id), None when the post failed
+        self.download_image = download_image        # (idx, image_src, post_id) -> image path, None or a Future of either
+        self.max_images_posts = max_images_posts
+        self.src_workers = src_workers
+        self.download_workers = download_workers
+        self.on_page = on_page                      # (posts_ids) called from the listing thread
+        self.journal = journal                      # CheckpointJournal fed by the srcs and download stages
+        self.is_known = is_known                    # (post_id) -> True when an earlier run already has it, listing stops there
+        self.budget = budget                        # shared acquire()/release() slots bounding srcs and download work across jobs
+        self.max_pages = max_pages                  # listing stops after this many pages, None walks until the budget or the tag runs out
+        self.postprocess = postprocess              # (image_path) -> Future of the checked path, None when the image is invalid
+        self.store = store                          # (idx, image_src, post_id, image_path) -> where the image finally lives, e.g. a tar shard
+        self.scheduler = scheduler                  # DownloadScheduler ordering the downloads by size instead of the FIFO srcs queue
+        self.next_idx = max(start_idx, journal.next_idx) if journal else start_idx
+        self.posts_queue = queue.Queue(maxsize=POSTS_QUEUE_SIZE)
+        self.srcs_queue = scheduler or queue.Queue(maxsize=SRCS_QUEUE_SIZE)
+        self.seen_srcs = journal.known_srcs() if journal else set()
+        self.lock = Lock()
+        self.outstanding = 0
+        self.outstanding_done = threading.Condition(self.lock)
+        self.stats = {'pages': 0, 'posts': 0, 'srcs': 0, 'downloaded': 0, 'failed': 0, 'caught_up': False}
+
+    def _resume(self):
+        # Work a crashed run had already listed or resolved goes first, without refetching it
+        pending_srcs = self.journal.pending_srcs()
+        pending_posts = self.journal.pending_posts()
+        if pending_srcs or pending_posts:
+            print(f"Resuming {len(pending_posts)} unresolved posts and {len(pending_srcs)} undownloaded srcs")
+        for item in pending_srcs:
+            self.srcs_queue.put(item)
+        for post_id in pending_posts:
+            self.posts_queue.put(post_id)
+
+    def _list_posts(self):
+        remaining = self.max_images_posts
+        listed_posts = set(self.journal.listed_posts) if self.journal else set()
+        try:
+            if self.journal:
+                self._resume()
+            while remaining > 0:
+                if self.max_pages is not None and self.stats['pages'] >= self.max_pages:
+                    break
+                with STAGE_SECONDS.time(stage='extract_posts'):
+                    posts_ids = self.extract_posts()
+                STAGE_ITEMS.inc(len(posts_ids or []), stage='extract_posts', outcome='listed')
+                if posts_ids is None:
+                    # Not caught up, an incremental run has to come back to this page
+                    print("extract_posts failed, stopping the listing")
+                    STAGE_ITEMS.inc(stage='extract_posts', outcome='error')
+                    break
+                if not posts_ids:
+                    print("extract_posts returned nothing...")
+                    self.stats['caught_up'] = True
+                    break
+                reached_known = False
+                if self.is_known:
+                    fresh_ids = [post_id for post_id in posts_ids if not self.is_known(post_id)]
+                    reached_known = len(fresh_ids) < len(posts_ids)
+                    posts_ids = fresh_ids
+                posts_ids = [post_id for post_id in posts_ids if post_id not in listed_posts][:remaining]
+                listed_posts.update(posts_ids)
+                remaining -= len(posts_ids)
+                self.stats['pages'] += 1
+                self.stats['posts'] += len(posts_ids)
+                if self.on_page:
+                    self.on_page(posts_ids)
+                for post_id in posts_ids:
+                    self.posts_queue.put(post_id)
+                if reached_known:
+                    # Newest posts come first, everything past this page was scraped by an earlier run
+                    print(f"Reached already scraped posts on page {self.stats['pages']}, stopping the listing")
+                    self.stats['caught_up'] = True
+                    break
+        except Exception as e:
+            print(f"Exception Occurred During Posts Listing Stage: {e}")
+
+    def _extract_srcs_worker(self):
+        while True:
+            post_id = self.posts_queue.get()
+            if post_id is _STOP:
+                break
+            if self.budget:
+                self.budget.acquire()
+            try:
+                with STAGE_SECONDS.time(stage='extract_srcs'):
+                    images_srcs = self.extract_srcs(post_id)
+                STAGE_ITEMS.inc(stage='extract_srcs', outcome='error' if images_srcs is None else 'ok' if images_srcs else 'empty')
+            except Exception as e:
+                print(f"Exception Occurred During Srcs Extraction Of Post {post_id}: {e}")
+                STAGE_ITEMS.inc(stage='extract_srcs', outcome='error')
+                continue
+            finally:
+                if self.budget:
+                    self.budget.release()
+            if images_srcs is None:
+                # Left unresolved in the journal, a resumed run retries the post
+                continue
+            items = []
+            with self.lock:
+                for image_src, src_post_id in images_srcs:
+                    if image_src in self.seen_srcs:
+                        continue
+                    self.seen_srcs.add(image_src)
+                    items.append((self.next_idx, image_src, src_post_id))
+                    self.next_idx += 1
+                    self.stats['srcs'] += 1
+            if self.journal and images_srcs:
+                self.journal.record_srcs(post_id, items)
+            for item in items:
+                self.srcs_queue.put(item)
+
+    def _download_worker(self):
+        while True:
+            item = self.srcs_queue.get()
+            if item is _STOP:
+                break
+            idx, image_src, post_id = item
+            # The journal and the store keep the listed src, the scheduler may download a smaller rendition of it
+            download_src = self.scheduler.source_of(item) if self.scheduler else image_src
+            if self.budget:
+                self.budget.acquire()
+            begin_time = time.perf_counter()
+            try:
+                result = self.download_image(idx, download_src, post_id)
+            except Exception as e:
+                print(f"Exception Occurred During Download Of {download_src}: {e}")
+                result = None
+            if self.scheduler:
+                if isinstance(result, Future):
+                    result.add_done_callback(lambda future, item=item: self.scheduler.done(item))
+                else:
+                    self.scheduler.done(item)
+            if self.postprocess and result:
+                result = self._then_postprocess(result)
+            if isinstance(result, Future):
+                # Backends that only schedule the transfer report back once it completes
+                with self.lock:
+                    self.outstanding += 1
+                result.add_done_callback(lambda future, item=item, begin_time=begin_time: self._scheduled_done(item, future, begin_time))
+            else:
+                if self.budget:
+                    self.budget.release()
+                STAGE_SECONDS.observe(time.perf_counter() - begin_time, stage='download_image')
+                self._downloaded(idx, image_src, post_id, result)
+
+    def _then_postprocess(self,result):
+        """Hands the downloaded path to the post processing pool, the image only counts once it passed."""
+        if not isinstance(result, Future):
+            return self.postprocess(result)
+        checked = Future()
+        def downloaded(future: Future):
+            image_path = None if future.exception() else future.result()
+            if not image_path:
+                checked.set_result(None)
+                return
+            try:
+                self.postprocess(image_path).add_done_callback(
+                    lambda processed: checked.set_result(None if processed.exception() else processed.result())
+                )
+            except Exception as e:
+                print(f"Exception Occurred During Post Processing Of {image_path}: {e}")
+                checked.set_result(None)
+        result.add_done_callback(downloaded)
+        return checked
+
+    def _scheduled_done(self,item: tuple,future: Future,begin_time: float):
+        if self.budget:
+            self.budget.release()
+        STAGE_SECONDS.observe(time.perf_counter() - begin_time, stage='download_image')
+        self._downloaded(*item, None if future.exception() else future.result())
+        with self.lock:
+            self.outstanding -= 1
+            self.outstanding_done.notify_all()
+
+    def _downloaded(self,idx: int,image_src: str,post_id,image_path):
+        if image_path and self.store:
+            try:
+                image_path = self.store(idx, image_src, post_id, image_path)
+            except Exception as e:
+                print(f"Exception Occurred While Storing {image_path}: {e}")
+                image_path = None
+        with self.lock:
+            self.stats['downloaded' if image_path else 'failed'] += 1
+        STAGE_ITEMS.inc(stage='download_image', outcome='ok' if image_path else 'failed')
+        if image_path and self.journal:
+            self.journal.record_done(idx, image_src, post_id, image_path)
+
+    def run(self):
+        METRICS.serve_from_env()
+        _RUNNING.add(self)
+        listing_thread = threading.Thread(target=self._list_posts, daemon=True)
+        src_threads = [threading.Thread(target=self._extract_srcs_worker, daemon=True) for _ in range(self.src_workers)]
+        download_threads = [threading.Thread(target=self._download_worker, daemon=True) for _ in range(self.download_workers)]
+        for thread in [listing_thread, *src_threads, *download_threads]:
+            thread.start()
+
+        # Shut the stages down in order, each one only after its producer is done
+        listing_thread.join()
+        for _ in src_threads:
+            self.posts_queue.put(_STOP)
+        for thread in src_threads:
+            thread.join()
+        for _ in download_threads:
+            self.srcs_queue.put(_STOP)
+        for thread in download_threads:
+            thread.join()
+        if self.scheduler:
+            self.scheduler.close()
+        with self.lock:
+            while self.outstanding:
+                self.outstanding_done.wait()
+
+        _RUNNING.discard(self)
+        METRICS.dump_from_env()
+        print(f"Pipeline Finished With {self.stats['pages']} Pages, {self.stats['posts']} Posts, {self.stats['srcs']} Srcs And {self.stats['downloaded']} Images Downloaded ({self.stats['failed']} Failed)")
+        return self.stats
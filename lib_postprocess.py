@@ -0,0 +1,237 @@
+import os
+import time
+import threading
+import concurrent.futures as THREAD
+from concurrent.futures import Future
+from threading import Lock
+
+from lib_metrics import STAGE_SECONDS, STAGE_ITEMS
+from lib_phash import hash_image, HAS_PILLOW
+
+HEAD_BYTES = 16
+TAIL_BYTES = 64
+MAX_PENDING = 256           # images waiting for a worker before download threads are held back
+THUMBNAILS_FOLDER = "thumbnails"
+PROCESSED_FOLDER = "processed"
+EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'gif': '.gif', 'webp': '.webp'}
+ACCEPTED_EXTENSIONS = {'jpeg': ('.jpg', '.jpeg'), 'png': ('.png',), 'gif': ('.gif',), 'webp': ('.webp',)}
+PIL_FORMATS = {'jpeg': 'JPEG', 'jpg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+def sniff_format(head: bytes):
+    """Image format from its magic bytes, None when it is not an image we know."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return 'jpeg'
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return 'png'
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return 'gif'
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return 'webp'
+    return None
+
+def is_complete(image_format: str,head: bytes,tail: bytes,size: int):
+    """Cheap truncation check from the end markers, without decoding the image."""
+    tail = tail.rstrip(b"\x00")     # some encoders pad after the end marker
+    if image_format == 'jpeg':
+        return tail.endswith(b"\xff\xd9")
+    if image_format == 'png':
+        return tail.endswith(b"IEND\xaeB`\x82")
+    if image_format == 'gif':
+        return tail.endswith(b";")
+    if image_format == 'webp':
+        return int.from_bytes(head[4:8], 'little') + 8 == size
+    return False
+
+def _invalid(image_path: str,reason: str,keep_invalid: bool,result: dict):
+    result['error'] = reason
+    try:
+        if keep_invalid:
+            os.replace(image_path, image_path + ".invalid")
+        else:
+            os.remove(image_path)
+    except OSError:
+        pass
+    return result
+
+def _side_path(image_path: str,folder: str,extension: str):
+    directory, name = os.path.split(image_path)
+    os.makedirs(os.path.join(directory, folder), exist_ok=True)
+    return os.path.join(directory, folder, os.path.splitext(name)[0] + extension)
+
+def process_image(image_path: str,options: dict):
+    """Validates one downloaded image, fixes its extension and makes the optional derivatives.
+
+    Top level so a process pool can run it. Returns a dict with the final 'path', or
+    None there and an 'error' when the file was not a complete image.
+    """
+    begin_time = time.perf_counter()
+    result = _check_image(image_path, options)
+    result['seconds'] = time.perf_counter() - begin_time
+    return result
+
+def _check_image(image_path: str,options: dict):
+    result = {'source': image_path, 'path': None, 'format': None, 'renamed': False, 'thumbnail': None, 'processed': None, 'hash': None, 'pixels': 0, 'error': None}
+    try:
+        size = os.path.getsize(image_path)
+        with open(image_path, 'rb') as file:
+            head = file.read(HEAD_BYTES)
+            file.seek(max(0, size - TAIL_BYTES))
+            tail = file.read(TAIL_BYTES)
+    except OSError as e:
+        result['error'] = str(e)
+        return result
+    image_format = sniff_format(head)
+    result['format'] = image_format
+    if image_format is None:
+        return _invalid(image_path, "not an image", options.get('keep_invalid'), result)
+    if not is_complete(image_format, head, tail, size):
+        return _invalid(image_path, "truncated", options.get('keep_invalid'), result)
+    if options.get('deep_verify'):
+        try:
+            from PIL import Image
+            with Image.open(image_path) as image:
+                image.verify()
+        except Exception as e:
+            return _invalid(image_path, f"corrupt: {e}", options.get('keep_invalid'), result)
+
+    base, extension = os.path.splitext(image_path)
+    if extension.lower() not in ACCEPTED_EXTENSIONS[image_format]:
+        fixed_path = base + EXTENSIONS[image_format]
+        os.replace(image_path, fixed_path)
+        image_path = fixed_path
+        result['renamed'] = True
+    result['path'] = image_path
+    if options.get('perceptual_hash'):
+        hashed = hash_image(image_path, options['perceptual_hash'])
+        if hashed:
+            result['hash'], result['pixels'] = hashed
+
+    if options.get('thumbnail_size') or options.get('reencode_format'):
+        try:
+            from PIL import Image
+            with Image.open(image_path) as image:
+                image.load()
+                if options.get('thumbnail_size'):
+                    thumbnail = image.convert('RGB')
+                    thumbnail.thumbnail((options['thumbnail_size'], options['thumbnail_size']))
+                    result['thumbnail'] = _side_path(image_path, THUMBNAILS_FOLDER, ".jpg")
+                    thumbnail.save(result['thumbnail'], 'JPEG', quality=85)
+                if options.get('reencode_format'):
+                    target_format = options['reencode_format'].lower()
+                    processed = image if target_format == 'png' else image.convert('RGB')
+                    max_side = options.get('reencode_max_side')
+                    if max_side and max(processed.size) > max_side:
+                        scale = max_side / max(processed.size)
+                        processed = processed.resize((round(processed.width * scale), round(processed.height * scale)), Image.LANCZOS)
+                    result['processed'] = _side_path(image_path, PROCESSED_FOLDER, "." + ('jpg' if target_format == 'jpeg' else target_format))
+                    processed.save(result['processed'], PIL_FORMATS[target_format], quality=options.get('reencode_quality', 90))
+        except Exception as e:
+            # The original is fine, only its derivatives failed
+            print(f"Error post processing {image_path}: {e}")
+    return result
+
+class Postprocessor():
+    """Checks and converts downloaded images on its own worker pool, off the download threads.
+
+    Every image gets its real format sniffed from its magic bytes, a truncation check
+    and its extension fixed; thumbnails and re-encoding to a target size and format are
+    optional and need Pillow. CPU heavy options run on processes, the rest on threads.
+    Given a PerceptualIndex, every image is also checked for near duplicates; with
+    near_duplicate_action='remove' a new image is dropped for a copy at least as large.
+    `submit(image_path)` returns a Future of the final path, None when the file was invalid
+    and got removed, and blocks once max_pending images are waiting.
+    """
+
+    def __init__(self,workers: int = None,thumbnail_size: int = None,reencode_format: str = None,reencode_max_side: int = None,reencode_quality: int = 90,deep_verify: bool = False,keep_invalid: bool = False,dedup_store=None,use_processes: bool = None,max_pending: int = MAX_PENDING,near_duplicates=None,near_duplicate_action: str = 'report'):
+        if not HAS_PILLOW and (thumbnail_size or reencode_format or deep_verify or near_duplicates):
+            raise ImportError("Thumbnails, re-encoding, deep verification and near duplicates require Pillow, install it with 'pip install pillow'")
+        if reencode_format and reencode_format.lower() not in PIL_FORMATS:
+            raise ValueError(f"Unsupported re-encode format {reencode_format}, expected one of {tuple(PIL_FORMATS)}")
+        self.options = {
+            'thumbnail_size': thumbnail_size,
+            'reencode_format': reencode_format,
+            'reencode_max_side': reencode_max_side,
+            'reencode_quality': reencode_quality,
+            'deep_verify': deep_verify,
+            'keep_invalid': keep_invalid,
+            'perceptual_hash': near_duplicates.algorithm if near_duplicates else None,
+        }
+        self.dedup_store = dedup_store
+        self.near_duplicates = near_duplicates      # shared PerceptualIndex
+        self.near_duplicate_action = near_duplicate_action
+        if use_processes is None:
+            use_processes = bool(thumbnail_size or reencode_format or near_duplicates)
+        workers = workers or os.cpu_count() or 2
+        if use_processes:
+            import multiprocessing
+            self.executor = THREAD.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self.executor = THREAD.ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = Lock()
+        self.stats = {'checked': 0, 'renamed': 0, 'invalid': 0, 'thumbnails': 0, 'processed': 0, 'near_duplicates': 0}
+
+    def submit(self,image_path: str):
+        self.slots.acquire()
+        done = Future()
+        try:
+            future = self.executor.submit(process_image, image_path, self.options)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda future: self._processed(future, done))
+        return done
+
+    def _processed(self,future: Future,done: Future):
+        self.slots.release()
+        if future.exception():
+            print(f"Exception Occurred During Post Processing : {future.exception()}")
+            done.set_result(None)
+            return
+        result = future.result()
+        STAGE_SECONDS.observe(result['seconds'], stage='postprocess')
+        STAGE_ITEMS.inc(stage='postprocess', outcome='invalid' if result['error'] else 'renamed' if result['renamed'] else 'ok')
+        with self.lock:
+            self.stats['checked'] += 1
+            self.stats['renamed'] += result['renamed']
+            self.stats['invalid'] += result['error'] is not None
+            self.stats['thumbnails'] += result['thumbnail'] is not None
+            self.stats['processed'] += result['processed'] is not None
+        if result['error']:
+            print(f"Invalid image {result['source']} : {result['error']}")
+        if self.dedup_store:
+            # Keep the index pointing at the file that is really on disk
+            if result['error']:
+                self.dedup_store.forget_path(result['source'])
+            elif result['renamed']:
+                self.dedup_store.move_path(result['source'], result['path'])
+        image_path = result['path']
+        if self.near_duplicates and result['hash'] is not None:
+            image_path = self._check_near_duplicates(result)
+        done.set_result(image_path)
+
+    def _check_near_duplicates(self,result: dict):
+        remove = self.near_duplicate_action == 'remove'
+        matches = self.near_duplicates.add(result['path'], result['hash'], result['pixels'], only_if_new=remove)
+        if not matches:
+            return result['path']
+        with self.lock:
+            self.stats['near_duplicates'] += 1
+        if not remove:
+            return result['path']
+        best_path = matches[0][0]
+        if self.near_duplicates.details([best_path]).get(best_path, (0, 0))[0] < result['pixels']:
+            # The new image is the larger rendition, keep it next to the earlier one
+            self.near_duplicates.add(result['path'], result['hash'], result['pixels'])
+            return result['path']
+        try:
+            os.remove(result['path'])
+        except OSError:
+            return result['path']
+        if self.dedup_store:
+            self.dedup_store.move_path(result['path'], best_path)
+        return best_path
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        print(f"Post processing checked {self.stats['checked']} images : {self.stats['renamed']} extensions fixed, {self.stats['invalid']} invalid removed, {self.stats['thumbnails']} thumbnails, {self.stats['processed']} re-encoded, {self.stats['near_duplicates']} near duplicates")
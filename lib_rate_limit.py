@@ -0,0 +1,233 @@
+import time
+import threading
+from threading import Lock
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from lib_metrics import METRICS, HTTP_REQUESTS, HTTP_RETRIES, HTTP_SECONDS
+
+INITIAL_RATE = 4.0              # requests per second
+MIN_RATE = 0.2
+MAX_RATE = 50.0
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 64
+RATE_STEP = 0.5                 # additive increase, roughly per second of healthy traffic
+SLOW_START_STEP = 0.25          # increase per healthy response until the first back off, the rate doubles every few seconds
+DECREASE_FACTOR = 0.5           # multiplicative decrease on 429/503/Retry-After
+LATENCY_TOLERANCE = 1.5         # latency may grow this much over its baseline before growth stops
+ERROR_RATE_THRESHOLD = 0.1
+EWMA_ALPHA = 0.1
+BACKOFF_STATUSES = (429, 503)
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class HostLimiter():
+    """Token bucket plus concurrency window for one host, both tuned with AIMD.
+
+    Until the host first pushes back the rate and window grow with every healthy response
+    (slow start), then additively. 429/503, a Retry-After or a rising error rate cut both
+    in half, once per window: rejections of requests sent before the last cut are the same
+    overload and do not cut again. A request holds its slot until finish(), so streamed
+    bodies count against the window until they are read or closed.
+    """
+
+    def __init__(self,host: str,rate: float = INITIAL_RATE,concurrency: float = INITIAL_CONCURRENCY):
+        self.host = host
+        self.rate = rate
+        self.concurrency = concurrency
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency = None
+        self.base_latency = None
+        self.error_rate = 0.0
+        self.requests_count = 0
+        self.backoffs = 0
+        self.last_backoff = float('-inf')
+        self.slow_start = True
+        self.condition = threading.Condition()
+
+    def _refill(self,now: float):
+        burst = max(1.0, self.rate)
+        self.tokens = min(burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    self.condition.wait(self.blocked_until - now)
+                elif self.in_flight >= int(self.concurrency):
+                    self.condition.wait()
+                elif self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.in_flight += 1
+                    return
+                else:
+                    self.condition.wait((1.0 - self.tokens) / self.rate)
+
+    def _back_off(self,sent_at: float,retry_after=None):
+        now = time.monotonic()
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        if sent_at < self.last_backoff:
+            return
+        self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+        self.concurrency = max(1.0, self.concurrency * DECREASE_FACTOR)
+        self.backoffs += 1
+        self.last_backoff = now
+        self.slow_start = False
+
+    def finish(self):
+        """Frees the slot of a request once its body is read or closed."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def release(self,status=None,latency: float = None,retry_after=None,retried_statuses=()):
+        """Reports the outcome of a request and frees its slot, status is None when it raised."""
+        self.report(status, latency, retry_after, retried_statuses)
+        self.finish()
+
+    def report(self,status=None,latency: float = None,retry_after=None,retried_statuses=()):
+        """Feeds the outcome of a request to the AIMD loop without freeing its slot."""
+        with self.condition:
+            sent_at = time.monotonic() - (latency or 0.0)
+            self.requests_count += 1
+            failed = status is None or status >= 500
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA * (1.0 if failed else 0.0)
+            retry_after = parse_retry_after(retry_after)
+            if status in BACKOFF_STATUSES or retry_after or any(s in BACKOFF_STATUSES for s in retried_statuses):
+                self._back_off(sent_at, retry_after)
+            elif self.error_rate > ERROR_RATE_THRESHOLD:
+                self._back_off(sent_at)
+                self.error_rate = 0.0   # give the smaller rate a chance before cutting again
+            elif not failed and latency is not None:
+                self.latency = latency if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * latency
+                self.base_latency = self.latency if self.base_latency is None else min(self.base_latency * 1.01, self.latency)
+                if self.latency <= self.base_latency * LATENCY_TOLERANCE and self.slow_start:
+                    self.rate = min(MAX_RATE, self.rate + SLOW_START_STEP)
+                    self.concurrency = min(MAX_CONCURRENCY, self.concurrency + SLOW_START_STEP)
+                elif self.latency <= self.base_latency * LATENCY_TOLERANCE:
+                    self.rate = min(MAX_RATE, self.rate + RATE_STEP / self.rate)
+                    self.concurrency = min(MAX_CONCURRENCY, self.concurrency + 1.0 / self.concurrency)
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                'rate': round(self.rate, 3),
+                'concurrency': int(self.concurrency),
+                'in_flight': self.in_flight,
+                'latency': round(self.latency, 4) if self.latency is not None else None,
+                'error_rate': round(self.error_rate, 4),
+                'requests': self.requests_count,
+                'backoffs': self.backoffs,
+            }
+
+class RateLimiterRegistry():
+    """One HostLimiter per host, shared by every scraper and session of the process."""
+
+    def __init__(self):
+        self.limiters = {}
+        self.lock = Lock()
+
+    def get(self,host: str):
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = HostLimiter(host)
+            return self.limiters[host]
+
+    def for_url(self,url: str):
+        return self.get(urlsplit(url).hostname or "")
+
+    def snapshot(self):
+        with self.lock:
+            limiters = list(self.limiters.values())
+        return {limiter.host: limiter.snapshot() for limiter in limiters}
+
+    def start_rate_log(self,csv_path: str,interval: float = 1.0):
+        """Appends 'time,host,rate,concurrency,in_flight' rows every interval seconds for graphing."""
+        def log():
+            while True:
+                now = time.time()
+                with open(csv_path, 'a') as file:
+                    for host, snapshot in self.snapshot().items():
+                        file.write(f"{now:.1f},{host},{snapshot['rate']},{snapshot['concurrency']},{snapshot['in_flight']}\n")
+                time.sleep(interval)
+        thread = threading.Thread(target=log, daemon=True)
+        thread.start()
+        return thread
+
+LIMITERS = RateLimiterRegistry()
+
+def _limiter_samples(field: str):
+    return lambda: [({'host': host}, snapshot[field]) for host, snapshot in LIMITERS.snapshot().items()]
+
+METRICS.gauge("scraper_host_rate", "Requests per second the AIMD limiter allows per host", callback=_limiter_samples('rate'))
+METRICS.gauge("scraper_host_concurrency", "Concurrency window of the AIMD limiter per host", callback=_limiter_samples('concurrency'))
+METRICS.gauge("scraper_host_in_flight", "Requests in flight per host", callback=_limiter_samples('in_flight'))
+
+def _finish_on_release(response,limiter: HostLimiter):
+    """Hooks limiter.finish() on the release of the response's connection, False when it can not."""
+    raw = getattr(response, 'raw', None)
+    if raw is None or not hasattr(raw, 'release_conn'):
+        return False
+    release_conn = raw.release_conn
+    released = threading.Event()
+    def release():
+        try:
+            release_conn()
+        finally:
+            # Called again by close() after a full read, the slot is freed only once
+            if not released.is_set():
+                released.set()
+                limiter.finish()
+    raw.release_conn = release
+    return True
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that waits for the per-host limiter before every request and reports back to it.
+
+    The outcome is reported when the headers arrive, but the slot is only freed once urllib3
+    releases the connection, after the body was read or the response closed, so streamed
+    image downloads stay inside the host's concurrency window.
+    """
+
+    def send(self,request,**kwargs):
+        limiter = LIMITERS.for_url(request.url)
+        limiter.acquire()
+        begin_time = time.monotonic()
+        status, retry_after, retried_statuses = None, None, ()
+        response = None
+        try:
+            response = super().send(request, **kwargs)
+            status = response.status_code
+            retry_after = response.headers.get('Retry-After')
+            # urllib3 retries 429/503 inside send, its history still tells us the host pushed back
+            retries = getattr(response.raw, 'retries', None)
+            if retries is not None:
+                retried_statuses = tuple(history.status for history in retries.history if history.status)
+            return response
+        finally:
+            latency = time.monotonic() - begin_time
+            limiter.report(status, latency, retry_after, retried_statuses)
+            if not _finish_on_release(response, limiter):
+                limiter.finish()
+            HTTP_REQUESTS.inc(host=limiter.host, status=status or 'error')
+            HTTP_SECONDS.observe(latency, host=limiter.host)
+            for retried_status in retried_statuses:
+                HTTP_RETRIES.inc(host=limiter.host, status=retried_status)
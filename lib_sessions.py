@@ -0,0 +1,69 @@
+import hashlib
+import json
+from threading import Lock
+
+def credentials_key(cookies):
+    """Stable short key for a set of cookies so sessions with different logins stay apart."""
+    if not cookies:
+        return None
+    values = sorted((cookie['name'], cookie['value']) for cookie in cookies)
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()[:12]
+
+class SessionRegistry():
+    """Hands out one long-lived keep-alive session per host and credentials set.
+
+    Sessions are built once with the scraper's own `_make_session` and reused by every
+    later page, scrape and scraper of the process, so the TCP/TLS handshakes are paid once.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self,host: str,factory,credentials: str = None):
+        key = (host, credentials)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is not None:
+                self.hits += 1
+                return session
+            self.misses += 1
+            session = factory()
+            self.sessions[key] = session
+            return session
+
+    def _pools(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        adapters = {id(adapter): adapter for session in sessions for adapter in session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    yield pool
+
+    def stats(self):
+        """Session hits/misses plus how many requests urllib3 served over how many connections."""
+        connections = requests_count = 0
+        for pool in self._pools():
+            connections += pool.num_connections
+            requests_count += pool.num_requests
+        return {
+            'session_hits': self.hits,
+            'session_misses': self.misses,
+            'connections_opened': connections,
+            'requests': requests_count,
+            'connection_reuses': max(0, requests_count - connections),
+        }
+
+    def close_all(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+SESSIONS = SessionRegistry()
@@ -0,0 +1,209 @@
+import os
+import json
+import math
+import time
+import argparse
+import threading
+import multiprocessing
+import concurrent.futures as THREAD
+
+from lib_checkpoint import journal_path
+
+DEFAULT_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+# Rough posts per search page, only used to turn an image count into a page range
+POSTS_PER_PAGE = {'pixiv': 60, 'zerochan': 24}
+SHARD_SRC_WORKERS = 4
+SHARD_DOWNLOAD_WORKERS = 6
+SITES = tuple(POSTS_PER_PAGE)
+
+def manifest_path(output_folder: str,site: str,tag: str):
+    return journal_path(output_folder, site, tag).replace("_checkpoint.jsonl", "_shards.json")
+
+def plan_shards(count: int,first_page: int,pages: int,processes: int):
+    """Splits pages [first_page, first_page + pages) into contiguous ranges with their share of count."""
+    shards_count = max(1, min(processes, pages))
+    pages_per_shard = math.ceil(pages / shards_count)
+    shards = []
+    for shard_idx in range(shards_count):
+        first = first_page + shard_idx * pages_per_shard
+        last = min(first_page + pages, first + pages_per_shard) - 1
+        if first > last:
+            break
+        shards.append({'shard': shard_idx, 'first_page': first, 'last_page': last, 'count': 0, 'status': 'pending', 'stats': None})
+    for shard in shards:
+        shard['count'] = math.ceil(count * (shard['last_page'] - shard['first_page'] + 1) / pages)
+    return shards
+
+def _make_scraper(site: str,tag: str,shard: dict,output_folder: str,file_name: str,browser: str,dedup_path: str):
+    from lib_dedup_store import DedupStore
+    dedup_store = DedupStore(dedup_path) if dedup_path else None
+    common = dict(
+        tag=tag,
+        max_images_posts=shard['count'],
+        page_idx=shard['first_page'],
+        output_folder=output_folder,
+        # Every shard counts its images from 1, the prefix keeps their names apart
+        file_name=f"{file_name}_s{shard['shard']:02d}",
+        dedup_store=dedup_store
+    )
+    if site == 'pixiv':
+        from lib_cookies import PixivCookies
+        from pixiv_scraper.pixiv_api_scraper import PixivScraper
+        scraper = PixivScraper(browser=browser, pixiv_cookies_manager=PixivCookies(), **common)
+    else:
+        from zerochan_scraper.zerochan_api_scraper import ZeroChanScraper
+        scraper = ZeroChanScraper(**common)
+    scraper.shard = shard['shard']
+    scraper.last_page = shard['last_page']
+    scraper.src_workers = SHARD_SRC_WORKERS
+    scraper.download_workers = SHARD_DOWNLOAD_WORKERS
+    return scraper
+
+def _run_shard(site: str,tag: str,shard: dict,output_folder: str,file_name: str,browser: str,dedup_path: str,cache_path: str,progress):
+    """Shard worker entry point, runs in its own process with its own sessions and limiters."""
+    from lib_sessions import SESSIONS
+    from lib_http_cache import use_cache
+    use_cache(cache_path)
+    scraper = _make_scraper(site, tag, shard, output_folder, file_name, browser, dedup_path)
+    scraper.on_saved = lambda: progress.put(1)
+    begin_time = time.time()
+    try:
+        scraper.scrape()
+    finally:
+        if scraper.dedup_store:
+            scraper.dedup_store.close()
+    return {
+        'shard': shard['shard'],
+        'stats': scraper.stats,
+        'sessions': SESSIONS.stats(),
+        'seconds': round(time.time() - begin_time, 2),
+    }
+
+class ShardedScrape():
+    """Runs one large tag as page range shards over a process pool, one ZeroChanScraper or PixivScraper per shard.
+
+    Parsing and post processing then use every core instead of sharing one GIL. Each
+    shard keeps its own checkpoint journal, the parent merges progress into one bar and
+    results into a shards manifest, so a rerun skips finished shards and resumes the others.
+    """
+
+    def __init__(self,site: str,tag: str,count: int,output_folder: str,file_name: str = None,first_page: int = 1,pages: int = None,processes: int = DEFAULT_PROCESSES,browser: str = 'chrome',dedup_path: str = None,cache_path: str = None):
+        if site not in SITES:
+            raise ValueError(f"Sharding supports {SITES}, not {site}")
+        self.site = site
+        self.tag = tag
+        self.count = count
+        self.output_folder = output_folder
+        self.file_name = file_name or tag
+        self.first_page = first_page
+        self.pages = pages or math.ceil(count / POSTS_PER_PAGE[site])
+        self.processes = processes
+        self.browser = browser
+        self.dedup_path = dedup_path
+        self.cache_path = cache_path    # http cache database shared by the shards, None runs them without one
+        self.manifest_path = manifest_path(output_folder, site, tag)
+        self.shards = None
+
+    def _load_manifest(self):
+        # A rerun keeps the earlier page ranges so the shard journals still match them
+        try:
+            with open(self.manifest_path, 'r') as file:
+                manifest = json.load(file)
+            print(f"Shards manifest found : {sum(shard['status'] == 'finished' for shard in manifest['shards'])}/{len(manifest['shards'])} shards finished")
+            return manifest['shards']
+        except (OSError, ValueError, KeyError):
+            return plan_shards(self.count, self.first_page, self.pages, self.processes)
+
+    def _save_manifest(self):
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w') as file:
+            json.dump({'site': self.site, 'tag': self.tag, 'count': self.count, 'shards': self.shards}, file, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def _merged_stats(self):
+        totals = {'pages': 0, 'posts': 0, 'srcs': 0, 'downloaded': 0, 'failed': 0}
+        for shard in self.shards:
+            for key in totals:
+                totals[key] += (shard['stats'] or {}).get(key, 0)
+        return totals
+
+    def run(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.shards = self._load_manifest()
+        self._save_manifest()
+        if self.site == 'pixiv':
+            # Log in once here, the shards then all find the cookies file instead of opening a browser each
+            from lib_cookies import PixivCookies
+            from pixiv_scraper.pixiv_api_scraper import PixivScraper
+            if not PixivScraper(self.tag, 0, 1, self.output_folder, self.file_name, self.browser, PixivCookies()).login():
+                print(f"ERROR COOKIES DRIVER CREATION, LEAVING...")
+                return None
+        pending = [shard for shard in self.shards if shard['status'] != 'finished']
+        done_before = sum((shard['stats'] or {}).get('downloaded', 0) for shard in self.shards if shard['status'] == 'finished')
+        begin_time = time.time()
+
+        # Spawned workers start clean, without the parent's sessions, pools or sqlite connections
+        context = multiprocessing.get_context('spawn')
+        with context.Manager() as manager:
+            progress = manager.Queue()
+            from tqdm import tqdm
+            progress_bar = tqdm(total=self.count, initial=done_before, desc=f"Scraping Images ({len(pending)} shards)", unit="Image", colour='red', leave=True)
+            def follow_progress():
+                while progress.get() is not None:
+                    progress_bar.update(1)
+            progress_thread = threading.Thread(target=follow_progress, daemon=True)
+            progress_thread.start()
+            with THREAD.ProcessPoolExecutor(max_workers=min(self.processes, len(pending) or 1), mp_context=context) as executor:
+                futures = {
+                    executor.submit(_run_shard, self.site, self.tag, shard, self.output_folder, self.file_name, self.browser, self.dedup_path, self.cache_path, progress): shard
+                    for shard in pending
+                }
+                for future in THREAD.as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        result = future.result()
+                        shard['stats'] = result['stats']
+                        shard['sessions'] = result['sessions']
+                        finished = bool(result['stats']) and result['stats']['failed'] == 0
+                        shard['status'] = 'finished' if finished else 'incomplete'
+                    except Exception as e:
+                        print(f"Exception Occurred In Shard {shard['shard']} : {e}")
+                        shard['status'] = 'crashed'
+                    self._save_manifest()
+            progress.put(None)
+            progress_thread.join()
+            progress_bar.close()
+
+        stats = self._merged_stats()
+        print(f"Sharded Scrape Finished In {time.time() - begin_time:.2f} seconds : {stats['pages']} Pages, {stats['posts']} Posts And {stats['downloaded']} Images Downloaded ({stats['failed']} Failed) over {len(self.shards)} shards")
+        if all(shard['status'] == 'finished' for shard in self.shards):
+            os.replace(self.manifest_path, self.manifest_path + ".done")
+        return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape one large tag with its page range sharded over a process pool")
+    parser.add_argument("site", choices=SITES)
+    parser.add_argument("tag")
+    parser.add_argument("count", type=int, help="images to scrape over all shards")
+    parser.add_argument("--output-dir", default="../scraped_datasets")
+    parser.add_argument("--first-page", type=int, default=1)
+    parser.add_argument("--pages", type=int, help="pages to cover, estimated from count by default")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument("--browser", choices=['chrome', 'firefox'], default='chrome', help="browser of the Pixiv login")
+    args = parser.parse_args()
+
+    from lib_dedup_store import DEFAULT_INDEX_NAME
+    from lib_http_cache import DEFAULT_CACHE_NAME
+    os.makedirs(args.output_dir, exist_ok=True)
+    ShardedScrape(
+        args.site,
+        args.tag,
+        args.count,
+        os.path.join(args.output_dir, f"{args.tag}_scraped"),
+        first_page=args.first_page,
+        pages=args.pages,
+        processes=args.processes,
+        browser=args.browser,
+        dedup_path=os.path.join(args.output_dir, DEFAULT_INDEX_NAME),
+        cache_path=os.path.join(args.output_dir, DEFAULT_CACHE_NAME)
+    ).run()
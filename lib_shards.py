@@ -0,0 +1,164 @@
+import os
+import io
+import re
+import json
+import glob
+import time
+import tarfile
+import importlib.util
+from threading import Lock
+
+# pyarrow is only imported by close() when it writes the Parquet manifest
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+SHARDS_FOLDER = "shards"
+MANIFEST_SUFFIX = ".manifest.jsonl"
+PARQUET_SUFFIX = ".manifest.parquet"
+MAX_SHARD_BYTES = 1024 * 1024 * 1024    # 1 GiB per tar
+MAX_SHARD_SAMPLES = 10000
+
+def _safe(text):
+    # WebDataset splits a member name on its first dot, keys keep to [A-Za-z0-9_-]
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", str(text))
+
+def shards_folder(output_folder: str):
+    return os.path.join(output_folder, SHARDS_FOLDER)
+
+def iter_manifest(output_folder: str):
+    """Yields the manifest records of every shard writer that wrote to output_folder."""
+    for manifest_path in sorted(glob.glob(os.path.join(shards_folder(output_folder), "*" + MANIFEST_SUFFIX))):
+        with open(manifest_path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+def count_samples(output_folder: str):
+    """Samples stored in the shards of output_folder, None when it was not scraped in shards mode."""
+    manifests = glob.glob(os.path.join(shards_folder(output_folder), "*" + MANIFEST_SUFFIX))
+    if not manifests:
+        return None
+    count = 0
+    for manifest_path in manifests:
+        with open(manifest_path, 'rb') as file:
+            count += sum(1 for line in file if line.strip())
+    return count
+
+def _data_offset(tar: tarfile.TarFile,size: int):
+    # addfile() works on a copy of the TarInfo, the member data ends at tar.offset padded to a block
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    return tar.offset - (blocks + (remainder > 0)) * tarfile.BLOCKSIZE
+
+def read_sample(output_folder: str,record: dict):
+    """Returns (image bytes, metadata dict) of a manifest record with two seeks, without walking the tar."""
+    with open(os.path.join(shards_folder(output_folder), record['shard']), 'rb') as file:
+        file.seek(record['offset'])
+        image = file.read(record['size'])
+        file.seek(record['meta_offset'])
+        metadata = json.loads(file.read(record['meta_size']))
+    return image, metadata
+
+class ShardWriter():
+    """Streams downloaded images into size capped tar shards in the WebDataset layout.
+
+    Every sample is a `{key}.{ext}` member with the image next to a `{key}.json` member
+    with its post id, tags and source url, and gets a line in `{prefix}.manifest.jsonl`
+    with its shard and the byte offsets of both members, so readers seek straight to a
+    sample. A resumed run starts a new shard instead of appending to one a crash may
+    have cut. When pyarrow is installed the manifest is also written as Parquet on close,
+    parquet=False skips it.
+    """
+
+    def __init__(self,output_folder: str,prefix: str,query: str = None,max_shard_bytes: int = MAX_SHARD_BYTES,max_shard_samples: int = MAX_SHARD_SAMPLES,parquet: bool = None):
+        if parquet and not HAS_PYARROW:
+            raise ImportError("A Parquet manifest requires pyarrow, install it with 'pip install pyarrow'")
+        self.output_folder = output_folder
+        self.folder = shards_folder(output_folder)
+        os.makedirs(self.folder, exist_ok=True)
+        self.prefix = _safe(prefix)
+        self.query = query      # the tag that was scraped, kept with every sample
+        self.max_shard_bytes = max_shard_bytes
+        self.max_shard_samples = max_shard_samples
+        self.parquet = HAS_PYARROW if parquet is None else parquet
+        self.lock = Lock()
+        self.manifest_path = os.path.join(self.folder, self.prefix + MANIFEST_SUFFIX)
+        self.manifest = open(self.manifest_path, 'a')
+        self.shard_idx = self._next_shard_idx()
+        self.shard_path = None
+        self.tar = None
+        self.shard_bytes = 0
+        self.shard_samples = 0
+        self.samples = 0
+        self.shards = 0
+
+    def _next_shard_idx(self):
+        pattern = re.compile(re.escape(self.prefix) + r"-(\d+)\.tar$")
+        indexes = [int(match.group(1)) for name in os.listdir(self.folder) if (match := pattern.match(name))]
+        return max(indexes) + 1 if indexes else 0
+
+    def _rotate(self):
+        if self.tar:
+            self.tar.close()
+            self.shard_idx += 1
+        self.shard_path = os.path.join(self.folder, f"{self.prefix}-{self.shard_idx:06d}.tar")
+        self.tar = tarfile.open(self.shard_path, 'w', format=tarfile.GNU_FORMAT)
+        self.shard_bytes = 0
+        self.shard_samples = 0
+        self.shards += 1
+
+    def add(self,image_path: str,site: str,post_id,image_src: str,idx: int,metadata: dict = None):
+        """Moves a downloaded image into the current shard and returns its 'shards/<tar>#<key>' location."""
+        metadata = metadata or {}
+        extension = os.path.splitext(image_path)[1].lstrip('.').lower() or 'jpg'
+        key = f"{site}_{_safe(post_id)}_{idx:06d}"
+        tags = metadata.get('tags') or []
+        sidecar = json.dumps({'key': key, 'site': site, 'post_id': str(post_id), 'source_url': image_src, 'query': self.query, **metadata}).encode()
+        size = os.path.getsize(image_path)
+        with self.lock:
+            if self.tar is None or (self.shard_samples and (self.shard_bytes + size > self.max_shard_bytes or self.shard_samples >= self.max_shard_samples)):
+                self._rotate()
+            image_info = tarfile.TarInfo(f"{key}.{extension}")
+            image_info.size = size
+            image_info.mtime = int(time.time())
+            with open(image_path, 'rb') as image:
+                self.tar.addfile(image_info, image)
+            image_offset = _data_offset(self.tar, size)
+            meta_info = tarfile.TarInfo(f"{key}.json")
+            meta_info.size = len(sidecar)
+            meta_info.mtime = image_info.mtime
+            self.tar.addfile(meta_info, io.BytesIO(sidecar))
+            meta_offset = _data_offset(self.tar, len(sidecar))
+            self.tar.fileobj.flush()
+            # The manifest line only goes out once both members are in the tar
+            self.manifest.write(json.dumps({
+                'key': key,
+                'shard': os.path.basename(self.shard_path),
+                'offset': image_offset,
+                'size': size,
+                'meta_offset': meta_offset,
+                'meta_size': len(sidecar),
+                'ext': extension,
+                'site': site,
+                'post_id': str(post_id),
+                'source_url': image_src,
+                'tags': " ".join(tags) if isinstance(tags, list) else str(tags),
+            }) + "\n")
+            self.manifest.flush()
+            self.shard_bytes += size + len(sidecar)
+            self.shard_samples += 1
+            self.samples += 1
+            location = f"{SHARDS_FOLDER}/{os.path.basename(self.shard_path)}#{key}"
+        os.remove(image_path)
+        return location
+
+    def close(self):
+        with self.lock:
+            if self.tar:
+                self.tar.close()
+                self.tar = None
+            self.manifest.close()
+        if self.parquet and os.path.getsize(self.manifest_path):
+            import pyarrow.json as pyarrow_json
+            import pyarrow.parquet as pyarrow_parquet
+            table = pyarrow_json.read_json(self.manifest_path)
+            pyarrow_parquet.write_table(table, os.path.join(self.folder, self.prefix + PARQUET_SUFFIX))
+        print(f"Shard writer stored {self.samples} samples in {self.shards} shards under {self.folder}")
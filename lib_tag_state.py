@@ -0,0 +1,79 @@
+import os
+import json
+from datetime import datetime
+from threading import Lock
+
+DEFAULT_STATE_NAME = "tag_state.json"
+
+def _as_int(post_id):
+    try:
+        return int(post_id)
+    except (TypeError, ValueError):
+        return None
+
+class TagState():
+    """Newest post id seen per site and tag, kept in a small JSON file between runs.
+
+    Incremental scrapes walk the tag newest first and stop at the first post at or below
+    the mark. Ids listed during a run are only committed once the run caught up with the
+    previous mark, so a refresh cut short by its budget never leaves a gap behind it.
+    """
+
+    def __init__(self,path: str = DEFAULT_STATE_NAME):
+        self.path = path
+        self.lock = Lock()
+        self.pending = {}   # (site, tag) -> newest id listed by the running scrape
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self.state, file, indent=2)
+        os.replace(temp_path, self.path)
+
+    def last_seen(self,site: str,tag: str):
+        with self.lock:
+            return self.state.get(site, {}).get(tag, {}).get('last_post_id')
+
+    def known_predicate(self,site: str,tag: str):
+        """(post_id) -> True once post_id is at or below the mark, None when the tag was never scraped."""
+        last_post_id = self.last_seen(site, tag)
+        if last_post_id is None:
+            return None
+        def is_known(post_id):
+            post_id = _as_int(post_id)
+            return post_id is not None and post_id <= last_post_id
+        return is_known
+
+    def note(self,site: str,tag: str,posts_ids: list):
+        ids = [post_id for post_id in map(_as_int, posts_ids) if post_id is not None]
+        if not ids:
+            return
+        with self.lock:
+            self.pending[(site, tag)] = max(ids + [self.pending.get((site, tag), ids[0])])
+
+    def finish(self,site: str,tag: str,caught_up: bool):
+        """Moves the mark to the newest id the run listed, the first run of a tag always sets it."""
+        with self.lock:
+            newest = self.pending.pop((site, tag), None)
+            previous = self.state.get(site, {}).get(tag, {}).get('last_post_id')
+            if newest is None:
+                return previous
+            if previous is not None and not caught_up:
+                print(f"Incremental run of {site} {tag} stopped before reaching post {previous}, keeping the old mark")
+                return previous
+            self.state.setdefault(site, {})[tag] = {
+                'last_post_id': max(newest, previous or newest),
+                'updated_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            self._save()
+            return self.state[site][tag]['last_post_id']
+
+TAG_STATE = TagState()
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+from threading import Lock
+from contextlib import contextmanager
+from lib_metrics import STAGE_SECONDS
+
+DEFAULT_POOL_SIZE = 4
+MAX_USES = 50   # pages a browser serves before it is recycled, keeps leaks of long lived browsers in check
+DRIVER_PATHS_FILE = os.path.join(os.path.expanduser("~"), ".wdm", "resolved_drivers.json")
+DRIVER_PATHS_TTL = 7 * 24 * 3600    # resolve again weekly so a browser update gets its matching driver
+
+_DRIVER_PATHS_LOCK = Lock()
+
+def _read_driver_paths():
+    try:
+        with open(DRIVER_PATHS_FILE, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def driver_binary(browser: str,refresh: bool = False):
+    """Path of the chromedriver or geckodriver binary for browser.
+
+    webdriver_manager may look the latest driver up over the network on every install(),
+    so the path it resolves is kept in DRIVER_PATHS_FILE and reused for DRIVER_PATHS_TTL
+    while the binary is still there. refresh=True resolves it again, e.g. when the
+    cached driver no longer matches the installed browser.
+    """
+    with _DRIVER_PATHS_LOCK:
+        paths = _read_driver_paths()
+        cached = paths.get(browser)
+        if not refresh and cached and os.path.exists(cached['path']) and time.time() - cached['resolved_at'] < DRIVER_PATHS_TTL:
+            return cached['path']
+        if browser == 'firefox':
+            from webdriver_manager.firefox import GeckoDriverManager
+            path = GeckoDriverManager().install()
+        else:
+            from webdriver_manager.chrome import ChromeDriverManager
+            path = ChromeDriverManager().install()
+        paths[browser] = {'path': path, 'resolved_at': time.time()}
+        try:
+            os.makedirs(os.path.dirname(DRIVER_PATHS_FILE), exist_ok=True)
+            temp_path = DRIVER_PATHS_FILE + ".tmp"
+            with open(temp_path, 'w') as file:
+                json.dump(paths, file)
+            os.replace(temp_path, DRIVER_PATHS_FILE)
+        except OSError as e:
+            print(f"Error saving driver paths : {e}")
+        return path
+
+class WebDriverPool():
+    """Bounded pool of warm WebDrivers handed out with `with pool.driver() as driver:`.
+
+    Browsers are started lazily on first demand, health checked on checkout, recycled
+    after max_uses checkouts and always returned (or quit) even when the caller raises.
+    """
+
+    def __init__(self,factory,max_size: int = DEFAULT_POOL_SIZE,max_uses: int = MAX_USES):
+        self.factory = factory
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.idle = queue.LifoQueue()   # the most recently used browser is the warmest
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.uses = {}
+        self.live = set()
+        self.lock = Lock()
+        self.started = 0
+        self.closed = False
+
+    def _create(self):
+        with STAGE_SECONDS.time(stage='driver_startup'):
+            driver = self.factory()
+        with self.lock:
+            self.live.add(driver)
+            self.uses[id(driver)] = 0
+            self.started += 1
+        return driver
+
+    def _quit(self,driver):
+        with self.lock:
+            self.live.discard(driver)
+            self.uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error quitting driver : {e}")
+
+    def _healthy(self,driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def warmup(self,count: int = None):
+        """Starts browsers ahead of time in parallel, up to count or the pool size."""
+        count = min(count or self.max_size, self.max_size)
+        with self.lock:
+            missing = count - len(self.live)
+        threads = [threading.Thread(target=lambda: self.idle.put(self._create())) for _ in range(missing)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def acquire(self,timeout: float = None):
+        if self.closed:
+            raise RuntimeError("WebDriver pool is closed")
+        if not self.slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No WebDriver available after {timeout} seconds")
+        try:
+            while True:
+                try:
+                    driver = self.idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if self._healthy(driver):
+                    return driver
+                self._quit(driver)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self,driver,broken: bool = False):
+        try:
+            with self.lock:
+                self.uses[id(driver)] = self.uses.get(id(driver), 0) + 1
+                worn_out = self.uses[id(driver)] >= self.max_uses
+            if broken or worn_out or self.closed:
+                self._quit(driver)
+            else:
+                self.idle.put(driver)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def driver(self,timeout: float = None):
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = not self._healthy(driver)
+            raise
+        finally:
+            self.release(driver, broken)
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            drivers = list(self.live)
+        for driver in drivers:
+            self._quit(driver)
+
+_POOLS = {}
+_POOLS_LOCK = Lock()
+
+def _same_factory(a,b):
+    # Every scraper passes its own bound method, the function behind it is what must match
+    return getattr(a, '__func__', a) is getattr(b, '__func__', b)
+
+def shared_pool(name: str,factory,max_size: int = DEFAULT_POOL_SIZE):
+    """Process-wide pool per name so later scrapes of the same kind start on warm browsers.
+
+    Raises ValueError when name is already in use by a pool of another factory or size.
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(name)
+        if pool is None or pool.closed:
+            pool = WebDriverPool(factory, max_size)
+            _POOLS[name] = pool
+        elif not _same_factory(pool.factory, factory) or pool.max_size != max_size:
+            raise ValueError(f"WebDriver pool {name} already exists with another factory or max_size {pool.max_size}")
+        return pool
+
+@atexit.register
+def close_all_pools():
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,436 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from threading import Lock
+from urllib.parse import urlsplit
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+LEASE_SECONDS = 120.0       # an item leased by a worker that died is handed out again after this
+MAX_ATTEMPTS = 4            # an item failing this many times is set aside as dead
+POLL_SECONDS = 2.0
+WORKER_THREADS = 8
+# Downstream kinds first so a worker finishes what is in flight before listing more pages
+KINDS = ('src', 'post', 'page')
+
+def job_name(site: str,tag: str):
+    return f"{site}:{tag}"
+
+class MemoryLeaseQueue():
+    """In-process lease queue, the stand-in for tests and single machine runs.
+
+    Every backend stores (job, kind, key) items once, hands them out under a lease
+    that expires after lease_seconds, and re-issues expired or failed items until
+    they were attempted max_attempts times.
+    """
+
+    def __init__(self,max_attempts: int = MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.items = {}
+        self.keys = set()
+        self.lock = Lock()
+        self.next_id = 1
+
+    def put(self,job: str,kind: str,key,payload):
+        """Adds an item, returns its id or None when the same (job, kind, key) was already queued."""
+        with self.lock:
+            if (job, kind, str(key)) in self.keys:
+                return None
+            self.keys.add((job, kind, str(key)))
+            item_id = self.next_id
+            self.next_id += 1
+            self.items[item_id] = {'id': item_id, 'job': job, 'kind': kind, 'key': str(key), 'payload': payload,
+                                   'state': 'pending', 'worker': None, 'leased_until': 0.0, 'attempts': 0}
+            return item_id
+
+    def lease(self,job: str,kind: str,worker: str,lease_seconds: float = LEASE_SECONDS):
+        now = time.time()
+        with self.lock:
+            for item in self.items.values():
+                if item['job'] != job or item['kind'] != kind:
+                    continue
+                expired = item['state'] == 'leased' and item['leased_until'] < now
+                if expired and item['attempts'] >= self.max_attempts:
+                    # The worker holding it died on its last attempt
+                    item['state'] = 'dead'
+                    continue
+                if item['state'] == 'pending' or expired:
+                    item.update(state='leased', worker=worker, leased_until=now + lease_seconds, attempts=item['attempts'] + 1)
+                    return dict(item)
+        return None
+
+    def complete(self,item: dict):
+        with self.lock:
+            self.items[item['id']]['state'] = 'done'
+
+    def fail(self,item: dict):
+        with self.lock:
+            stored = self.items[item['id']]
+            stored['state'] = 'dead' if stored['attempts'] >= self.max_attempts else 'pending'
+
+    def counts(self,job: str):
+        now = time.time()
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'dead': 0}
+        with self.lock:
+            for item in self.items.values():
+                if item['job'] == job:
+                    expired = item['state'] == 'leased' and item['leased_until'] < now
+                    if expired:
+                        counts['dead' if item['attempts'] >= self.max_attempts else 'pending'] += 1
+                    else:
+                        counts[item['state']] += 1
+        return counts
+
+class SQLiteLeaseQueue():
+    """Lease queue in one SQLite file, fit for a shared NFS folder.
+
+    It uses the rollback journal instead of WAL, which needs shared memory that NFS does
+    not provide, and takes leases inside BEGIN IMMEDIATE so two machines never get the
+    same item.
+    """
+
+    def __init__(self,db_path: str,max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.lock = Lock()
+        self.connection = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=DELETE")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT,
+                    kind TEXT,
+                    key TEXT,
+                    payload TEXT,
+                    state TEXT DEFAULT 'pending',
+                    worker TEXT,
+                    leased_until REAL DEFAULT 0,
+                    attempts INTEGER DEFAULT 0,
+                    UNIQUE (job, kind, key)
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS items_lease ON items (job, kind, state, leased_until)")
+
+    def put(self,job: str,kind: str,key,payload):
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO items (job, kind, key, payload) VALUES (?, ?, ?, ?)",
+                (job, kind, str(key), json.dumps(payload))
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def lease(self,job: str,kind: str,worker: str,lease_seconds: float = LEASE_SECONDS):
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Leases that expired on their last attempt are not handed out again
+                self.connection.execute(
+                    "UPDATE items SET state = 'dead' WHERE job = ? AND state = 'leased' AND leased_until < ? AND attempts >= ?",
+                    (job, now, self.max_attempts)
+                )
+                row = self.connection.execute("""
+                    SELECT id, key, payload, attempts FROM items
+                    WHERE job = ? AND kind = ? AND (state = 'pending' OR (state = 'leased' AND leased_until < ?))
+                    ORDER BY id LIMIT 1
+                """, (job, kind, now)).fetchone()
+                if row:
+                    self.connection.execute(
+                        "UPDATE items SET state = 'leased', worker = ?, leased_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        (worker, now + lease_seconds, row[0])
+                    )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        return {'id': row[0], 'job': job, 'kind': kind, 'key': row[1], 'payload': json.loads(row[2]),
+                'worker': worker, 'attempts': row[3] + 1}
+
+    def complete(self,item: dict):
+        with self.lock:
+            self.connection.execute("UPDATE items SET state = 'done' WHERE id = ?", (item['id'],))
+
+    def fail(self,item: dict):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END WHERE id = ?",
+                (self.max_attempts, item['id'])
+            )
+
+    def counts(self,job: str):
+        with self.lock:
+            rows = self.connection.execute("""
+                SELECT CASE WHEN state = 'leased' AND leased_until < ? THEN (CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END) ELSE state END, COUNT(*)
+                FROM items WHERE job = ? GROUP BY 1
+            """, (time.time(), self.max_attempts, job)).fetchall()
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'dead': 0}
+        counts.update(dict(rows))
+        return counts
+
+# The scripts run as one step each, a worker dying half way can not leave a key marked as
+# queued without its item, or an item in neither the pending list nor the leases
+REDIS_PUT_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return nil
+end
+local item_id = redis.call('INCR', KEYS[2])
+redis.call('HSET', ARGV[2] .. item_id, 'job', ARGV[3], 'kind', ARGV[4], 'key', ARGV[5], 'payload', ARGV[6], 'attempts', 0, 'state', 'pending')
+redis.call('RPUSH', KEYS[3], item_id)
+return item_id
+"""
+REDIS_LEASE_SCRIPT = """
+local item_id = redis.call('LPOP', KEYS[1])
+if not item_id then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[1], item_id)
+local item_key = ARGV[3] .. item_id
+local attempts = redis.call('HINCRBY', item_key, 'attempts', 1)
+redis.call('HSET', item_key, 'state', 'leased', 'worker', ARGV[2])
+return {item_id, attempts, redis.call('HGET', item_key, 'key'), redis.call('HGET', item_key, 'payload')}
+"""
+REDIS_REQUEUE_SCRIPT = """
+local item_ids = redis.call('ZRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+for _, item_id in ipairs(item_ids) do
+    local item_key = ARGV[2] .. item_id
+    redis.call('ZREM', KEYS[1], item_id)
+    if tonumber(redis.call('HGET', item_key, 'attempts')) >= tonumber(ARGV[4]) then
+        redis.call('HSET', item_key, 'state', 'dead')
+        redis.call('HINCRBY', ARGV[3] .. 'counts', 'dead', 1)
+    else
+        redis.call('HSET', item_key, 'state', 'pending')
+        redis.call('RPUSH', ARGV[3] .. redis.call('HGET', item_key, 'kind') .. ':pending', item_id)
+    end
+end
+return #item_ids
+"""
+
+class RedisLeaseQueue():
+    """Lease queue in Redis: a pending list per job and kind plus one sorted set of lease expiries.
+
+    Queueing, leasing and moving expired leases back to their pending list run as Lua
+    scripts, so an item is always in exactly one of the two even when a worker dies mid way.
+    """
+
+    def __init__(self,url: str,prefix: str = "scraper",max_attempts: int = MAX_ATTEMPTS):
+        if redis is None:
+            raise ImportError("The redis work queue backend requires redis, install it with 'pip install redis'")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self.put_script = self.client.register_script(REDIS_PUT_SCRIPT)
+        self.lease_script = self.client.register_script(REDIS_LEASE_SCRIPT)
+        self.requeue_script = self.client.register_script(REDIS_REQUEUE_SCRIPT)
+
+    def _key(self,*parts):
+        return ":".join([self.prefix, *map(str, parts)])
+
+    def put(self,job: str,kind: str,key,payload):
+        item_id = self.put_script(
+            keys=[self._key(job, "keys"), self._key("ids"), self._key(job, kind, "pending")],
+            args=[f"{kind}|{key}", self._key("item", ""), job, kind, str(key), json.dumps(payload)]
+        )
+        return int(item_id) if item_id is not None else None
+
+    def _requeue_expired(self,job: str):
+        self.requeue_script(keys=[self._key(job, "leases")], args=[time.time(), self._key("item", ""), self._key(job, ""), self.max_attempts])
+
+    def lease(self,job: str,kind: str,worker: str,lease_seconds: float = LEASE_SECONDS):
+        self._requeue_expired(job)
+        leased = self.lease_script(
+            keys=[self._key(job, kind, "pending"), self._key(job, "leases")],
+            args=[time.time() + lease_seconds, worker, self._key("item", "")]
+        )
+        if not leased:
+            return None
+        item_id, attempts, key, payload = leased
+        return {'id': int(item_id), 'job': job, 'kind': kind, 'key': key, 'payload': json.loads(payload),
+                'worker': worker, 'attempts': int(attempts)}
+
+    def complete(self,item: dict):
+        self.client.zrem(self._key(item['job'], "leases"), item['id'])
+        self.client.hset(self._key("item", item['id']), 'state', 'done')
+        self.client.hincrby(self._key(item['job'], "counts"), 'done', 1)
+
+    def fail(self,item: dict):
+        # MULTI/EXEC, the item leaves the leases and gets its new state together
+        transaction = self.client.pipeline()
+        transaction.zrem(self._key(item['job'], "leases"), item['id'])
+        if item['attempts'] >= self.max_attempts:
+            transaction.hset(self._key("item", item['id']), 'state', 'dead')
+            transaction.hincrby(self._key(item['job'], "counts"), 'dead', 1)
+        else:
+            transaction.hset(self._key("item", item['id']), 'state', 'pending')
+            transaction.rpush(self._key(item['job'], item['kind'], "pending"), item['id'])
+        transaction.execute()
+
+    def counts(self,job: str):
+        self._requeue_expired(job)
+        finished = self.client.hgetall(self._key(job, "counts"))
+        return {
+            'pending': sum(self.client.llen(self._key(job, kind, "pending")) for kind in KINDS),
+            'leased': self.client.zcard(self._key(job, "leases")),
+            'done': int(finished.get('done', 0)),
+            'dead': int(finished.get('dead', 0)),
+        }
+
+def open_queue(url: str):
+    """memory://, sqlite:///path/to/queue.sqlite or redis://host:port/db"""
+    scheme = urlsplit(url).scheme
+    if scheme == 'memory':
+        return MemoryLeaseQueue()
+    if scheme == 'sqlite':
+        return SQLiteLeaseQueue(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url[len("sqlite://"):])
+    if scheme in ('redis', 'rediss'):
+        return RedisLeaseQueue(url)
+    raise ValueError(f"Unknown work queue backend {url}")
+
+def seed_pages(queue,site: str,tag: str,first_page: int,pages: int):
+    """Coordinator side, queues the search pages of a job, pages already queued are left alone."""
+    job = job_name(site, tag)
+    added = sum(1 for page_idx in range(first_page, first_page + pages) if queue.put(job, 'page', page_idx, page_idx) is not None)
+    print(f"Queued {added} new pages of {job} ({pages - added} were already queued)")
+    return added
+
+class QueueWorker():
+    """Worker side, runs a scraper's extract_posts/extract_srcs/download_image stages on leased items.
+
+    A page item lists its posts and queues them, a post item resolves its srcs and queues
+    them, and a src item is downloaded with its queue id as image index, so names stay
+    unique across machines. Items are completed only after their results are queued.
+    """
+
+    def __init__(self,queue,scraper,site: str,threads: int = WORKER_THREADS,lease_seconds: float = LEASE_SECONDS,worker_id: str = None):
+        self.queue = queue
+        self.scraper = scraper
+        self.job = job_name(site, scraper.tag)
+        self.threads = threads
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = Lock()
+        self.page_lock = Lock()
+        self.stats = {'page': 0, 'post': 0, 'src': 0, 'failed': 0}
+        self.extract_posts = scraper.extract_posts
+        self.extract_srcs = scraper.extract_srcs
+
+    def _process(self,item: dict):
+        if item['kind'] == 'page':
+            # extract_posts reads and moves scraper.page_idx, one page at a time per worker
+            with self.page_lock:
+                self.scraper.page_idx = item['payload']
+                posts_ids = self.extract_posts()
+            # The stages print and swallow their own errors and return None, the item goes back to the queue
+            if posts_ids is None:
+                return False
+            for post_id in posts_ids:
+                self.queue.put(self.job, 'post', post_id, post_id)
+            return True
+        if item['kind'] == 'post':
+            images_srcs = self.extract_srcs(item['payload'])
+            if images_srcs is None:
+                return False
+            for image_src, post_id in images_srcs:
+                self.queue.put(self.job, 'src', image_src, [image_src, post_id])
+            return True
+        image_src, post_id = item['payload']
+        return bool(self.scraper.download_image(self.scraper.session, item['id'] - 1, image_src, post_id))
+
+    def _lease_any(self):
+        for kind in KINDS:
+            item = self.queue.lease(self.job, kind, self.worker_id, self.lease_seconds)
+            if item:
+                return item
+        return None
+
+    def _work(self):
+        while True:
+            item = self._lease_any()
+            if item is None:
+                counts = self.queue.counts(self.job)
+                if not counts['pending'] and not counts['leased']:
+                    return
+                time.sleep(POLL_SECONDS)    # other workers still hold leases that may queue more items
+                continue
+            try:
+                processed = self._process(item)
+            except Exception as e:
+                print(f"Exception Occurred On {item['kind']} {item['key']}: {e}")
+                processed = False
+            if processed:
+                self.queue.complete(item)
+            else:
+                self.queue.fail(item)
+            with self.lock:
+                self.stats[item['kind'] if processed else 'failed'] += 1
+
+    def run(self):
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Worker {self.worker_id} Finished With {self.stats['page']} Pages, {self.stats['post']} Posts And {self.stats['src']} Images ({self.stats['failed']} Failed) : {self.queue.counts(self.job)}")
+        return self.stats
+
+def make_worker_scraper(site: str,tag: str,output_folder: str,browser: str = 'chrome',dedup_store=None):
+    """A site scraper with its session ready, used only for its stage methods."""
+    from tqdm import tqdm
+    from lib_sessions import SESSIONS, credentials_key
+    os.makedirs(output_folder, exist_ok=True)
+    # The queue holds the budget, the scraper's own one only has to never run out
+    common = dict(tag=tag, max_images_posts=10 ** 9, page_idx=1, output_folder=output_folder, file_name=tag, dedup_store=dedup_store, checkpoint=False)
+    credentials = None
+    if site == 'pixiv':
+        from lib_cookies import PixivCookies
+        from pixiv_scraper.pixiv_api_scraper import PixivScraper
+        scraper = PixivScraper(browser=browser, pixiv_cookies_manager=PixivCookies(), **common)
+        if not scraper.login():
+            raise RuntimeError("Pixiv login failed")
+        credentials = credentials_key(scraper.pixiv_cookies_manager._wait_load_cookies())
+    elif site == 'zerochan':
+        from zerochan_scraper.zerochan_api_scraper import ZeroChanScraper
+        scraper = ZeroChanScraper(**common)
+    elif site == 'danbooru':
+        from danbooru_scraper.danbooru_api_scraper import DanbooruScraper
+        scraper = DanbooruScraper(stopped_at_download_idx=0, **common)
+    else:
+        raise ValueError(f"Unsupported site {site}")
+    scraper.session = SESSIONS.get(urlsplit(scraper.base_url).hostname, scraper._make_session, credentials)
+    scraper.progress_bar = tqdm(desc=f"{site} {tag}", unit="Image", colour='red')
+    return scraper
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape one job from several machines through a shared lease queue")
+    parser.add_argument("role", choices=['coordinator', 'worker', 'status'])
+    parser.add_argument("--queue", required=True, help="sqlite:///shared/queue.sqlite, redis://host:6379/0 or memory://")
+    parser.add_argument("--site", required=True, choices=['pixiv', 'zerochan', 'danbooru'])
+    parser.add_argument("--tag", required=True)
+    parser.add_argument("--first-page", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=10, help="coordinator: search pages to queue")
+    parser.add_argument("--output-dir", default="../scraped_datasets")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS)
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    parser.add_argument("--browser", choices=['chrome', 'firefox'], default='chrome')
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue)
+    if args.role == 'coordinator':
+        seed_pages(queue, args.site, args.tag, args.first_page, args.pages)
+    elif args.role == 'status':
+        print(json.dumps(queue.counts(job_name(args.site, args.tag))))
+    else:
+        from lib_http_cache import use_cache, DEFAULT_CACHE_NAME
+        os.makedirs(args.output_dir, exist_ok=True)
+        use_cache(os.path.join(args.output_dir, DEFAULT_CACHE_NAME))
+        scraper = make_worker_scraper(args.site, args.tag, os.path.join(args.output_dir, f"{args.tag}_scraped"), args.browser)
+        QueueWorker(queue, scraper, args.site, args.threads, args.lease_seconds).run()
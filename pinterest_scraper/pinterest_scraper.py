@@ -1,34 +1,48 @@
 import os
 import time
 import requests
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
 import concurrent.futures
 import re
+from threading import Lock
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from lib_download import fetch_image
+from lib_rate_limit import RateLimitedAdapter
+from lib_sessions import SESSIONS
+from lib_webdriver_pool import shared_pool, driver_binary
+
+SITE = "pinterest"
+DOWNLOAD_WORKERS = 5
 
 class PinterestScraper:
-    def __init__(self, search_query, output_folder, folder_name, max_images):
+    def __init__(self, search_query, output_folder, folder_name, max_images, dedup_store=None):
         self.search_query = search_query
         self.output_folder = output_folder
         self.folder_name = folder_name
         self.max_images = max_images
+        self.dedup_store = dedup_store
+        self.drivers = shared_pool("pinterest_chrome", self.setup_driver, 1)
+        self.driver = None
+        self.lock = Lock()
+        self.stats = None
         
     def setup_driver(self):
+        # Selenium loads with the first browser, not with the module
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
         options = Options()
         #options.add_argument('--headless=new')
         options.add_argument("--window-size=1280,720")
         options.add_argument('--log-level=3')  # This suppresses the DevTools message
         options.add_experimental_option('excludeSwitches', ['enable-logging'])  # This suppresses console logging
-        service = Service(ChromeDriverManager().install())
+        service = Service(driver_binary('chrome'))
         return webdriver.Chrome(service=service, options=options)
     
     def wait_for_images(self):
-        self.driver = self.setup_driver()
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
         url = f"https://www.pinterest.com/search/pins/?q={self.search_query}&rs=typed"
         print(f"Searching Pinterest for '{self.search_query}'...")
         self.driver.get(url)
@@ -49,6 +63,7 @@ class PinterestScraper:
 
 
     def extract_image_urls(self):
+        from selenium.webdriver.common.by import By
         image_urls = set()
         images = self.driver.find_elements(By.CSS_SELECTOR, "img[src*='pinimg.com']")
         for img in images:
@@ -96,39 +111,68 @@ class PinterestScraper:
 
         return list(image_urls)
 
+    def _make_session(self):
+        # Image GETs go through the shared per-host limiter like the API scrapers' requests
+        session = requests.Session()
+        adapter = RateLimitedAdapter(
+            pool_connections=10,
+            pool_maxsize=DOWNLOAD_WORKERS,
+            max_retries=Retry(
+                total=4,
+                backoff_factor=1,
+                status_forcelist=[429, 503]
+            )
+        )
+        session.headers.update({
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+        })
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     def download_image(self, args):
         idx, img_url = args
         img_name = self.folder_name+"_idx_"+str(idx)+".jpg"
         file_path = os.path.join(self.output_folder,img_name)
         try:
-            response = requests.get(img_url).content
-            with open(file_path, 'wb') as file:
-                file.write(response)
+            if fetch_image(SESSIONS.get(urlsplit(img_url).hostname, self._make_session), img_url, file_path, dedup_store=self.dedup_store, site=SITE):
                 print(f'Successfully downloaded image {idx+1}')
-            return
+                self._count('downloaded')
+                return
         except Exception as e:
             print(f"Failed to download image Error: {e}")
+        self._count('failed')
+
+    def _count(self,outcome):
+        with self.lock:
+            self.stats[outcome] += 1
 
     def scrape(self):
         """Main scraping method."""
         os.makedirs(self.output_folder, exist_ok=True)
         
         try:
-            self.wait_for_images()
-            # Scroll and collect images
-            print("Scrolling to load images...")
-            img_urls = self.scroll_and_extract()
+            # The browser goes back warm to the pool as soon as the urls are collected, or is quit when it broke
+            with self.drivers.driver() as driver:
+                self.driver = driver
+                try:
+                    self.wait_for_images()
+                    # Scroll and collect images
+                    print("Scrolling to load images...")
+                    img_urls = self.scroll_and_extract() or []
+                finally:
+                    self.driver = None
                 
             print(f"\nFound {len(img_urls)} unique high-resolution images.")
+            self.stats = {'srcs': len(img_urls[:self.max_images]), 'downloaded': 0, 'failed': 0}
             
             print("Downloading images...")
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
                 executor.map(
                     self.download_image, 
                     enumerate(img_urls[:self.max_images])
                 )
         finally:
-            self.driver.quit()
             print("Scraping completed!")
 
 if __name__ == "__main__":
@@ -1,38 +1,40 @@
 import os
 import requests
-from selenium.webdriver import firefox,chrome,Firefox,Chrome
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.firefox import GeckoDriverManager
 from lib_cookies import PixivCookies
-import concurrent.futures as THREAD
+from lib_webdriver_pool import shared_pool, driver_binary
+from lib_api_scraper import ApiScraper
+from lib_http_cache import CachingAdapter
+from lib_sessions import credentials_key
+from lib_download_scheduler import estimate_bytes, SAMPLE_BYTES_PER_PIXEL
+from lib_dedup_store import DedupStore
+from lib_postprocess import Postprocessor
+from lib_metadata_store import MetadataStore
+from pixiv_scraper.pixiv_resolver import PixivResolver, regular_url, REGULAR_SIDE
 from datetime import datetime
-from tqdm import tqdm
-from threading import Lock
-import time
 
 MAX_WORKERS_EXTRACT_SRCS = 10
 MAX_WORKERS_DOWNLOAD_IMAGES = 10
+SITE = "pixiv"
+RATINGS = {0: 'general', 1: 'r18', 2: 'r18g'}  # xRestrict of the search records
 
-class PixivScraper():
+class PixivScraper(ApiScraper):
 
-    def __init__(self,tag: str,max_images_posts: int,page_idx: int,output_folder: str,file_name: str, browser: str,pixiv_cookies_manager: PixivCookies):
+    site = SITE
+
+    def __init__(self,tag: str,max_images_posts: int,page_idx: int,output_folder: str,file_name: str, browser: str,pixiv_cookies_manager: PixivCookies,download_backend: str = 'threads',dedup_store: DedupStore = None,checkpoint: bool = True,incremental: bool = False,postprocessor: Postprocessor = None,output_mode: str = 'files',metadata_store: MetadataStore = None):
+        super().__init__(tag, max_images_posts, page_idx, output_folder, file_name, MAX_WORKERS_EXTRACT_SRCS, MAX_WORKERS_DOWNLOAD_IMAGES, download_backend, dedup_store, checkpoint, incremental, postprocessor, output_mode, metadata_store)
         self.base_url = "https://www.pixiv.net/en"
+        self.ajax_url = "https://www.pixiv.net/ajax"
         self.login_path = "https://accounts.pixiv.net/login"
-        self.tag = tag
-        self.max_images_posts = max_images_posts
-        self.page_idx = page_idx
-        self.output_folder = output_folder
-        self.file_name = file_name
         self.browser = browser
         self.pixiv_cookies_manager = pixiv_cookies_manager
         self.driver = None
-        self.session = None
-        self.progress_bar = None
-        self.lock = Lock()
+        self.resolver = PixivResolver(self._fetch_pages)
 
     def init_driver_service_options(self):
-        
-        options = self.browser.options.Options()
+        # Selenium is only loaded when a login browser really has to start
+        from selenium.webdriver import firefox,chrome,Firefox,Chrome
+        options = (firefox if self.browser == 'firefox' else chrome).options.Options()
         #options.add_argument('--headless')
         #options.add_argument('--no-sandbox')  # Bypass OS security model, required in some environments
         options.add_argument('--disable-dev-shm-usage')  # Overcome limited resource problems
@@ -44,17 +46,18 @@ class PixivScraper():
         options.add_argument('--disable-popup-blocking')  # Disable popup blocking
         options.add_argument('--dns-prefetch-disable')
         options.add_argument("--window-size=1280,720")
-        if self.browser == 'firefox':
-            service = firefox.service.Service(GeckoDriverManager().install())
-            driver = Firefox(service=service,options=options)
-        else:
-            service = chrome.service.Service(ChromeDriverManager().install())
-            driver = Chrome(service=service,options=options)
+        browser, service_module = (Firefox, firefox) if self.browser == 'firefox' else (Chrome, chrome)
+        try:
+            driver = browser(service=service_module.service.Service(driver_binary(self.browser)),options=options)
+        except Exception as e:
+            # The cached driver may predate a browser update, resolve it again once
+            print(f"Driver start failed, resolving the driver again : {e}")
+            driver = browser(service=service_module.service.Service(driver_binary(self.browser, refresh=True)),options=options)
         return driver
 
     def _make_session(self):
         session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(
+        adapter = CachingAdapter(
             pool_connections=30,
             pool_maxsize=60,
             max_retries=3
@@ -77,20 +80,22 @@ class PixivScraper():
 
         all_ids = set()
         retrieved_posts_ids = []
-        url = f"https://www.pixiv.net/ajax/search/illustrations/{self.tag}"
+        url = f"{self.ajax_url}/search/illustrations/{self.tag}?word={self.tag}&p={self.page_idx}"
         headers = {
             "Referer": search_url,
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
         }
         try:
-            response = requests.get(url,headers=headers)
+            response = self.session.get(url,headers=headers)
             print(f"\nLoading on page {self.page_idx}\n")
             if response.status_code != 200:
                 print(f"{response.status_code} is the status code : not 200")
-                return []
+                return None
             data_body = response.json()
             body = data_body.get('body',{}) 
             illust = body.get("illust",{}).get("data",[])
+            # The search records already hold the page count and thumbnail of every post
+            self.resolver.remember(illust)
             for post_id in illust:
                 extracted_id = post_id.get('id',None)
                 if extracted_id:
@@ -106,126 +111,100 @@ class PixivScraper():
             return retrieved_posts_ids
         except Exception as e:
             print(f"Error occurred in extract_posts: {e}")
-            return []
+            return None
 
-    def extract_srcs(self,post_id: int):
+    def _fetch_pages(self,post_id):
         images_srcs = []
-        url = f"https://www.pixiv.net/ajax/illust/{post_id}/pages"
+        url = f"{self.ajax_url}/illust/{post_id}/pages"
         try:
-            response = requests.get(url)
+            response = self.session.get(url)
             if response.status_code != 200:
                 print(f"{response.status_code} is the status code : not 200")
-                return []
-            image_src = response.json()
-            body = image_src.get('body',[]) 
-            for url in body:
-                image_src = url.get("urls",{}).get("original","regular")  # Use "original" or other sizes if needed
-                images_srcs.append((image_src, post_id))
-                print(f"for post {post_id} :src {image_src}")
+                return None
+            body = response.json().get('body',[])
+            for page in body:
+                urls = page.get("urls",{})
+                image_src = urls.get("original") or urls.get("regular")  # Use "original" or other sizes if needed
+                if image_src:
+                    images_srcs.append(image_src)
         except Exception as e:
             print(f"Error processing post {post_id}: {str(e)}")
+            return None
+        return images_srcs
 
+    def extract_srcs(self,post_id: int):
+        # Single page works come from the search payload, only albums cost a /pages request
+        urls = self.resolver.resolve(post_id)
+        if urls is None:
+            return None
+        images_srcs = [(image_src, post_id) for image_src in urls]
+        for image_src, _ in images_srcs:
+            print(f"for post {post_id} :src {image_src}")
         return images_srcs
 
-    def download_image(self,session: requests.Session ,idx: int,image_src: str,post_id: int):
+    def _image_path(self,idx: int):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         image_name = f"{self.file_name}_{idx + 1:04d}_{timestamp}.jpg"
-        image_path = os.path.join(self.output_folder, image_name)
-        try:
-            headers = {
-                "Referer": f"{self.base_url}/artworks/{post_id}",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            }
-            response = session.get(image_src,headers=headers)
-            if response.status_code != 200:
-                print(f"Failed to fetch image {image_src}")
-                return
-            response.raise_for_status() 
-            try:
-                with open(image_path, 'wb') as image:
-                    image.write(response.content)
-                with self.lock:
-                    self.progress_bar.update(1)
-                    time.sleep(0.0005)
-            except Exception as e:
-                print(f"Image {image_src} Is Not Downloaded")
-        except Exception as e:
-            print(f"Error downloading image {image_name}:{e}")
-
-    def multi_threading_extract_srcs(self, posts_ids: list[int]):
-        print("Multi Threading Of SRCs Extraction BEGIN....")
-        combined_images_srcs = set()
-        combined_posts_ids = []
-        
-        with THREAD.ThreadPoolExecutor(max_workers=MAX_WORKERS_EXTRACT_SRCS) as EXE:
-            try:
-                # Execute extract_srcs for each post_id and collect results
-                all_results = []
-                results = EXE.map(self.extract_srcs, posts_ids)
-                
-                for result in results:
-                    all_results.extend(result)
-                
-                # Process results while maintaining the relationship
-                for img_src, post_id in all_results:
-                    combined_images_srcs.add(img_src)
-                    combined_posts_ids.append(post_id)
-                        
-            except Exception as e:
-                print(f"Exception Occurred During Multi Threading Extract Srcs: {e}")
-                return set(), []
-        
-        print(f"All Srcs Located With Total {len(combined_images_srcs)} : Combined Posts Urls : {len(combined_posts_ids)}")
-        return combined_images_srcs, combined_posts_ids
-
-    def multi_threading_download_images(self,images_srcs: list[str],posts_ids: list[int]):
-        print("Multi Threading Of Downloading Images BEGIN....")
-        self.session = self._make_session()
-        with THREAD.ThreadPoolExecutor(max_workers=MAX_WORKERS_DOWNLOAD_IMAGES) as executor:
-            executor.map(
-                lambda args: self.download_image(self.session, *args),
-                zip(
-                    range(0, len(images_srcs)),
-                    images_srcs,
-                    posts_ids
-                )
-            )
-
-    def scrape(self):
-        try:
-            os.makedirs(self.output_folder,exist_ok=True)
-            if not self.pixiv_cookies_manager._wait_load_cookies():
-                self.driver = self.init_driver_service_options()
-                is_cookies_created = self.pixiv_cookies_manager._wait_create_cookies(self.driver,self.base_url,self.login_path)
-                if not is_cookies_created:
-                    print(f"ERROR COOKIES DRIVER CREATION, LEAVING... {e}")
-                    return
-            self.progress_bar = tqdm(
-                total=self.max_images_posts,
-                desc="Scraping Images",
-                unit="Image",
-                bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]",
-                colour='red',
-                leave=True
-            )
-            while self.max_images_posts > 0:
-                if self.max_images_posts <= 0:
-                    break
-                retrieved_posts_ids = self.extract_posts()
-                if len(retrieved_posts_ids) == 0:
-                    print("extract_posts returned nothing...")
-                    break
-                try:
-                    images_srcs,posts_ids = self.multi_threading_extract_srcs(retrieved_posts_ids)
-                    if not images_srcs:
-                        print("multithreading extract srcs returned nothing...")
-                        break
-                    self.multi_threading_download_images(images_srcs,posts_ids)
-                    self.max_images_posts -= len(retrieved_posts_ids)
-                except Exception as e:
-                    print(f"Failed to process post after we retrieved the posts in scrap method: {e}")
-                    continue
-        except Exception as e:
-            print(f"Error Occured in Scrape Method : {e}")
-        finally:
-            print(f"Finished.. Quiting Process START")
\ No newline at end of file
+        return os.path.join(self.output_folder, image_name)
+
+    def _image_headers(self,post_id: int):
+        return {
+            "Referer": f"{self.base_url}/artworks/{post_id}",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+        }
+
+    def _candidates(self,image_src: str):
+        # Originals guessed from the search are tried as jpg first, then png and gif
+        return self.resolver.candidates(image_src)
+
+    def _post_metadata(self,post_id: int):
+        # Everything comes from the search record the listing kept, no extra request per post
+        record = self.resolver.record(post_id)
+        return {
+            'tags': record.get('tags', []),
+            'title': record.get('title'),
+            'author': record.get('userName'),
+            'author_id': record.get('userId'),
+            'rating': RATINGS.get(record.get('xRestrict')),
+            'width': record.get('width'),
+            'height': record.get('height'),
+            'created': record.get('createDate'),
+            'page_url': f"{self.base_url}/artworks/{post_id}",
+            'page_count': record.get('pageCount'),
+            'illust_type': record.get('illustType'),
+            'ai_type': record.get('aiType'),
+        }
+
+    def _image_size(self,image_src: str,post_id: int):
+        # The search record has the dimensions of the first page, the pages of an album are usually alike
+        record = self.resolver.record(post_id)
+        return estimate_bytes(record.get('width'), record.get('height'))
+
+    def _smaller_rendition(self,image_src: str,post_id: int):
+        regular_src = regular_url(image_src)
+        if not regular_src:
+            return None
+        record = self.resolver.record(post_id)
+        return regular_src, estimate_bytes(record.get('width'), record.get('height'), SAMPLE_BYTES_PER_PIXEL, REGULAR_SIDE, REGULAR_SIDE)
+
+    def login(self):
+        """Makes sure the login cookies exist, opening a browser only when they do not."""
+        if self.pixiv_cookies_manager._wait_load_cookies():
+            return True
+        # Login browsers stay warm in a pool, a second login in this process skips the startup
+        drivers = shared_pool(f"pixiv_{self.browser}", self.init_driver_service_options, 1)
+        with drivers.driver() as driver:
+            return bool(self.pixiv_cookies_manager._wait_create_cookies(driver,self.base_url,self.login_path))
+
+    def _prepare(self):
+        if not self.login():
+            print(f"ERROR COOKIES DRIVER CREATION, LEAVING...")
+            return False
+        return True
+
+    def _session_credentials(self):
+        # Keep-alive session shared with every earlier Pixiv scrape that used the same cookies
+        return credentials_key(self.pixiv_cookies_manager._wait_load_cookies())
+
+    def _finished(self,stats: dict):
+        print(f"Resolved Posts : {self.resolver.stats}")
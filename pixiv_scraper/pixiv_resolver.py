@@ -0,0 +1,100 @@
+import re
+import threading
+from threading import Lock
+
+UGOIRA_ILLUST_TYPE = 2
+# Search thumbnails look like https://i.pximg.net/c/250x250_80_a2/img-master/img/2024/01/31/12/00/00/115000000_p0_square1200.jpg
+THUMBNAIL_DATE = re.compile(r"^(https?://[^/]+)/.*?/img/(\d{4}/\d{2}/\d{2}/\d{2}/\d{2}/\d{2})/(\d+)_p0")
+ORIGINAL_URL = "{origin}/img-original/img/{date}/{post_id}_p0.{ext}"
+ORIGINAL_EXTENSIONS = ("jpg", "png", "gif")
+# https://i.pximg.net/img-original/img/<date>/115000000_p0.png has a 1200px jpg at img-master/img/<date>/115000000_p0_master1200.jpg
+ORIGINAL_PATH = re.compile(r"/img-original/(img/.+?_p\d+)\.\w+$")
+REGULAR_SIDE = 1200
+
+def regular_url(image_src: str):
+    """The 1200px "regular" rendition of an original url, None for any other url."""
+    if not ORIGINAL_PATH.search(image_src):
+        return None
+    return ORIGINAL_PATH.sub(rf"/img-master/\1_master{REGULAR_SIDE}.jpg", image_src)
+
+class PixivResolver():
+    """Resolves Pixiv post ids to image urls with as few /ajax/illust/{id}/pages calls as possible.
+
+    Single page works are resolved from the search payload alone and concurrent lookups of
+    the same id share one request. The /pages answers themselves are kept by the HTTP cache
+    of the session (see lib_http_cache), not here.
+    """
+
+    def __init__(self,fetch_pages):
+        self.fetch_pages = fetch_pages      # (post_id) -> list of urls, the /pages request, None when it failed
+        self.records = {}
+        self.guessed = set()
+        self.inflight = {}
+        self.lock = Lock()
+        self.stats = {'search': 0, 'coalesced': 0, 'fetched': 0}
+
+    def remember(self,illusts: list[dict]):
+        """Keeps the search records (pageCount, url, width, height...) instead of throwing them away."""
+        with self.lock:
+            for illust in illusts:
+                if illust.get('id'):
+                    self.records[str(illust['id'])] = illust
+
+    def record(self,post_id):
+        """The search record of a post, empty when it was not listed by this scraper."""
+        with self.lock:
+            return self.records.get(str(post_id), {})
+
+    def _from_search(self,post_id: str):
+        with self.lock:
+            record = self.records.get(post_id)
+        if not record or record.get('pageCount') != 1 or record.get('illustType') == UGOIRA_ILLUST_TYPE:
+            return None
+        match = THUMBNAIL_DATE.search(record.get('url') or '')
+        if not match or match.group(3) != post_id:
+            return None
+        # The search payload has no extension for originals, jpg is the common case and candidates() covers the rest
+        original_url = ORIGINAL_URL.format(origin=match.group(1), date=match.group(2), post_id=post_id, ext=ORIGINAL_EXTENSIONS[0])
+        with self.lock:
+            self.guessed.add(original_url)
+        return [original_url]
+
+    def candidates(self,image_src: str):
+        """Urls to try in order for image_src, the other extensions when it was guessed from the search."""
+        with self.lock:
+            guessed = image_src in self.guessed
+        if not guessed:
+            return [image_src]
+        base = image_src.rsplit(".", 1)[0]
+        return [f"{base}.{ext}" for ext in ORIGINAL_EXTENSIONS]
+
+    def resolve(self,post_id):
+        post_id = str(post_id)
+        urls = self._from_search(post_id)
+        if urls:
+            self._count('search')
+            return urls
+
+        with self.lock:
+            inflight = self.inflight.get(post_id)
+            leader = inflight is None
+            if leader:
+                inflight = {'done': threading.Event(), 'urls': []}
+                self.inflight[post_id] = inflight
+        if not leader:
+            inflight['done'].wait()
+            self._count('coalesced')
+            return inflight['urls']
+        try:
+            urls = self.fetch_pages(post_id)
+            self._count('fetched')
+            inflight['urls'] = urls
+            return urls
+        finally:
+            with self.lock:
+                self.inflight.pop(post_id, None)
+            inflight['done'].set()
+
+    def _count(self,key: str):
+        with self.lock:
+            self.stats[key] += 1
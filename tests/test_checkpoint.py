@@ -0,0 +1,52 @@
+import os
+from lib_checkpoint import CheckpointJournal, journal_path
+
+def _journal(tmp_path):
+    return CheckpointJournal(journal_path(str(tmp_path), "zerochan", "Hatsune Miku"))
+
+def test_journal_path_is_safe_and_per_shard(tmp_path):
+    assert os.path.basename(journal_path(str(tmp_path), "zerochan", "a/b c")) == ".zerochan_a_b_c_checkpoint.jsonl"
+    assert journal_path(str(tmp_path), "zerochan", "a", 3).endswith("_shard3_checkpoint.jsonl")
+
+def test_fresh_journal_is_not_resumed(tmp_path):
+    journal = _journal(tmp_path)
+    assert not journal.resumed
+    journal.close()
+
+def test_resume_knows_pending_posts_and_srcs(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record_page(2, [10, 11, 12])
+    journal.record_srcs(10, [(0, "http://h/a.jpg", 10), (1, "http://h/b.jpg", 10)])
+    journal.record_srcs(11, [(2, "http://h/c.jpg", 11)])
+    journal.record_done(0, "http://h/a.jpg", 10, "/out/a.jpg")
+    journal.close()
+
+    resumed = _journal(tmp_path)
+    assert resumed.resumed
+    assert resumed.page_idx == 2
+    assert resumed.pending_posts() == [12]
+    assert sorted(resumed.pending_srcs()) == [(1, "http://h/b.jpg", 10), (2, "http://h/c.jpg", 11)]
+    assert resumed.next_idx == 3
+    assert resumed.downloaded == {"http://h/a.jpg": "/out/a.jpg"}
+    assert resumed.known_srcs() == {"http://h/a.jpg", "http://h/b.jpg", "http://h/c.jpg"}
+    resumed.close()
+
+def test_torn_last_line_is_skipped_and_ended(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record_page(2, [10])
+    journal.close()
+    with open(journal.path, 'a') as file:
+        file.write('{"event": "done", "idx": 0, "sr')     # the crash
+    resumed = _journal(tmp_path)
+    assert resumed.downloaded == {}
+    resumed.record_done(0, "http://h/a.jpg", 10, "/out/a.jpg")
+    resumed.close()
+    assert _journal(tmp_path).downloaded == {"http://h/a.jpg": "/out/a.jpg"}
+
+def test_finished_journal_is_renamed(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record_page(2, [10])
+    journal.close(finished=True)
+    assert not os.path.exists(journal.path)
+    assert os.path.exists(journal.path + ".done")
+    assert not _journal(tmp_path).resumed
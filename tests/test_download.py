@@ -0,0 +1,60 @@
+import hashlib
+import threading
+import pytest
+from lib_download import ByteBudget, stream_to_file, transfer_bytes, UNKNOWN_TRANSFER_BYTES
+
+class FakeResponse():
+    def __init__(self,body: bytes,headers: dict = None,on_chunk=None):
+        self.body = body
+        self.headers = {'Content-Length': str(len(body))} if headers is None else headers
+        self.on_chunk = on_chunk
+
+    def iter_content(self,chunk_size: int):
+        for start in range(0, len(self.body), chunk_size):
+            if self.on_chunk:
+                self.on_chunk()
+            yield self.body[start:start + chunk_size]
+
+def test_transfer_bytes():
+    assert transfer_bytes({'Content-Length': '2048'}) == 2048
+    assert transfer_bytes({}) == UNKNOWN_TRANSFER_BYTES
+
+def test_stream_to_file_writes_the_whole_body(tmp_path):
+    body = bytes(range(256)) * 100
+    path = str(tmp_path / "a.jpg")
+    size, sha256 = stream_to_file(FakeResponse(body), path, chunk_size=1000, budget=ByteBudget(10 ** 6))
+    assert size == len(body)
+    assert sha256 == hashlib.sha256(body).hexdigest()
+    assert open(path, 'rb').read() == body
+
+def test_truncated_body_leaves_no_file(tmp_path):
+    path = str(tmp_path / "a.jpg")
+    budget = ByteBudget(10 ** 6)
+    with pytest.raises(IOError):
+        stream_to_file(FakeResponse(b"x" * 10, {'Content-Length': '20'}), path, budget=budget)
+    assert not (tmp_path / "a.jpg").exists()
+    assert not (tmp_path / "a.jpg.part").exists()
+    assert budget.in_flight == 0
+
+def test_transfer_holds_its_length_until_done(tmp_path):
+    budget = ByteBudget(1000)
+    seen = []
+    response = FakeResponse(b"x" * 600, on_chunk=lambda: seen.append(budget.in_flight))
+    stream_to_file(response, str(tmp_path / "a.jpg"), chunk_size=100, budget=budget)
+    assert seen == [600] * 6
+    assert budget.in_flight == 0
+
+def test_budget_makes_large_transfers_wait():
+    budget = ByteBudget(1000)
+    first = budget.acquire(600)
+    second = threading.Thread(target=lambda: budget.release(budget.acquire(600)))
+    second.start()
+    second.join(0.1)
+    assert second.is_alive()
+    budget.release(first)
+    second.join(1.0)
+    assert not second.is_alive()
+
+def test_transfer_larger_than_the_cap_runs_alone():
+    budget = ByteBudget(1000)
+    assert budget.acquire(5000) == 1000
@@ -0,0 +1,80 @@
+import time
+import threading
+from lib_download_scheduler import DownloadScheduler, LargeTransfers, estimate_bytes
+
+MB = 1024 * 1024
+STOP = object()
+
+def _scheduler(sizes: dict,**kwargs):
+    kwargs.setdefault('large_transfers', LargeTransfers(1))
+    return DownloadScheduler(size_of=lambda image_src, post_id: sizes.get(image_src), large_bytes=8 * MB, **kwargs)
+
+def test_estimate_bytes():
+    assert estimate_bytes(None, 100) is None
+    assert estimate_bytes(1000, 1000) == 500000
+    assert estimate_bytes(2000, 1000, 0.25, max_width=1000) == 125000
+
+def test_small_images_go_out_smallest_first():
+    scheduler = _scheduler({"a": 3 * MB, "b": 1 * MB, "c": 2 * MB})
+    for idx, src in enumerate("abc"):
+        scheduler.put((idx, src, idx))
+    assert [scheduler.get()[1] for _ in range(3)] == ["b", "c", "a"]
+
+def test_unknown_sizes_keep_the_idx_order():
+    scheduler = _scheduler({})
+    for idx in range(3):
+        scheduler.put((idx, f"s{idx}", idx))
+    assert [scheduler.get()[0] for _ in range(3)] == [0, 1, 2]
+    assert scheduler.stats['unknown'] == 3
+
+def test_large_transfers_are_capped():
+    scheduler = _scheduler({"big1": 20 * MB, "big2": 30 * MB, "small": 1 * MB})
+    for idx, src in enumerate(("big1", "big2", "small")):
+        scheduler.put((idx, src, idx))
+    first = scheduler.get()
+    assert first[1] == "big1"
+    assert scheduler.get()[1] == "small"    # the only large slot is taken
+    waiting = []
+    worker = threading.Thread(target=lambda: waiting.append(scheduler.get()))
+    worker.start()
+    worker.join(0.1)
+    assert worker.is_alive()
+    scheduler.done(first)
+    worker.join(1.0)
+    assert waiting[0][1] == "big2"
+
+def test_stop_markers_come_after_the_items():
+    scheduler = _scheduler({"a": MB})
+    scheduler.put((0, "a", 0))
+    scheduler.put(STOP)
+    assert scheduler.get()[1] == "a"
+    assert scheduler.get() is STOP
+
+def test_byte_budget_swaps_large_images_for_their_smaller_rendition():
+    scheduler = _scheduler({"big": 20 * MB}, smaller=lambda image_src, post_id: (image_src + ".sample", MB), byte_budget=0)
+    item = (0, "big", 0)
+    scheduler.put(item)
+    assert scheduler.get() == item
+    assert scheduler.source_of(item) == "big.sample"
+    assert scheduler.stats['smaller'] == 1
+    scheduler.done(item)
+    assert scheduler.source_of(item) == "big"
+
+def test_probe_moves_unknown_images_to_their_size():
+    answered = threading.Event()
+    def probe(image_src,post_id):
+        answered.set()
+        return 20 * MB
+    scheduler = _scheduler({"small": MB}, probe=probe)
+    scheduler.put((0, "unknown", 0))
+    answered.wait(1.0)
+    deadline = time.time() + 1.0
+    while scheduler.stats['probed'] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    scheduler.put((1, "small", 1))
+    assert scheduler.stats['probed'] == 1
+    assert scheduler.scheduled_bytes == 21 * MB
+    # Probed as large, it takes the free large slot ahead of the small image
+    assert [scheduler.get()[1] for _ in range(2)] == ["unknown", "small"]
+    assert scheduler.stats['large'] == 1
+    scheduler.close()
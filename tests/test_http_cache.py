@@ -0,0 +1,101 @@
+import os
+import time
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+from lib_rate_limit import RateLimitedAdapter
+from lib_http_cache import HttpCache, CachingAdapter, use_cache, current_cache, cache_path_for, DEFAULT_CACHE_NAME
+
+POST_URL = "https://www.zerochan.net/12345"
+
+class FakeResponse():
+    def __init__(self,body: bytes = b"<html>post</html>",status_code: int = 200,headers: dict = None):
+        self.content = body
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {'Content-Type': 'text/html', 'ETag': '"v1"', 'Content-Encoding': 'gzip'})
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HttpCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+@pytest.fixture(autouse=True)
+def no_process_cache():
+    use_cache(None)
+    yield
+    use_cache(None)
+
+def test_only_urls_with_a_rule_are_cached(cache):
+    assert cache.ttl_for(POST_URL) == 30 * 24 * 3600
+    assert cache.ttl_for("https://www.zerochan.net/Hatsune+Miku?p=2") == 300
+    assert cache.ttl_for("https://static.zerochan.net/a.jpg") is None
+
+def test_entry_round_trip_drops_wire_headers(cache):
+    cache.put("k", POST_URL, FakeResponse(), 60)
+    entry = cache.get("k")
+    assert entry['body'] == b"<html>post</html>"
+    assert entry['etag'] == '"v1"'
+    assert 'Content-Encoding' not in entry['headers']
+    assert entry['expires_at'] > time.time()
+
+def test_refresh_extends_the_ttl(cache):
+    cache.put("k", POST_URL, FakeResponse(), -1)
+    assert cache.get("k")['expires_at'] < time.time()
+    cache.refresh("k", 60)
+    assert cache.get("k")['expires_at'] > time.time()
+
+def test_least_recently_used_entries_are_evicted(cache):
+    body = os.urandom(4000)     # does not compress
+    cache.max_bytes = 10000
+    cache.put("a", POST_URL, FakeResponse(body), 60)
+    time.sleep(0.01)
+    cache.put("b", POST_URL, FakeResponse(body), 60)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", POST_URL, FakeResponse(body), 60)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats['evicted'] == 1
+    assert cache.total_bytes <= cache.max_bytes
+
+def test_cache_path_for(tmp_path):
+    assert cache_path_for(None, str(tmp_path)) == os.path.join(str(tmp_path), DEFAULT_CACHE_NAME)
+    assert cache_path_for(True, str(tmp_path)) == os.path.join(str(tmp_path), DEFAULT_CACHE_NAME)
+    assert cache_path_for("/x/cache.sqlite", str(tmp_path)) == "/x/cache.sqlite"
+    assert cache_path_for(False, str(tmp_path)) is None
+    assert cache_path_for('', str(tmp_path)) is None
+
+def _network(monkeypatch):
+    calls = []
+    def send(adapter, request, **kwargs):
+        calls.append(request.url)
+        return FakeResponse()
+    monkeypatch.setattr(RateLimitedAdapter, 'send', send)
+    return calls
+
+def test_adapter_serves_fresh_entries_without_the_network(tmp_path,monkeypatch):
+    calls = _network(monkeypatch)
+    use_cache(str(tmp_path / "cache.sqlite"))
+    adapter = CachingAdapter()
+    request = requests.Request('GET', POST_URL).prepare()
+    adapter.send(request)
+    response = adapter.send(request)
+    assert calls == [POST_URL]
+    assert response.content == b"<html>post</html>"
+    assert current_cache().stats['hits'] == 1
+
+def test_adapter_without_a_cache_goes_to_the_network(tmp_path,monkeypatch):
+    calls = _network(monkeypatch)
+    monkeypatch.chdir(tmp_path)
+    adapter = CachingAdapter()
+    request = requests.Request('GET', POST_URL).prepare()
+    adapter.send(request)
+    adapter.send(request)
+    assert len(calls) == 2
+    assert current_cache() is None
+    assert os.listdir(tmp_path) == []
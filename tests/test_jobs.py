@@ -0,0 +1,29 @@
+import os
+import lib_jobs
+from lib_jobs import run_job
+
+class FakeScraper():
+    def __init__(self,output_folder: str):
+        self.output_folder = output_folder
+        self.stats = None
+
+    def scrape(self):
+        self.stats = {'pages': 1, 'posts': 2, 'srcs': 2, 'downloaded': 2, 'failed': 0}
+
+def test_empty_output_dir_falls_back_to_the_default(tmp_path,monkeypatch):
+    default_dir = str(tmp_path / "datasets")
+    monkeypatch.setattr(lib_jobs, 'DEFAULT_OUTPUT_DIR', default_dir)
+    monkeypatch.setattr(lib_jobs, 'make_scraper', lambda config, output_folder, *stores: FakeScraper(output_folder))
+    result = run_job({'site': 'zerochan', 'tag': 'miku', 'count': 2, 'output_dir': '', 'check_images': False})
+    assert result['status'] == 'ok'
+    assert result['downloaded'] == 2
+    assert result['output_folder'] == os.path.join(default_dir, "miku_scraped")
+    assert os.path.exists(os.path.join(default_dir, lib_jobs.DEFAULT_INDEX_NAME))
+
+def test_unusable_output_dir_returns_a_failed_result(tmp_path,monkeypatch):
+    blocker = tmp_path / "a_file"
+    blocker.write_text("not a directory")
+    monkeypatch.setattr(lib_jobs, 'make_scraper', lambda config, output_folder, *stores: FakeScraper(output_folder))
+    result = run_job({'site': 'zerochan', 'tag': 'miku', 'count': 2, 'output_dir': str(blocker / "sub"), 'check_images': False})
+    assert result['status'] == 'failed'
+    assert result['error']
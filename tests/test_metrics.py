@@ -0,0 +1,65 @@
+import json
+import urllib.request
+from lib_metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+def test_counter_keeps_one_value_per_label_set():
+    counter = Counter("requests_total", "Requests")
+    counter.inc(host="a", status=200)
+    counter.inc(2, status=200, host="a")
+    counter.inc(host="b", status=429)
+    assert counter.summary() == {'{host="a",status="200"}': 3.0, '{host="b",status="429"}': 1.0}
+
+def test_gauge_callback():
+    gauge = Gauge("rate", "Rate", callback=lambda: [({'host': "a"}, 4.0)])
+    assert gauge.render()[-1] == 'rate{host="a"} 4.0'
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("seconds", "Latency", buckets=(1.0, 2.0))
+    for value in (0.5, 1.0, 1.5, 7.0):
+        histogram.observe(value)
+    lines = histogram.render()
+    assert 'seconds_bucket{le="1.0"} 2' in lines
+    assert 'seconds_bucket{le="2.0"} 3' in lines
+    assert 'seconds_bucket{le="+Inf"} 4' in lines
+    assert 'seconds_count 4' in lines
+
+def test_quantiles_interpolate_inside_their_bucket():
+    histogram = Histogram("seconds", "Latency", buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 0.5, 1.5, 3.0):
+        histogram.observe(value)
+    series = histogram._series()[()]
+    assert histogram._quantile(series, 0.5) == 1.0
+    assert histogram._quantile(series, 0.75) == 2.0
+    assert histogram._quantile(series, 0.25) == 0.5
+
+def test_quantile_in_the_inf_bucket_is_the_last_bound():
+    histogram = Histogram("seconds", "Latency", buckets=(1.0, 2.0))
+    histogram.observe(0.5)
+    for _ in range(9):
+        histogram.observe(100.0)
+    series = histogram._series()[()]
+    assert histogram._quantile(series, 0.99) == 2.0
+    assert histogram.summary()['all']['p99'] == 2.0
+
+def test_empty_histogram_has_no_quantiles():
+    histogram = Histogram("seconds", "Latency")
+    assert histogram.summary() == {}
+    assert histogram._quantile({'buckets': [0] * 14, 'sum': 0.0, 'count': 0}, 0.5) is None
+
+def test_registry_returns_the_first_metric_of_a_name():
+    registry = MetricsRegistry()
+    assert registry.counter("c", "C") is registry.counter("c", "C")
+
+def test_endpoint_serves_prometheus_text_and_json():
+    registry = MetricsRegistry()
+    registry.counter("hits_total", "Hits").inc(site="zerochan")
+    server = registry.serve(0)
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        text = urllib.request.urlopen(f"{base_url}/metrics").read().decode()
+        assert 'hits_total{site="zerochan"} 1.0' in text
+        summary = json.loads(urllib.request.urlopen(f"{base_url}/summary").read())
+        assert summary['hits_total'] == {'{site="zerochan"}': 1.0}
+    finally:
+        server.shutdown()
+        server.server_close()
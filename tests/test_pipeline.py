@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import Future
+from lib_pipeline import ScrapePipeline
+from lib_checkpoint import CheckpointJournal
+
+class FakeSite():
+    """Pages of posts with one src each, page_size posts per page until pages run out."""
+
+    def __init__(self,pages: int,page_size: int = 3):
+        self.pages = [[page * page_size + post for post in range(page_size)] for page in range(pages)]
+        self.downloaded = []
+
+    def extract_posts(self):
+        return self.pages.pop(0) if self.pages else []
+
+    def extract_srcs(self,post_id):
+        return [(f"http://h/{post_id}.jpg", post_id)]
+
+    def download_image(self,idx,image_src,post_id):
+        self.downloaded.append((idx, post_id))
+        return f"/out/{idx}.jpg"
+
+def _pipeline(site,max_images_posts: int = 100,**kwargs):
+    return ScrapePipeline(site.extract_posts, site.extract_srcs, site.download_image, max_images_posts, 2, 2, **kwargs)
+
+def test_runs_every_stage_until_the_tag_runs_out():
+    site = FakeSite(pages=3)
+    stats = _pipeline(site).run()
+    assert stats == {'pages': 3, 'posts': 9, 'srcs': 9, 'downloaded': 9, 'failed': 0, 'caught_up': True}
+    assert sorted(idx for idx, _ in site.downloaded) == list(range(9))
+
+def test_stops_at_max_images_posts_and_max_pages():
+    assert _pipeline(FakeSite(pages=5), max_images_posts=4).run()['posts'] == 4
+    stats = _pipeline(FakeSite(pages=5), max_pages=2).run()
+    assert stats['pages'] == 2 and not stats['caught_up']
+
+def test_failed_page_stops_the_listing_without_catching_up():
+    site = FakeSite(pages=3)
+    site.extract_posts = lambda: None
+    stats = _pipeline(site).run()
+    assert stats['pages'] == 0 and not stats['caught_up']
+
+def test_failing_stages_do_not_hang_the_shutdown():
+    site = FakeSite(pages=2)
+    def extract_srcs(post_id):
+        if post_id == 0:
+            raise RuntimeError("parse error")
+        return None if post_id == 1 else [(f"http://h/{post_id}.jpg", post_id)]
+    def download_image(idx,image_src,post_id):
+        if post_id == 2:
+            raise IOError("reset")
+        return None if post_id == 3 else f"/out/{idx}.jpg"
+    site.extract_srcs = extract_srcs
+    site.download_image = download_image
+    stats = _pipeline(site).run()
+    assert stats['srcs'] == 4
+    assert stats['downloaded'] == 2 and stats['failed'] == 2
+
+def test_futures_are_waited_for():
+    site = FakeSite(pages=1)
+    def download_image(idx,image_src,post_id):
+        # Completes after the download workers already stopped, like the async backend
+        future = Future()
+        threading.Timer(0.05, future.set_result, args=(f"/out/{idx}.jpg",)).start()
+        return future
+    site.download_image = download_image
+    assert _pipeline(site).run()['downloaded'] == 3
+
+def test_incremental_listing_stops_at_known_posts():
+    site = FakeSite(pages=3)
+    stats = _pipeline(site, is_known=lambda post_id: post_id >= 4).run()
+    assert stats['posts'] == 4
+    assert stats['caught_up']
+
+def test_resume_skips_what_the_journal_has(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / "journal.jsonl"))
+    journal.record_page(2, [0, 1, 2])
+    journal.record_srcs(0, [(0, "http://h/0.jpg", 0)])
+    journal.record_srcs(1, [(1, "http://h/1.jpg", 1)])
+    journal.record_done(0, "http://h/0.jpg", 0, "/out/0.jpg")
+    site = FakeSite(pages=0)
+    stats = _pipeline(site, journal=journal).run()
+    journal.close()
+    # src 1 was resolved but not downloaded, post 2 was listed but not resolved
+    assert sorted(site.downloaded) == [(1, 1), (2, 2)]
+    assert stats['downloaded'] == 2
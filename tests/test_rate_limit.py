@@ -0,0 +1,98 @@
+import threading
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from lib_rate_limit import HostLimiter, parse_retry_after, _finish_on_release, INITIAL_RATE, INITIAL_CONCURRENCY, SLOW_START_STEP, RATE_STEP, MIN_RATE
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= parse_retry_after(in_a_minute) <= 60
+
+def test_slow_start_grows_on_every_healthy_response():
+    limiter = HostLimiter("h")
+    for _ in range(4):
+        limiter.release(200, 0.05)
+    assert limiter.rate == INITIAL_RATE + 4 * SLOW_START_STEP
+    assert limiter.concurrency == INITIAL_CONCURRENCY + 4 * SLOW_START_STEP
+
+def test_backs_off_once_per_window():
+    limiter = HostLimiter("h")
+    limiter.release(429, 0.0)
+    assert limiter.rate == INITIAL_RATE / 2
+    assert limiter.concurrency == INITIAL_CONCURRENCY / 2
+    assert not limiter.slow_start
+    # Sent before the cut, the same overload
+    limiter.release(429, 5.0)
+    assert limiter.backoffs == 1
+    # Sent after the cut, the smaller rate is still too much
+    limiter.release(503, 0.0)
+    assert limiter.backoffs == 2
+    assert limiter.rate == INITIAL_RATE / 4
+
+def test_additive_increase_after_the_first_back_off():
+    limiter = HostLimiter("h")
+    limiter.release(429, 0.0)
+    rate = limiter.rate
+    limiter.release(200, 0.05)
+    assert limiter.rate == rate + RATE_STEP / rate
+
+def test_rate_never_drops_below_the_minimum():
+    limiter = HostLimiter("h")
+    for _ in range(20):
+        limiter.release(429, 0.0)
+    assert limiter.rate == MIN_RATE
+    assert limiter.concurrency == 1.0
+
+def test_retry_after_blocks_the_host():
+    limiter = HostLimiter("h")
+    limiter.release(200, 0.05, retry_after="30")
+    assert limiter.blocked_until > 0
+    assert limiter.backoffs == 1
+
+def test_rising_error_rate_backs_off():
+    limiter = HostLimiter("h")
+    limiter.release(None, 0.1)
+    limiter.release(500, 0.1)
+    assert limiter.backoffs == 1
+    assert limiter.error_rate == 0.0
+
+def test_slot_is_held_until_finish():
+    limiter = HostLimiter("h", rate=1000.0, concurrency=2)
+    limiter.acquire()
+    limiter.acquire()
+    limiter.report(200, 0.01)
+    assert limiter.in_flight == 2
+    third = threading.Thread(target=limiter.acquire)
+    third.start()
+    third.join(0.1)
+    assert third.is_alive()     # the window is full until a body is read
+    limiter.finish()
+    third.join(1.0)
+    assert not third.is_alive()
+    assert limiter.in_flight == 2
+
+class FakeRaw():
+    def __init__(self):
+        self.released = 0
+
+    def release_conn(self):
+        self.released += 1
+
+class FakeResponse():
+    def __init__(self):
+        self.raw = FakeRaw()
+
+def test_finish_runs_once_on_connection_release():
+    limiter = HostLimiter("h")
+    limiter.acquire()
+    response = FakeResponse()
+    assert _finish_on_release(response, limiter)
+    assert limiter.in_flight == 1
+    response.raw.release_conn()
+    response.raw.release_conn()     # close() after a full read releases again
+    assert limiter.in_flight == 0
+
+def test_finish_on_release_needs_a_raw_response():
+    assert not _finish_on_release(None, HostLimiter("h"))
@@ -0,0 +1,79 @@
+import pytest
+from lib_work_queue import MemoryLeaseQueue, SQLiteLeaseQueue, QueueWorker
+
+JOB = "zerochan:miku"
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def queue(request,tmp_path):
+    if request.param == 'memory':
+        return MemoryLeaseQueue(max_attempts=3)
+    return SQLiteLeaseQueue(str(tmp_path / "queue.sqlite"), max_attempts=3)
+
+def test_put_queues_a_key_once(queue):
+    assert queue.put(JOB, 'page', 1, 1) is not None
+    assert queue.put(JOB, 'page', 1, 1) is None
+    assert queue.counts(JOB)['pending'] == 1
+
+def test_leased_item_is_not_handed_out_twice(queue):
+    queue.put(JOB, 'page', 1, 1)
+    item = queue.lease(JOB, 'page', "a")
+    assert item['payload'] == 1 and item['attempts'] == 1
+    assert queue.lease(JOB, 'page', "b") is None
+    queue.complete(item)
+    assert queue.counts(JOB) == {'pending': 0, 'leased': 0, 'done': 1, 'dead': 0}
+
+def test_expired_lease_is_issued_again(queue):
+    queue.put(JOB, 'post', 7, 7)
+    queue.lease(JOB, 'post', "a", lease_seconds=-1)     # the worker died holding it
+    assert queue.counts(JOB)['pending'] == 1
+    item = queue.lease(JOB, 'post', "b")
+    assert item['key'] == "7"
+    assert item['attempts'] == 2
+
+def test_failed_item_is_dead_after_max_attempts(queue):
+    queue.put(JOB, 'src', "http://h/a.jpg", ["http://h/a.jpg", 7])
+    for attempt in range(1, 4):
+        item = queue.lease(JOB, 'src', "a")
+        assert item['attempts'] == attempt
+        queue.fail(item)
+    assert queue.lease(JOB, 'src', "a") is None
+    assert queue.counts(JOB) == {'pending': 0, 'leased': 0, 'done': 0, 'dead': 1}
+
+def test_expired_lease_on_the_last_attempt_is_dead(queue):
+    queue.put(JOB, 'page', 1, 1)
+    for _ in range(3):
+        queue.lease(JOB, 'page', "a", lease_seconds=-1)
+    assert queue.counts(JOB)['dead'] == 1
+    assert queue.lease(JOB, 'page', "a") is None
+
+class FlakyScraper():
+    """Lists page 1 and resolves every post only on their second attempt."""
+
+    def __init__(self):
+        self.tag = "miku"
+        self.page_idx = 1
+        self.session = None
+        self.calls = {}
+        self.downloaded = []
+
+    def _flaky(self,key):
+        self.calls[key] = self.calls.get(key, 0) + 1
+        return self.calls[key] == 1
+
+    def extract_posts(self):
+        return None if self._flaky(('page', self.page_idx)) else [10, 11]
+
+    def extract_srcs(self,post_id):
+        return None if self._flaky(('post', post_id)) else [(f"http://h/{post_id}.jpg", post_id)]
+
+    def download_image(self,session,idx,image_src,post_id):
+        self.downloaded.append(post_id)
+        return f"/tmp/{idx}.jpg"
+
+def test_worker_retries_failed_pages_and_posts(queue):
+    scraper = FlakyScraper()
+    queue.put(JOB, 'page', 1, 1)
+    stats = QueueWorker(queue, scraper, 'zerochan', threads=1).run()
+    assert sorted(scraper.downloaded) == [10, 11]
+    assert stats == {'page': 1, 'post': 2, 'src': 2, 'failed': 3}
+    assert queue.counts(JOB) == {'pending': 0, 'leased': 0, 'done': 5, 'dead': 0}
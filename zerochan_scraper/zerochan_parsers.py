@@ -0,0 +1,150 @@
+import re
+import json
+import html as HTML
+import importlib.util
+
+# The optional backends are imported on their first use, regex answers most pages without them
+HTMLParser = None
+lxml = None
+BeautifulSoup = None
+
+PARSER_BACKENDS = ('auto', 'regex', 'selectolax', 'lxml', 'bs4')
+AUTO_ORDER = ('regex', 'selectolax', 'lxml', 'bs4')
+
+THUMBS_START = re.compile(r'<ul\b[^>]*\bclass="[^"]*\bmedium-thumbs\b[^"]*"[^>]*>', re.I)
+THUMBS_END = re.compile(r'</ul\s*>', re.I)
+NESTED_LIST = re.compile(r'<ul\b', re.I)
+LI_DATA_ID = re.compile(r'<li\b[^>]*\bdata-id="(\d+)"', re.I)
+LD_JSON = re.compile(r'<script\b[^>]*\btype="application/ld\+json"[^>]*>(.*?)</script\s*>', re.I | re.S)
+TAGS_LIST = re.compile(r'<ul\b[^>]*\bid="tags"[^>]*>(.*?)</ul\s*>', re.I | re.S)
+TAG_ITEM = re.compile(r'<li\b[^>]*\bclass="([^"]*)"[^>]*>\s*<a\b[^>]*>([^<]+)</a>', re.I)
+THUMBS_XPATH = "(//ul[contains(concat(' ', normalize-space(@class), ' '), ' medium-thumbs ')])[1]//li/@data-id"
+
+# Every parser returns None when it cannot tell, so 'auto' moves on to the next backend
+
+def _posts_regex(html: str):
+    # Only the thumbnails list is scanned, and only when no other list is nested in it
+    start = THUMBS_START.search(html)
+    if not start:
+        return None
+    end = THUMBS_END.search(html, start.end())
+    if not end:
+        return None
+    fragment = html[start.end():end.start()]
+    if NESTED_LIST.search(fragment):
+        return None
+    return LI_DATA_ID.findall(fragment)
+
+def _posts_selectolax(html: str):
+    posts_section = HTMLParser(html).css_first('ul.medium-thumbs')
+    if posts_section is None:
+        return None
+    return [li.attributes['data-id'] for li in posts_section.css('li') if li.attributes.get('data-id')]
+
+def _posts_lxml(html: str):
+    tree = lxml.html.fromstring(html)
+    if not tree.xpath("//ul[contains(concat(' ', normalize-space(@class), ' '), ' medium-thumbs ')]"):
+        return None
+    return [str(post_id) for post_id in tree.xpath(THUMBS_XPATH) if post_id]
+
+def _posts_bs4(html: str):
+    posts_section = BeautifulSoup(html, 'html.parser').find('ul', class_='medium-thumbs')
+    if not posts_section:
+        return None
+    return [post.get('data-id') for post in posts_section.find_all('li') if post.get('data-id')]
+
+def _content_url(script: str):
+    try:
+        return json.loads(script).get("contentUrl")
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def _src_regex(html: str):
+    script = LD_JSON.search(html)
+    return _content_url(script.group(1)) if script else None
+
+def _src_selectolax(html: str):
+    script = HTMLParser(html).css_first('script[type="application/ld+json"]')
+    return _content_url(script.text()) if script is not None else None
+
+def _src_lxml(html: str):
+    scripts = lxml.html.fromstring(html).xpath('//script[@type="application/ld+json"]/text()')
+    return _content_url(scripts[0]) if scripts else None
+
+def _src_bs4(html: str):
+    script_tag = BeautifulSoup(html, 'html.parser').find("script", type="application/ld+json")
+    return _content_url(script_tag.string) if script_tag else None
+
+_AVAILABLE = {
+    'regex': True,
+    'selectolax': importlib.util.find_spec('selectolax') is not None,
+    'lxml': importlib.util.find_spec('lxml') is not None,
+    'bs4': importlib.util.find_spec('bs4') is not None,
+}
+_POSTS_PARSERS = {'regex': _posts_regex, 'selectolax': _posts_selectolax, 'lxml': _posts_lxml, 'bs4': _posts_bs4}
+_SRC_PARSERS = {'regex': _src_regex, 'selectolax': _src_selectolax, 'lxml': _src_lxml, 'bs4': _src_bs4}
+
+def available_backends():
+    return [backend for backend in AUTO_ORDER if _AVAILABLE[backend]]
+
+def _load(backend: str):
+    global HTMLParser, lxml, BeautifulSoup
+    if backend == 'selectolax' and HTMLParser is None:
+        from selectolax.parser import HTMLParser
+    elif backend == 'lxml' and lxml is None:
+        import lxml.html
+    elif backend == 'bs4' and BeautifulSoup is None:
+        from bs4 import BeautifulSoup
+
+def _parse(parsers: dict,html: str,backend: str):
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend {backend}, expected one of {PARSER_BACKENDS}")
+    if backend != 'auto':
+        if not _AVAILABLE[backend]:
+            raise ImportError(f"The {backend} parser backend is not installed")
+        _load(backend)
+        return parsers[backend](html)
+    for name in available_backends():
+        _load(name)
+        result = parsers[name](html)
+        if result is not None:
+            return result
+    return None
+
+def parse_posts_ids(html: str,backend: str = 'auto'):
+    """data-id of every thumbnail of a search page, None when the page has no thumbnails list."""
+    return _parse(_POSTS_PARSERS, html, backend)
+
+def parse_image_src(html: str,backend: str = 'auto'):
+    """contentUrl of the ld+json script of a post page, None when it is missing."""
+    return _parse(_SRC_PARSERS, html, backend)
+
+def parse_post_metadata(html: str):
+    """Dimensions, uploader and date from the ld+json script of a post page, with its typed tags list.
+
+    Only the bounded regex way, both parts sit in small well delimited blocks of the page.
+    """
+    metadata = {}
+    script = LD_JSON.search(html)
+    try:
+        image = json.loads(script.group(1)) if script else {}
+    except ValueError:
+        image = {}
+    if isinstance(image, dict):
+        author = image.get('author')
+        metadata = {
+            'title': image.get('name'),
+            'width': int(image['width']) if str(image.get('width', '')).isdigit() else None,
+            'height': int(image['height']) if str(image.get('height', '')).isdigit() else None,
+            'uploader': author.get('name') if isinstance(author, dict) else author,
+            'created': image.get('datePublished'),
+            'format': image.get('encodingFormat'),
+        }
+    tags_list = TAGS_LIST.search(html)
+    tags = [(HTML.unescape(name.strip()), kind.strip()) for kind, name in TAG_ITEM.findall(tags_list.group(1))] if tags_list else []
+    metadata['tags'] = [name for name, _ in tags]
+    # Zerochan types every tag, the mangaka ones name the artist of the work
+    metadata['artists'] = [name for name, kind in tags if kind == 'mangaka']
+    metadata['characters'] = [name for name, kind in tags if kind == 'character']
+    metadata['series'] = [name for name, kind in tags if kind in ('series', 'game', 'visual novel')]
+    return metadata